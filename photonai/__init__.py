@@ -4,7 +4,7 @@ To implement a bot, see `photonai.bot.SimpleBot` and `photonai.world`.
 
 
 import click
-from photonai import run, server, tourney
+from photonai import run, server, tourney, bench
 
 
 @click.group()
@@ -17,3 +17,4 @@ def cli():
 cli.add_command(run.cli)
 cli.add_command(tourney.cli)
 cli.add_command(server.cli)
+cli.add_command(bench.cli)
@@ -0,0 +1,326 @@
+'''Reproducible benchmarks of the game engine, with in-process bots.
+'''
+
+import click
+import collections
+import contextlib
+import functools
+import importlib
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+import photonai.bot
+import photonai.config
+import photonai.maps
+from . import game, run, timing
+from .maps import common
+
+
+class Arena(common.Map):
+    '''A map which scales to any number of ships & planets, placed at random
+    (the space grows with the number of objects).
+
+    pellet_time_to_live -- of each ship's weapon (longer-lived pellets mean
+    more pellets in the space)
+    '''
+    def __init__(self, seed, nplanets, pellet_time_to_live=1.0, size=1.0):
+        super().__init__(seed)
+        self._nplanets = nplanets
+        self._pellet_time_to_live = pellet_time_to_live
+        self._size = size
+
+    @property
+    def space(self):
+        return dict(dimensions=dict(x=150 * self._size, y=100 * self._size),
+                    gravity=0.1)
+
+    def _position(self):
+        return self._random.rand(2) * np.array([150.0, 100.0]) * self._size
+
+    @property
+    def planets(self):
+        random = np.random.RandomState(self._random.randint(2 ** 32))
+        return [self._create_planet(
+            name='p%d' % n,
+            radius=3 + 5 * random.rand(),
+            mass=10 + 40 * random.rand(),
+            position=random.rand(2) * np.array([150.0, 100.0]) * self._size,
+            velocity=np.zeros(2))
+            for n in range(self._nplanets)]
+
+    def _create_weapon(self):
+        weapon = super()._create_weapon()
+        weapon['time_to_live'] = self._pellet_time_to_live
+        return weapon
+
+    def ship(self, controller):
+        return self._create_ship(
+            controller=controller,
+            position=self._position(),
+            velocity=np.zeros(2),
+            orientation=2 * np.pi * self._random.rand())
+
+
+# Names of bot modules in `photonai.tests.bots`
+BOTS = ('nothing', 'spiral')
+
+
+def _bot_module(name):
+    # (imported on demand, so that `import photonai` doesn't load the tests)
+    return importlib.import_module('photonai.tests.bots.' + name)
+
+
+# Each scenario uses a named map from `photonai.maps`, or an `Arena`
+SCENARIOS = collections.OrderedDict([
+    ('endtime', dict(map='endtime', nships=7)),
+    ('orbital', dict(map='orbital', nships=4)),
+    ('ships-2', dict(nships=2, nplanets=4)),
+    ('ships-8', dict(nships=8, nplanets=4)),
+    ('ships-32', dict(nships=32, nplanets=4)),
+    ('planets-32', dict(nships=4, nplanets=32)),
+    ('pellets', dict(nships=8, nplanets=4, pellet_time_to_live=5.0)),
+    ('idle-32', dict(nships=32, nplanets=4, bot='nothing')),
+])
+
+
+def _map(spec, seed):
+    if 'map' in spec:
+        return getattr(photonai.maps, spec['map']).Map(seed)
+    nobjects = spec['nships'] + spec['nplanets']
+    return Arena(seed, spec['nplanets'],
+                 pellet_time_to_live=spec.get('pellet_time_to_live', 1.0),
+                 size=np.sqrt(max(1.0, nobjects / 8)))
+
+
+def _run(spec, nsteps, step_duration, simulator, control_interval):
+    '''Run a scenario for a number of steps.
+
+    returns -- `(latency, metrics)`, a list of the duration of each step,
+    and `photonai.timing.Metrics`
+    '''
+    bot = _bot_module(spec.get('bot', 'spiral')).Bot
+    controller_bots = [(dict(name='bot%d' % n, version=0), bot())
+                       for n in range(spec['nships'])]
+    metrics = timing.Metrics()
+    steps = game.run_game(_map(spec, seed=100), controller_bots,
+                          stop=game.stop_after(float('inf')),
+                          step_duration=step_duration,
+                          simulator=simulator,
+                          control_interval=control_interval,
+                          metrics=metrics)
+    latency = []
+    # (bots may print, which should not be mixed with the output)
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for _ in range(nsteps):
+            start = time.perf_counter()
+            next(steps)
+            latency.append(time.perf_counter() - start)
+    steps.close()
+    return latency, metrics
+
+
+def _summary(latency):
+    '''Summarize the durations of a list of steps, in milliseconds.
+    '''
+    latency = 1000 * np.array(latency)
+    p50, p90, p99 = np.percentile(latency, [50, 90, 99])
+    return dict(mean=latency.mean(), p50=p50, p90=p90, p99=p99,
+                max=latency.max())
+
+
+def run_scenario(name, nsteps, step_duration=0.01, engine='vectorized',
+                 headless=False, control_interval=1, trace_memory=False):
+    '''Run a single benchmark scenario.
+
+    name -- key of `SCENARIOS`
+
+    engine -- name of the simulator (see `photonai.run.ENGINES`)
+
+    trace_memory -- run the scenario a second time, tracing the peak memory
+    allocated (which is too slow to combine with timing)
+
+    returns -- a JSON-able dict of results
+    '''
+    spec = SCENARIOS[name]
+    simulator = functools.partial(run.ENGINES[engine], headless=headless)
+    latency, metrics = _run(spec, nsteps, step_duration, simulator,
+                            control_interval)
+    latency = np.array(latency)
+
+    peak_traced_mb = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            _run(spec, nsteps, step_duration, simulator, control_interval)
+            peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+
+    return dict(
+        name=name,
+        map=spec.get('map', 'arena'),
+        bot=spec.get('bot', 'spiral'),
+        nships=spec['nships'],
+        nplanets=spec.get('nplanets'),
+        nsteps=nsteps,
+        seconds=latency.sum(),
+        steps_per_sec=nsteps / latency.sum(),
+        latency_ms=_summary(latency),
+        phases_s={phase: sum(samples)
+                  for phase, samples in metrics.times.items()},
+        counters={counter: float(np.mean(samples))
+                  for counter, samples in metrics.counts.items()},
+        # (process-wide high-water mark, so includes previous scenarios)
+        max_rss_mb=resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+        peak_traced_mb=peak_traced_mb)
+
+
+class _Recorder:
+    '''A bot which records its requests.
+    '''
+    def __init__(self, bot):
+        self.bot = bot
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        return self.bot(request)
+
+
+def _requests(spec, nsteps):
+    '''Record the requests to the first bot, when playing a scenario.
+    '''
+    spiral = _bot_module('spiral')
+    recorder = _Recorder(spiral.Bot())
+    controller_bots = [(dict(name='bot%d' % n, version=0),
+                        recorder if n == 0 else spiral.Bot())
+                       for n in range(spec['nships'])]
+    steps = game.run_game(_map(spec, seed=100), controller_bots,
+                          stop=game.stop_after(float('inf')),
+                          step_duration=0.01,
+                          # (headless, so states can be sent through shared
+                          # memory)
+                          simulator=functools.partial(
+                              run.ENGINES['vectorized'], headless=True))
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for _ in range(nsteps):
+            next(steps)
+    steps.close()
+    return recorder.requests
+
+
+def run_bot_latency(name, nsteps, protocol):
+    '''Measure the round-trip time of requests to a bot subprocess (which
+    does very little work), replaying the requests of a scenario.
+
+    name -- key of `SCENARIOS`
+
+    protocol -- see `photonai.bot.PROTOCOLS`
+
+    returns -- a JSON-able dict of results
+    '''
+    requests = _requests(SCENARIOS[name], nsteps)
+    command = ['env', 'PYTHONPATH=%s' % run._project_path,
+               sys.executable, _bot_module('spiral').__file__]
+    with open(os.devnull, 'w') as devnull, (
+            photonai.bot.SharedMemoryBot(command, stderr=devnull,
+                                         timeout=None)
+            if protocol == photonai.bot.SHARED_MEMORY else
+            photonai.bot.SubprocessBot(command, stderr=devnull, timeout=None,
+                                       protocols=[protocol])) as bot:
+        latency = []
+        for request in requests:
+            start = time.perf_counter()
+            bot(request)
+            latency.append(time.perf_counter() - start)
+    return dict(scenario=name, protocol=protocol, nsteps=len(requests),
+                latency_ms=_summary(latency))
+
+
+DEFAULT_CONFIG = dict(
+    scenarios=list(SCENARIOS),
+    steps=500,
+    step_duration=0.01,
+    control_interval=1,
+    engine='vectorized',
+    headless=False,
+    trace_memory=False,
+    bot_latency=False,
+    out=None,
+)
+
+
+@click.command('bench')
+@click.option('-c', '--config', type=click.Path(exists=True, dir_okay=False),
+              help='configuration file specifying any of these options')
+@click.option('-s', '--scenarios', multiple=True,
+              type=click.Choice(list(SCENARIOS)),
+              help='names of scenarios to run (default: all)')
+@click.option('-n', '--steps', type=click.INT,
+              help='number of steps to run each scenario')
+@click.option('-t', '--step-duration', type=click.FLOAT,
+              help='simulation timestep')
+@click.option('-k', '--control-interval', type=click.INT,
+              help='number of simulation steps per bot update')
+@click.option('-e', '--engine', type=click.Choice(sorted(run.ENGINES)),
+              help='simulation engine implementation')
+@click.option('--headless', is_flag=True, default=None,
+              help='only create log events when needed')
+@click.option('--trace-memory', is_flag=True, default=None,
+              help='also measure peak allocated memory (slow)')
+@click.option('--bot-latency', is_flag=True, default=None,
+              help='also measure bot round-trip time, for each protocol')
+@click.option('-o', '--out', type=click.Path(writable=True),
+              help='path to save JSON results (default: stdout)')
+def cli(config, **args):
+    '''Benchmark the game engine on reproducible scenarios, and print the
+    results as JSON.
+    '''
+    config = photonai.config.load(DEFAULT_CONFIG, config, args)
+    if len(config['scenarios']) == 0:
+        config['scenarios'] = DEFAULT_CONFIG['scenarios']
+
+    results = []
+    for name in config['scenarios']:
+        result = run_scenario(
+            name, config['steps'],
+            **photonai.config.select(config, 'step_duration', 'engine',
+                                     'headless', 'control_interval',
+                                     'trace_memory'))
+        sys.stderr.write('%-12s %8.1f steps/s  p99 %.2f ms\n' % (
+            name, result['steps_per_sec'], result['latency_ms']['p99']))
+        results.append(result)
+
+    bot_latency = []
+    if config['bot_latency']:
+        for protocol in photonai.bot.PROTOCOLS:
+            result = run_bot_latency('pellets', config['steps'], protocol)
+            sys.stderr.write('protocol %d %8.3f ms/request\n' % (
+                protocol, result['latency_ms']['p50']))
+            bot_latency.append(result)
+
+    output = json.dumps(dict(
+        python=platform.python_version(),
+        numpy=np.__version__,
+        config=photonai.config.select(config, 'steps', 'step_duration',
+                                      'control_interval', 'engine',
+                                      'headless'),
+        scenarios=results,
+        bot_latency=bot_latency), indent=2)
+    if config['out'] is None:
+        click.echo(output)
+    else:
+        with open(config['out'], 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    cli()
@@ -2,16 +2,220 @@
 '''
 
 import fastavro
+import importlib.util
+import io
+import os
+import struct
 import sys
 import subprocess
+import selectors
 import random
+import time
+import collections
+import contextlib
+import logging
 import concurrent.futures
-from . import schema, world
+from . import schema, world, records, shm
 
 
-def _safe_flush(writer):
-    writer.flush()
-    writer.block_count = 0  # due to a bug in fastavro (PR #64)
+# Protocols for talking to a bot process, negotiated via the Avro header
+# metadata - the harness offers a list of protocols, and the bot replies with
+# its choice (old bots & harnesses don't, so fall back to AVRO_CONTAINER)
+PROTOCOL_KEY = 'photonai.protocol'
+
+# Each message is a block in an Avro container file
+AVRO_CONTAINER = 1
+
+# After the container headers, each message is a length-prefixed schemaless
+# Avro record (without block headers, sync markers or flush workarounds)
+FRAMED = 2
+
+# As FRAMED, but the object states of each step are published in shared
+# memory (see `photonai.shm` & `SharedMemoryBot`), and each message through
+# the pipe is a "doorbell" - the number of states, then the other events
+# (only steps from a headless engine are published, others are sent whole)
+SHARED_MEMORY = 3
+
+# Header metadata, the path of the shared memory region
+SHM_KEY = 'photonai.shm'
+
+PROTOCOLS = (AVRO_CONTAINER, FRAMED, SHARED_MEMORY)
+
+# Each frame starts with (size, sequence number) - a response has the
+# sequence number of its request, so that late responses can be recognized
+_FRAME = struct.Struct('<II')
+_DOORBELL = struct.Struct('<i')
+
+
+def _protocols(metadata):
+    '''Get the protocols from an Avro header.
+    '''
+    return [int(p) for p in
+            metadata.get(PROTOCOL_KEY, str(AVRO_CONTAINER)).split(',')]
+
+
+def _write_request(fo, request):
+    '''Write a `Bot.REQUEST` (c.f. `fastavro.writer.write_data`, but encoding
+    the step's records directly - see `photonai.records.write_step`).
+    '''
+    records.write_step(fo, request['step'])
+    ship_id = request['ship_id']
+    if ship_id is None:
+        records.write_long(fo, 1)  # null branch
+    else:
+        records.write_long(fo, 0)
+        records.write_long(fo, ship_id)
+
+
+def _read_request(fo):
+    '''Read a `Bot.REQUEST` (c.f. `fastavro._reader.read_data`, but decoding
+    the step's events as records - see `photonai.records.read_step`).
+    '''
+    step = records.read_step(fo)
+    ship_id = None
+    if records.read_long(fo) == 0:
+        ship_id = records.read_long(fo)
+    return dict(step=step, ship_id=ship_id)
+
+
+def _write_doorbell(fo, doorbell):
+    '''Write a `SHARED_MEMORY` message.
+
+    doorbell -- `(nstates, request)`, where `nstates` is None if all events
+    are in the request
+    '''
+    nstates, request = doorbell
+    fo.write(_DOORBELL.pack(-1 if nstates is None else nstates))
+    _write_request(fo, request)
+
+
+def _doorbell_reader(read):
+    '''Create a function to read messages written by `_write_doorbell`.
+
+    read -- function `read(fo)`, to decode each request
+    '''
+    def read_doorbell(fo):
+        nstates, = _DOORBELL.unpack(fo.read(_DOORBELL.size))
+        return (None if nstates < 0 else nstates), read(fo)
+    return read_doorbell
+
+
+def _shared_memory_requests(doorbells, region):
+    '''Generate requests from `SHARED_MEMORY` messages, reading the states
+    from the (alternate) buffers of a `photonai.shm.Region`.
+
+    doorbells -- iterable of `(seq, (nstates, request))`
+
+    returns -- iterable of `(seq, request)`
+    '''
+    for seq, (nstates, request) in doorbells:
+        if nstates is not None:
+            step = request['step']
+            step['data'] = region.read(seq % 2, nstates, step['data'])
+        yield seq, request
+
+
+def _write_response(fo, response):
+    records.write_data(fo, response, Bot.RESPONSE)
+
+
+def _reader(writer_schema, schema, read):
+    '''Choose a function to read messages written with `writer_schema`.
+
+    read -- function `read(fo)`, for messages in `schema`
+    '''
+    if writer_schema == schema:
+        return read
+    return lambda fo: records.read_data(fo, writer_schema)
+
+
+class _ContainerWriter:
+    '''Writes each message as a block of an Avro container (`AVRO_CONTAINER`).
+    '''
+    def __init__(self, writer, encode):
+        self._writer = writer
+        self._encode = encode
+
+    def write(self, datum, seq=None):
+        # (no sequence numbers - messages must stay in step)
+        self._writer.append(self._encode, datum)
+        self._writer.flush()
+
+
+class _FramedWriter:
+    '''Writes length-prefixed messages (`FRAMED`), reusing a single buffer.
+    '''
+    def __init__(self, fo, encode):
+        self._fo = fo
+        self._encode = encode
+        self._buffer = io.BytesIO()
+
+    def _frame(self, datum, seq):
+        buffer = self._buffer
+        buffer.seek(_FRAME.size)
+        buffer.truncate()
+        self._encode(buffer, datum)
+        view = buffer.getbuffer()
+        _FRAME.pack_into(view, 0, len(view) - _FRAME.size, seq)
+        return view
+
+    def encode(self, datum, seq):
+        '''Encode a message, without writing it.
+
+        returns -- bytes of the frame
+        '''
+        with self._frame(datum, seq) as view:
+            return bytes(view)
+
+    def write(self, datum, seq):
+        with self._frame(datum, seq) as view:
+            self._fo.write(view)
+        self._fo.flush()
+
+
+class _FramedReader:
+    '''Reads length-prefixed messages (`FRAMED`), as `(seq, message)`.
+
+    read -- function `read(fo)`, to decode each message
+    '''
+    def __init__(self, fo, read):
+        self._fo = fo
+        self._read = read
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        header = self._fo.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            raise StopIteration
+        size, seq = _FRAME.unpack(header)
+        return seq, self._read(io.BytesIO(self._fo.read(size)))
+
+
+def _next_frame(buffer):
+    '''Remove a complete frame from the start of a buffer of received data.
+
+    buffer -- `bytearray`
+
+    returns -- `(seq, payload)`, or None if the frame is incomplete
+    '''
+    if len(buffer) < _FRAME.size:
+        return None
+    size, seq = _FRAME.unpack_from(buffer)
+    end = _FRAME.size + size
+    if len(buffer) < end:
+        return None
+    payload = bytes(buffer[_FRAME.size:end])
+    del buffer[:end]
+    return seq, payload
+
+
+class LateResponse(concurrent.futures.TimeoutError):
+    '''A bot did not respond in time, but may still respond in time to its
+    next request (see `SubprocessBot`), so should not be disqualified.
+    '''
+    pass
 
 
 class Bot:
@@ -30,6 +234,17 @@ class Bot:
 
     RESPONSE = [schema.Controller.STATE, 'null']
 
+    # An empty space, which starts a new game (see `new_game`)
+    NEW_GAME = dict(
+        step=dict(clock=0, duration=0.0,
+                  data=dict(dimensions=dict(x=0.0, y=0.0), gravity=0.0)),
+        ship_id=None)
+
+    # Maximum time to wait for a response in seconds (or None, if the bot
+    # runs synchronously - asynchronous bots also define `submit`, see
+    # `SubprocessBot`)
+    timeout = None
+
     def __call__(self, request):
         '''Run the bot for a single game step, and get the control output
         to control the Ship object ship_id.
@@ -54,17 +269,63 @@ class Bot:
         '''
         pass
 
+    def new_game(self):
+        '''Prepare a bot that has already played for a new game (see
+        `BotPool`) - a handshake, which raises an error if the bot does not
+        respond correctly.
+
+        N.B. every game starts with a `photonai.schema.Space.CREATE` step, so
+        this is just an ordinary request, which all bots understand.
+        '''
+        response = self(Bot.NEW_GAME)
+        if response is not None:
+            raise ValueError('Unexpected response to new game %r' % response)
+
+    def healthy(self):
+        '''Check whether the bot may be reused for another game (see
+        `BotPool`).
+        '''
+        return True
+
     def run_loop(self):
         '''Run a loop, listening for requests on STDIN, and writing control
         responses to STDOUT.
         '''
-        writer = fastavro._writer.Writer(sys.stdout.buffer, Bot.RESPONSE)
+        stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
         # Make sure no-one else writes to stdout - that would be bad!
         sys.stdout = sys.stderr
-        _safe_flush(writer)
-        for request in fastavro.reader(sys.stdin.buffer):
-            writer.write(self(request))
-            _safe_flush(writer)
+        requests = fastavro.reader(stdin)
+        protocols = set(_protocols(requests.metadata)) & set(PROTOCOLS)
+        region = None
+        if SHARED_MEMORY in protocols:
+            try:
+                region = shm.Region.open(requests.metadata[SHM_KEY])
+            except (KeyError, OSError):
+                # e.g. running in a container without a shared /dev/shm
+                protocols.discard(SHARED_MEMORY)
+        # (every bot supports AVRO_CONTAINER, e.g. if the harness only
+        # offered SHARED_MEMORY, which failed)
+        protocol = max(protocols | {AVRO_CONTAINER})
+        writer = records.ContainerWriter(
+            stdout, Bot.RESPONSE, metadata={PROTOCOL_KEY: str(protocol)})
+        writer.flush()
+        read = _reader(requests.writer_schema, Bot.REQUEST, _read_request)
+        if protocol == SHARED_MEMORY:
+            requests = _shared_memory_requests(
+                _FramedReader(stdin, _doorbell_reader(read)), region)
+            writer = _FramedWriter(stdout, _write_response)
+        elif protocol == FRAMED:
+            requests = _FramedReader(stdin, read)
+            writer = _FramedWriter(stdout, _write_response)
+        else:
+            requests = ((None, request) for request in requests)
+            writer = _ContainerWriter(writer, _write_response)
+        try:
+            for seq, request in requests:
+                writer.write(self(request), seq)
+        finally:
+            if region is not None:
+                region.close()
 
 
 class SimpleBot(Bot):
@@ -74,7 +335,8 @@ class SimpleBot(Bot):
     provides a simple way to respond with control signals `SimpleBot.Control`.
 
     Subclasses should implement `control = self.get_control(world, ship)`,
-    which is called at each timestep to control the ship.
+    which is called at each timestep to control the ship. To look ahead, see
+    `photonai.engine.predict`.
     '''
 
     class Control:
@@ -95,7 +357,17 @@ class SimpleBot(Bot):
     def __init__(self):
         self._world = world.World()
 
+    def reset(self):
+        '''Called at the start of each new game, when a bot process plays
+        multiple games (subclasses that keep any state between steps should
+        extend this, to clear it).
+        '''
+        self._world = world.World()
+
     def __call__(self, request):
+        if isinstance(request['step']['data'], dict):
+            # the space is only created at the start of a game
+            self.reset()
         self._world(request['step'])
         if request['ship_id'] is not None:
             ship = self._world.objects[request['ship_id']]
@@ -105,16 +377,20 @@ class SimpleBot(Bot):
         '''Get the control signal for 'ship' in the current state of 'world'.
         This is called for each game tick (as per `config["step_duration"]`).
 
-        If this method throws an error, or takes too long to return (longer
-        than `config["timeout"]`), the ship will "hold" the last control signal
-        returned until the end of the game (the controller will not be given a
-        chance to recover).
+        If this method takes too long to return (longer than
+        `config["timeout"]`), the ship will "hold" the last control signal
+        returned, and the late response is discarded - the bot is given
+        another chance at the next step (but a bot that falls several steps
+        behind is treated as stuck). If this method throws an error, the ship
+        holds its last control signal until the end of the game.
 
         `world` -- a `photonai.world.World` object containing all known state.
         Note that the state of some ships may be out-of-date if they
         are currently obscured by planets - this can be determined by testing
         if the `obj.update_clock` of an object in the world lags the
-        `world.clock`.
+        `world.clock`. Use `world.ships`, `world.planets` & `world.pellets`
+        to find objects of a single type, rather than scanning
+        `world.objects`.
 
         `ship` -- a `photonai.world.Ship` object for the ship being controlled.
 
@@ -125,36 +401,306 @@ class SimpleBot(Bot):
         raise NotImplementedError
 
 
+class _Response:
+    '''A pending response from a `SubprocessBot` with a framed protocol (c.f.
+    `concurrent.futures.Future`, but the response is read by `result`).
+    '''
+    def __init__(self, bot, seq):
+        self._bot = bot
+        self._seq = seq
+
+    def done(self):
+        return self._bot._failed or self._seq <= self._bot._received
+
+    def result(self, timeout=None):
+        return self._bot._result(self._seq, timeout)
+
+
 class SubprocessBot(Bot):
     '''A bot that forwards to an Avro stdin/stdout streaming subprocess.
+
+    With a framed protocol (`FRAMED` or `SHARED_MEMORY`), requests are
+    numbered & the pipes are non-blocking (there are no threads), so a late
+    response raises `LateResponse` & is discarded when it arrives, giving
+    the bot another chance with its next request. Otherwise, each request
+    runs on a thread, and a late response leaves the bot unhealthy.
+
+    protocols -- to offer the bot (see `PROTOCOLS`), which chooses one
+    (available as `protocol`)
+
+    metadata -- dict of additional Avro header metadata, to send the bot
+
+    max_backlog -- number of unanswered requests (with a framed protocol),
+    after which the bot is considered stuck
     '''
-    def __init__(self, command, stderr, timeout):
+    def __init__(self, command, stderr, timeout,
+                 protocols=(AVRO_CONTAINER, FRAMED), metadata={},
+                 max_backlog=3):
         self._process = subprocess.Popen(
             command,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=stderr)
-        self._request = fastavro._writer.Writer(
-            self._process.stdin, Bot.REQUEST)
-        _safe_flush(self._request)
-        self._response = fastavro.reader(self._process.stdout)
-        self._pool = concurrent.futures.ThreadPoolExecutor(1)
-        self._timeout = timeout
+        stdin, stdout = self._process.stdin, self._process.stdout
+        writer = records.ContainerWriter(
+            stdin, Bot.REQUEST,
+            metadata=dict(metadata, **{
+                schema.VERSION_KEY: str(schema.VERSION),
+                PROTOCOL_KEY: ','.join(str(p) for p in protocols)}))
+        writer.flush()
+        self._response = fastavro.reader(stdout)
+        self.protocol, = _protocols(self._response.metadata)
+        self.timeout = timeout
+        self.max_backlog = max_backlog
+        self._failed = False
+        self._pending = None
+        self._pool = None
+        if self.protocol in (FRAMED, SHARED_MEMORY):
+            self._request = _FramedWriter(
+                None, (_write_doorbell if self.protocol == SHARED_MEMORY
+                       else _write_request))
+            self._read_response = _reader(
+                self._response.writer_schema, Bot.RESPONSE,
+                lambda fo: records.read_data(fo, Bot.RESPONSE))
+            # (N.B. the bot writes nothing after its header until it gets a
+            # request, so nothing is left in stdout's buffer)
+            os.set_blocking(stdin.fileno(), False)
+            os.set_blocking(stdout.fileno(), False)
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(stdout, selectors.EVENT_READ)
+            self._in, self._out = bytearray(), bytearray()
+            self._seq = 0  # of the next request
+            self._received = -1  # of the last response
+            self._latest = None  # (seq, payload) of the last response
+        else:
+            self._request = _ContainerWriter(writer, _write_request)
+            self._pool = concurrent.futures.ThreadPoolExecutor(1)
 
     def close(self):
-        self._pool.shutdown()
+        # (N.B. end the process first, in case a request is still waiting
+        # for it)
         try:
             self._process.communicate(timeout=1)
         except subprocess.TimeoutExpired:
             self._process.kill()
+        if self._pool is None:
+            self._selector.close()
+        else:
+            self._pool.shutdown()
 
     def execute(self, request):
-        self._request.write(request)
-        _safe_flush(self._request)
-        return next(self._response)
+        try:
+            self._request.write(request)
+            return next(self._response)
+        except BaseException:
+            self._failed = True
+            raise
+
+    def healthy(self):
+        if self._failed or self._process.poll() is not None:
+            return False
+        if self._pool is not None:
+            # while a response is overdue, the response stream cannot be
+            # trusted
+            return self._pending is None or self._pending.done()
+        return self._backlog() < self.max_backlog
+
+    def _backlog(self):
+        return self._seq - 1 - self._received
+
+    def _message(self, request, seq):
+        '''Create the message to send for a request (see `SharedMemoryBot`).
+        '''
+        return request
+
+    def _write(self):
+        '''Write as much of the pending output as the pipe will take.
+        '''
+        stdin = self._process.stdin
+        try:
+            del self._out[:os.write(stdin.fileno(), self._out)]
+        except BlockingIOError:
+            pass
+        registered = stdin in self._selector.get_map()
+        if self._out and not registered:
+            self._selector.register(stdin, selectors.EVENT_WRITE)
+        elif registered and not self._out:
+            self._selector.unregister(stdin)
+
+    def _poll(self, timeout):
+        '''Wait up to `timeout` for the pipes, then write pending requests &
+        read responses (keeping only a response to the latest request).
+        '''
+        for key, _ in self._selector.select(timeout):
+            if key.fileobj is self._process.stdin:
+                self._write()
+            else:
+                data = os.read(key.fd, 1 << 16)
+                if not data:
+                    raise EOFError('Bot closed its output')
+                self._in += data
+        frame = _next_frame(self._in)
+        while frame is not None:
+            self._received = frame[0]
+            if self._received == self._seq - 1:
+                self._latest = frame
+            frame = _next_frame(self._in)
+
+    def _result(self, seq, timeout):
+        '''Wait for the response to request `seq` (see `_Response`).
+        '''
+        try:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self._received < seq:
+                remaining = (None if deadline is None else
+                             max(0, deadline - time.monotonic()))
+                self._poll(remaining)
+                if remaining == 0 and self._received < seq:
+                    raise LateResponse(
+                        'No response to request %d within %.3f s' %
+                        (seq, timeout))
+            if self._latest is None or self._latest[0] != seq:
+                raise LateResponse('Response to request %d was discarded' %
+                                   seq)
+            return self._read_response(io.BytesIO(self._latest[1]))
+        except LateResponse:
+            raise
+        except BaseException:
+            self._failed = True
+            raise
+
+    def submit(self, request):
+        '''Start running the bot for a single game step, without waiting for
+        the response (so that multiple bots can run concurrently - see
+        `photonai.game.Controllers`).
+
+        returns -- a `concurrent.futures.Future` of the response to `request`
+        (see `Bot.__call__`), which should be ready within `timeout`
+        '''
+        if self._pool is not None:
+            self._pending = self._pool.submit(self.execute, request)
+            return self._pending
+        try:
+            self._poll(0)
+            if self.max_backlog <= self._backlog():
+                raise RuntimeError('Bot is stuck, %d responses behind' %
+                                   self._backlog())
+            seq = self._seq
+            self._seq += 1
+            self._out += self._request.encode(self._message(request, seq),
+                                              seq)
+            self._write()
+        except BaseException:
+            self._failed = True
+            raise
+        self._pending = _Response(self, seq)
+        return self._pending
+
+    def __call__(self, request):
+        return self.submit(request).result(self.timeout)
+
+
+class SharedMemoryBot(SubprocessBot):
+    '''A bot subprocess on the same host (or in a container sharing the
+    host's /dev/shm), which reads the object states of each step from shared
+    memory (see `photonai.shm`), rather than decoding them from the pipe.
+
+    States are only published for steps from a headless
+    `photonai.engine.Engine` (which are copied column-wise from its arrays),
+    other steps are sent through the pipe. Falls back to `FRAMED`, if the bot
+    does not support (or cannot open) the shared memory region.
+
+    capacity -- maximum number of object states per step in shared memory
+    (larger steps are sent through the pipe)
+
+    folder -- to create the shared memory region in (default: /dev/shm)
+    '''
+    def __init__(self, command, stderr, timeout, capacity=4096, folder=None,
+                 **args):
+        self._region = shm.Region.create(capacity, folder)
+        try:
+            super().__init__(command, stderr, timeout, protocols=PROTOCOLS,
+                             metadata={SHM_KEY: self._region.path}, **args)
+        except BaseException:
+            self._region.close(unlink=True)
+            raise
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._region.close(unlink=True)
+
+    def _message(self, request, seq):
+        step = request['step']
+        # the buffer was last used by request (seq - 2), which the bot might
+        # still be reading, if it is late
+        if isinstance(step['data'], dict) or self._received < seq - 2:
+            return None, request
+        nstates, events = self._region.write(seq % 2, step['data'])
+        return nstates, dict(request, step=dict(step, data=events))
+
+
+class InProcessBot(Bot):
+    '''Runs a trusted bot (e.g. a `SimpleBot`) in this process, with the same
+    request/response semantics as `SubprocessBot`, but without encoding,
+    pipes or threads.
+
+    A bot cannot be interrupted in-process, so a bot which takes longer than
+    `timeout` fails the request with `LateResponse` (its response is
+    discarded, as if it had arrived too late).
+    '''
+    def __init__(self, bot, timeout):
+        self.bot = bot
+        self.timeout = timeout
+        self._failed = False
+
+    @classmethod
+    def load(cls, path, timeout):
+        '''Import a bot script (which should define a single subclass of
+        `Bot`, as run by `Bot.run_loop`), and create an instance.
+        '''
+        name = 'photonai_bot_%x' % random.randint(0, 1 << 32)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        classes = [value for value in vars(module).values()
+                   if isinstance(value, type) and issubclass(value, Bot) and
+                   value.__module__ == name]
+        if len(classes) != 1:
+            raise ValueError('Expected a single Bot class in "%s", found %r'
+                             % (path, [c.__name__ for c in classes]))
+        return cls(classes[0](), timeout)
+
+    def healthy(self):
+        return not self._failed
+
+    def submit(self, request):
+        '''Run the bot for a single game step (c.f. `SubprocessBot.submit`,
+        but the bot runs to completion before returning).
+
+        returns -- a completed `concurrent.futures.Future` of the response
+        '''
+        future = concurrent.futures.Future()
+        start = time.monotonic()
+        try:
+            # as a bot subprocess, printing goes to stderr
+            with contextlib.redirect_stdout(sys.stderr):
+                response = self.bot(request)
+        except Exception as e:
+            self._failed = True
+            future.set_exception(e)
+            return future
+        elapsed = time.monotonic() - start
+        if self.timeout is not None and self.timeout < elapsed:
+            future.set_exception(LateResponse(
+                'Bot took %.3f s (timeout %.3f s)' % (elapsed, self.timeout)))
+        else:
+            future.set_result(response)
+        return future
 
     def __call__(self, request):
-        return self._pool.submit(self.execute, request).result(self._timeout)
+        return self.submit(request).result()
 
 
 class DockerPythonBot(SubprocessBot):
@@ -176,3 +722,79 @@ class DockerPythonBot(SubprocessBot):
         except subprocess.CalledProcessError:
             pass  # ignore closing errors - best effort
         super().close()
+
+
+class BotPool:
+    '''Keeps bots (e.g. `DockerPythonBot`) alive between games, as starting a
+    bot process can take longer than playing a short game.
+
+    Idle bots are keyed, e.g. by `(bot_id, script_hash)`, so that a bot is
+    only reused to run the same script. Before reuse, they must pass the
+    `Bot.new_game` handshake. Bots which fail during a game, or which are
+    not `Bot.healthy` afterwards, are closed rather than reused.
+
+    capacity -- maximum number of idle bots to keep (the least recently used
+    are closed first)
+    '''
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self._idle = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._idle)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        '''Close all idle bots.
+        '''
+        while self._idle:
+            self._idle.popitem()[1].close()
+
+    def _acquire(self, key):
+        bot = self._idle.pop(key, None)
+        if bot is not None:
+            try:
+                bot.new_game()
+                return bot
+            except Exception as e:
+                logging.warning('Evicting bot %r, new game failed %r',
+                                key, e)
+                bot.close()
+
+    def _release(self, key, bot):
+        if not bot.healthy():
+            logging.warning('Evicting bot %r, unhealthy', key)
+            bot.close()
+            return
+        if key in self._idle:
+            # (e.g. a bot playing itself - only keep one)
+            self._idle.pop(key).close()
+        self._idle[key] = bot
+        while self.capacity < len(self._idle):
+            self._idle.popitem(last=False)[1].close()
+
+    @contextlib.contextmanager
+    def get(self, key, create):
+        '''Get an idle bot, or create a new one, for a single game (returning
+        it to the pool afterwards).
+
+        key -- identifies the bot (which must be hashable)
+
+        create -- function `create() -> Bot`, if there is no idle bot
+
+        returns -- a context manager, for the bot
+        '''
+        bot = self._acquire(key)
+        if bot is None:
+            bot = create()
+        try:
+            yield bot
+        except BaseException:
+            bot.close()
+            raise
+        self._release(key, bot)
@@ -0,0 +1,1105 @@
+'''A vectorized implementation of the game engine.
+
+`photonai.engine.Engine` is a drop-in replacement for
+`photonai.game.Simulator` - it produces exactly the same events, but keeps
+the state of every object in contiguous numpy arrays ("struct of arrays"),
+so each step is computed with a few whole-world array operations, rather than
+per-object Python & numpy calls.
+
+`photonai.engine.Batch` extends this to many independent games, stepped
+together in one `Store` of batched arrays, and `photonai.engine.predict` uses
+the same batched arrays to roll a world forward for many candidate controls
+at once - all three share a single step function (`_advance`).
+'''
+
+import numpy as np
+import functools
+import collections.abc
+from . import world, util, physics, game, records
+
+
+PLANET, SHIP, PELLET = range(3)
+
+_KINDS = {
+    world.Planet: PLANET,
+    world.Ship: SHIP,
+    world.Pellet: PELLET,
+}
+
+
+def _sanitize(control, low, high):
+    '''Vectorized `photonai.game._sanitize` (mapping NaN to zero).
+    '''
+    return np.where(control < low, low,
+                    np.where(control < high, control,
+                             np.where(high <= control, high, 0.0)))
+
+
+class State:
+    '''Array state of all objects in the world, ordered by object ID.
+
+    Per-object arrays have shape `(N,)` or `(N, 2)` (for vectors), fields
+    which are specific to a type of object (e.g. `reload` is only meaningful
+    for ships) are zero for other types.
+    '''
+    FIELDS = (
+        'id', 'kind',
+        'radius', 'mass', 'position', 'velocity', 'orientation',
+        'max_thrust', 'max_rotate',
+        'max_reload', 'max_temperature', 'decay_ratio', 'speed',
+        'pellet_time_to_live', 'reload', 'temperature',
+        'time_to_live',
+    )
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for k in self.FIELDS:
+            setattr(self, k, fields[k])
+
+    def __len__(self):
+        return len(self.id)
+
+    @classmethod
+    def load(cls, world_, step_duration):
+        '''Create the array state for all objects in a
+        `photonai.world.World`.
+        '''
+        objects = list(world_.objects.items())
+        n = len(objects)
+        fields = dict(
+            id=np.array([id for id, _ in objects], dtype=np.int64),
+            kind=np.array([_KINDS[type(obj)] for _, obj in objects],
+                          dtype=np.int8),
+            position=np.zeros((n, 2)),
+            velocity=np.zeros((n, 2)),
+            **{k: np.zeros(n) for k in cls.FIELDS
+               if k not in ('id', 'kind', 'position', 'velocity')})
+        for i, (_, obj) in enumerate(objects):
+            for k in ('radius', 'mass', 'position', 'velocity',
+                      'orientation'):
+                fields[k][i] = getattr(obj, k)
+            if isinstance(obj, world.Ship):
+                weapon = obj.weapon
+                for k in ('max_thrust', 'max_rotate'):
+                    fields[k][i] = getattr(obj, k)
+                for k in ('max_reload', 'max_temperature', 'speed',
+                          'reload', 'temperature'):
+                    fields[k][i] = getattr(weapon, k)
+                fields['pellet_time_to_live'][i] = weapon.time_to_live
+                # N.B. same computation as `photonai.game._update_weapon`
+                mr = weapon.max_temperature / (weapon.max_temperature + 1)
+                fields['decay_ratio'][i] = \
+                    mr ** (step_duration / weapon.temperature_decay)
+            elif isinstance(obj, world.Pellet):
+                fields['time_to_live'][i] = obj.time_to_live
+        return cls(**fields)
+
+    @classmethod
+    def zeros(cls, shape):
+        '''Create an array state of zeros, for objects of shape `shape` (e.g.
+        `(K, N)` for K batched worlds).
+        '''
+        dtypes = dict(id=np.int64, kind=np.int8)
+        vectors = ('position', 'velocity')
+        return cls(**{k: np.zeros(shape + ((2,) if k in vectors else ()),
+                                  dtype=dtypes.get(k, np.float))
+                      for k in cls.FIELDS})
+
+    def select(self, mask):
+        '''Create a new state containing only the objects in `mask`.
+        '''
+        return State(**{k: getattr(self, k)[mask] for k in self.FIELDS})
+
+    def extend(self, other):
+        '''Create a new state with the objects of `other` appended.
+        '''
+        return State(**{k: np.concatenate([getattr(self, k),
+                                           getattr(other, k)])
+                        for k in self.FIELDS})
+
+
+class Pellets:
+    '''Array state of a set of pellets, ordered by object ID (the subset of
+    `State` fields which are meaningful for pellets).
+    '''
+    FIELDS = ('id', 'position', 'velocity', 'orientation', 'time_to_live')
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for k in self.FIELDS:
+            setattr(self, k, fields[k])
+
+    def __len__(self):
+        return len(self.id)
+
+    def to_state(self):
+        '''Create the equivalent `State` (other fields are zero).
+        '''
+        n = len(self)
+        fields = {k: np.zeros(n) for k in State.FIELDS}
+        fields.update(kind=np.full(n, PELLET, dtype=np.int8),
+                      **{k: getattr(self, k) for k in self.FIELDS})
+        return State(**fields)
+
+
+class Store:
+    '''Preallocated array storage for the objects of K worlds, as a batched
+    `State` of shape `(K, N)`, which is updated in place by each step (see
+    `_advance`).
+
+    In each world (row), planets & ships occupy the first slots, in ID order.
+    The remaining slots hold pellets - the slots of expired pellets are
+    pushed onto a free list, and reused by new pellets, so slots are recycled
+    without allocation (the capacity only doubles if a world has no free
+    slots). N.B. pellet slots are therefore not in ID order - see `pellets`.
+
+    `state` -- `State` of arrays `(K, N)` (or `(K, N, 2)`, for vectors)
+
+    `alive` -- boolean array `(K, N)`, true for slots holding a live object
+    '''
+    def __init__(self, size, capacity=256):
+        capacity = max(1, capacity)
+        self.state = State.zeros((size, capacity))
+        self.state.kind[...] = PELLET
+        self.alive = np.zeros((size, capacity), dtype=bool)
+        self._nbodies = [0] * size
+        # (stacks, so the lowest free slots are used first)
+        self._free = [list(range(capacity - 1, -1, -1)) for _ in range(size)]
+
+    @property
+    def capacity(self):
+        return self.alive.shape[1]
+
+    def rows(self, index):
+        '''Get a `State` of views of some rows (e.g. a slice).
+        '''
+        return State(**{k: getattr(self.state, k)[index]
+                        for k in State.FIELDS})
+
+    def load(self, row, state):
+        '''Replace the objects of a world.
+
+        state -- `State` of all objects, in ID order (N.B. pellets must have
+        been created after all other objects, as in `photonai.game.run_game`)
+        '''
+        n = len(state)
+        if self.capacity < n:
+            self._grow(n)
+        for k in State.FIELDS:
+            array = getattr(self.state, k)
+            array[row] = 0
+            array[row, :n] = getattr(state, k)
+        self.state.kind[row, n:] = PELLET
+        self.alive[row] = False
+        self.alive[row, :n] = True
+        self._nbodies[row] = int(np.count_nonzero(state.kind != PELLET))
+        self._free[row] = list(range(self.capacity - 1, n - 1, -1))
+
+    def bodies(self, row):
+        '''Find the slots of all live planets & ships in a world.
+
+        returns -- integer array of slots, in object ID order
+        '''
+        return np.flatnonzero(self.alive[row, :self._nbodies[row]])
+
+    def pellets(self, row):
+        '''Find the slots of all live pellets in a world.
+
+        returns -- integer array of slots, in pellet ID order
+        '''
+        nbodies = self._nbodies[row]
+        slots = nbodies + np.flatnonzero(self.alive[row, nbodies:])
+        return slots[np.argsort(self.state.id[row, slots], kind='mergesort')]
+
+    def get(self, row, slots, cls=State):
+        '''Copy the state of some objects in a world.
+
+        cls -- `State`, or `Pellets` (for a subset of the fields)
+        '''
+        return cls(**{k: getattr(self.state, k)[row, slots]
+                      for k in cls.FIELDS})
+
+    def add(self, row, pellets):
+        '''Add new pellets to a world, in free slots.
+
+        pellets -- `Pellets`
+        '''
+        n = len(pellets)
+        free = self._free[row]
+        if len(free) < n:
+            self._grow(self.capacity + n - len(free))
+        slots = free[len(free) - n:][::-1]
+        del free[len(free) - n:]
+        for k in Pellets.FIELDS:
+            getattr(self.state, k)[row, slots] = getattr(pellets, k)
+        self.alive[row, slots] = True
+
+    def remove(self, row, slots):
+        '''Remove some objects from a world (releasing pellet slots, for
+        reuse).
+
+        slots -- integer array of slots of live objects
+        '''
+        self.alive[row, slots] = False
+        pellets = slots[self._nbodies[row] <= slots]
+        self._free[row].extend(pellets[::-1].tolist())
+
+    def _grow(self, size):
+        old = self.capacity
+        capacity = old
+        while capacity < size:
+            capacity *= 2
+        state = State.zeros((len(self.alive), capacity))
+        state.kind[...] = PELLET
+        for k in State.FIELDS:
+            getattr(state, k)[:, :old] = getattr(self.state, k)
+        alive = np.zeros((len(self.alive), capacity), dtype=bool)
+        alive[:, :old] = self.alive
+        self.state, self.alive = state, alive
+        for free in self._free:
+            free[:0] = range(capacity - 1, old - 1, -1)
+
+
+def _gather(mask):
+    '''Find the indices of true elements in each row of a batched mask.
+
+    returns -- `(index, valid)`, arrays of shape `(K, M)`, where `M` is the
+    maximum count of any row, and `valid` is false for padding
+    '''
+    if len(mask) == 1:
+        # (a single row needs no padding, e.g. for an `Engine`)
+        index = np.flatnonzero(mask[0])[np.newaxis]
+        return index, np.ones(index.shape, dtype=bool)
+    count = mask.sum(axis=1)
+    m = count.max() if len(count) else 0
+    index = np.argsort(~mask, axis=1, kind='mergesort')[:, :m]
+    return index, np.arange(m)[np.newaxis, :] < count[:, np.newaxis]
+
+
+def _batch_collisions(state, alive, dt=None):
+    '''Test batched objects for collisions with others in the same world
+    (planets never collide, and pellets cannot collide with each other).
+
+    dt -- if not None, test for swept collisions over a step of this
+    duration (see `photonai.game._is_collision`)
+
+    returns -- boolean array `(K, N)`, true if the object has collided
+    '''
+    collided = np.zeros(alive.shape, dtype=bool)
+    rows = np.arange(alive.shape[0])[:, np.newaxis]
+    for subjects, others in [(alive & (state.kind == SHIP), alive),
+                             (alive & (state.kind == PELLET),
+                              alive & (state.kind != PELLET))]:
+        s_idx, s_valid = _gather(subjects)
+        o_idx, o_valid = _gather(others)
+        relative = (state.position[rows, o_idx][:, np.newaxis] -
+                    state.position[rows, s_idx][:, :, np.newaxis])
+        if dt is None:
+            d_sq = (relative ** 2).sum(axis=-1)
+        else:
+            d_sq = physics.swept_distance_sq(
+                relative, dt * (state.velocity[rows, o_idx][:, np.newaxis] -
+                                state.velocity[rows, s_idx][:, :, np.newaxis]))
+        limit = (state.radius[rows, s_idx][:, :, np.newaxis] +
+                 state.radius[rows, o_idx][:, np.newaxis, :]) ** 2
+        hit = ((d_sq < limit) &
+               o_valid[:, np.newaxis, :] &
+               (s_idx[:, :, np.newaxis] != o_idx[:, np.newaxis, :]))
+        collided[rows, s_idx] |= s_valid & hit.any(axis=2)
+    return collided
+
+
+def _advance(state, alive, thrust, rotate, fire, dt, dimensions, gravity,
+             theta=None, drift=0.0, swept=False, kinematic=False):
+    '''Compute a single step of K batched worlds - the physics shared by
+    `Engine`, `Batch` & `predict`.
+
+    state -- `State` of arrays `(K, N)`, updated in place (only for live
+    objects, so dead objects are frozen)
+
+    alive -- boolean array `(K, N)`, false for empty slots
+
+    thrust, rotate, fire -- arrays `(K, N)` of controls (only read for
+    ships)
+
+    dimensions -- array `(K, 2)` of the size of each space
+
+    gravity -- array `(K,)` of the strength of gravity in each space
+
+    theta -- if not None, approximate gravity with Barnes-Hut (computed
+    separately for each world)
+
+    drift -- see `photonai.game.INTEGRATORS`
+
+    swept -- see `photonai.game.Simulator`
+
+    kinematic -- if True, skip gravity on planets (the caller moves them
+    along an ephemeris)
+
+    returns -- `(collided, destroyed, fired)`, boolean arrays `(K, N)` -
+    objects that collided, all objects destroyed (including expired
+    pellets), and ships that fired
+    '''
+    is_ship = alive & (state.kind == SHIP)
+    is_pellet = alive & (state.kind == PELLET)
+
+    # 1. Test for collisions
+    collided = _batch_collisions(state, alive, dt=dt if swept else None)
+
+    # 2. Compute the new position & velocity
+    forward = np.where(is_ship,
+                       state.max_thrust * _sanitize(thrust, 0, 1), 0.0)
+    accel = forward[..., np.newaxis] * util.direction(state.orientation)
+    massive = alive & (state.mass != 0)
+    targets = (massive & (state.kind != PLANET)) if kinematic else massive
+    gravity_position = state.position
+    if drift:
+        gravity_position = gravity_position + drift * state.velocity
+    rows = np.arange(len(alive))[:, np.newaxis]
+    if theta is None and 1 < len(alive):
+        index, valid = _gather(massive)
+        target_index, target_valid = index, valid
+        if kinematic:
+            target_index, target_valid = _gather(targets)
+        gravity_accel = physics.gravity_exact_batch(
+            gravity_position[rows, index],
+            np.where(valid, state.mass[rows, index], 0.0),
+            gravity,
+            # (indices of targets within the massive bodies)
+            targets=((np.cumsum(massive, axis=1) - 1)[rows, target_index]
+                     if kinematic else None))
+        accel[np.broadcast_to(rows, target_index.shape)[target_valid],
+              target_index[target_valid]] += gravity_accel[target_valid]
+    else:
+        # (Barnes-Hut is per world, and a single world needs no padding)
+        for k in range(len(alive)):
+            index = np.flatnonzero(massive[k])
+            target = np.flatnonzero(targets[k][index]) if kinematic else None
+            accel[k, index if target is None else index[target]] += \
+                physics.gravity(gravity_position[k, index],
+                                state.mass[k, index],
+                                gravity[k], theta=theta, targets=target)
+
+    velocity = state.velocity + dt * accel
+    position = (state.position +
+                (dt / 2) * state.velocity +
+                (dt / 2) * velocity)
+    position = np.where(is_ship[..., np.newaxis],
+                        position % dimensions[:, np.newaxis, :],
+                        position)
+    destroyed = collided | (
+        is_pellet & (np.any(position < 0, axis=-1) |
+                     np.any(dimensions[:, np.newaxis, :] <= position,
+                            axis=-1)))
+
+    # 3. Compute the new orientation
+    orientation = np.where(
+        is_ship,
+        (state.orientation +
+         dt * (state.max_rotate * _sanitize(rotate, -1, 1)))
+        % (2 * np.pi),
+        state.orientation)
+
+    # 4. Update weapons & pellets
+    reload = np.maximum(0.0, state.reload - dt)
+    temperature = state.decay_ratio * state.temperature
+    fired = is_ship & fire & (~destroyed) & (reload == 0) & \
+        (temperature < state.max_temperature)
+    reload = np.where(fired, state.max_reload, reload)
+    temperature = np.where(fired, temperature + 1, temperature)
+    time_to_live = np.where(is_pellet, state.time_to_live - dt,
+                            state.time_to_live)
+    destroyed |= is_pellet & (time_to_live <= 0)
+
+    live = alive[..., np.newaxis]
+    np.copyto(state.position, position, where=live)
+    np.copyto(state.velocity, velocity, where=live)
+    np.copyto(state.orientation, orientation, where=alive)
+    np.copyto(state.reload, reload, where=alive)
+    np.copyto(state.temperature, temperature, where=alive)
+    np.copyto(state.time_to_live, time_to_live, where=alive)
+    return collided, destroyed, fired
+
+
+class _Step:
+    '''The array results of a single step of the `Engine`.
+    '''
+    __slots__ = ('state', 'destroyed', 'fired', 'controls',
+                 'pellets', 'expired', 'new_pellets', '_events')
+
+    def __init__(self, state, destroyed, fired, controls,
+                 pellets, expired, new_pellets):
+        '''state -- the `State` of existing planets & ships, after the step
+
+        destroyed -- boolean array, true for bodies destroyed in this step
+
+        fired -- boolean array, true for ships that fired in this step
+
+        controls -- dict of {index in state: Controller.STATE} for ships
+
+        pellets -- the `Pellets` state of existing pellets, after the step
+
+        expired -- boolean array, true for pellets destroyed in this step
+
+        new_pellets -- the `Pellets` state of all new pellets
+        '''
+        self.state = state
+        self.destroyed = destroyed
+        self.fired = fired
+        self.controls = controls
+        self.pellets = pellets
+        self.expired = expired
+        self.new_pellets = new_pellets
+        self._events = None
+
+    def events(self):
+        '''Generate (or return cached) log events for the step, as compact
+        `photonai.records`, in the same order as `photonai.game.Simulator`.
+        '''
+        if self._events is not None:
+            return self._events
+        state, pellets, new_pellets = \
+            self.state, self.pellets, self.new_pellets
+        pellet_events = iter([
+            records.PelletCreate(*fields) for fields in zip(
+                new_pellets.id.tolist(),
+                new_pellets.position.tolist(),
+                new_pellets.velocity.tolist(),
+                new_pellets.orientation.tolist(),
+                new_pellets.time_to_live.tolist())])
+
+        events = []
+        for i, (id, kind, is_destroyed, is_fired,
+                position, velocity, orientation,
+                reload, temperature) in enumerate(zip(
+                    state.id.tolist(), state.kind.tolist(),
+                    self.destroyed.tolist(), self.fired.tolist(),
+                    state.position.tolist(), state.velocity.tolist(),
+                    state.orientation.tolist(),
+                    state.reload.tolist(), state.temperature.tolist())):
+            if is_destroyed:
+                events.append(records.Destroy(id))
+            elif kind == SHIP:
+                if is_fired:
+                    events.append(next(pellet_events))
+                events.append(records.ShipState(
+                    id, position, velocity, orientation,
+                    is_fired, reload, temperature, self.controls[i]))
+            else:
+                events.append(records.PlanetState(
+                    id, position, velocity, orientation))
+
+        for id, is_expired, position, velocity, orientation, time_to_live \
+                in zip(pellets.id.tolist(), self.expired.tolist(),
+                       pellets.position.tolist(), pellets.velocity.tolist(),
+                       pellets.orientation.tolist(),
+                       pellets.time_to_live.tolist()):
+            if is_expired:
+                events.append(records.Destroy(id))
+            else:
+                events.append(records.PelletState(
+                    id, position, velocity, orientation, time_to_live))
+        self._events = events
+        return events
+
+    def columns(self, hidden):
+        '''Get the object states of the step as arrays, without creating
+        state events (see `photonai.shm.Region.write`).
+
+        hidden -- IDs of ships without state events
+
+        returns -- `(blocks, others)`, where `blocks` is a list of dicts of
+        columns (named as the fields of `photonai.shm.DTYPE`, which are zero
+        if absent), and `others` is a list of the creation & destruction
+        events
+        '''
+        state, pellets = self.state, self.pellets
+        keep = ~self.destroyed
+        if hidden:
+            keep &= ~((state.kind == SHIP) &
+                      np.isin(state.id, np.array(list(hidden))))
+        index = np.flatnonzero(keep)
+        fire, rotate, thrust = (np.zeros(len(index), dtype=bool),
+                                np.zeros(len(index)), np.zeros(len(index)))
+        for j, i in enumerate(index.tolist()):
+            control = self.controls.get(i)
+            if control is not None:
+                fire[j] = control['fire']
+                rotate[j] = control['rotate']
+                thrust[j] = control['thrust']
+        bodies = dict(
+            id=state.id[index], kind=state.kind[index],
+            position=state.position[index], velocity=state.velocity[index],
+            orientation=state.orientation[index], fired=self.fired[index],
+            reload=state.reload[index], temperature=state.temperature[index],
+            fire=fire, rotate=rotate, thrust=thrust)
+        live = ~self.expired
+        pellet_columns = dict(
+            id=pellets.id[live], kind=PELLET,
+            position=pellets.position[live], velocity=pellets.velocity[live],
+            orientation=pellets.orientation[live],
+            time_to_live=pellets.time_to_live[live])
+
+        new_pellets = self.new_pellets
+        others = [records.PelletCreate(*fields) for fields in zip(
+            new_pellets.id.tolist(), new_pellets.position.tolist(),
+            new_pellets.velocity.tolist(), new_pellets.orientation.tolist(),
+            new_pellets.time_to_live.tolist())]
+        others.extend(records.Destroy(id) for id in
+                      state.id[self.destroyed].tolist() +
+                      pellets.id[self.expired].tolist())
+        return [bodies, pellet_columns], others
+
+    def nevents(self):
+        '''Count the events of the step, without creating them.
+        '''
+        return (len(self.state.id) + len(self.pellets.id) +
+                int(np.count_nonzero(self.fired & ~self.destroyed)))
+
+    def update_world(self, world_, clock, hidden):
+        '''Apply the step to a `photonai.world.World`, without creating
+        schema events (c.f. `photonai.world.World._handle_event`).
+        '''
+        objects = world_.objects
+        state = self.state
+        # Copy, so that the world cannot modify the engine's state
+        position = state.position.copy()
+        velocity = state.velocity.copy()
+        for i, (id, kind, is_destroyed, is_fired, orientation,
+                reload, temperature) in enumerate(zip(
+                    state.id.tolist(), state.kind.tolist(),
+                    self.destroyed.tolist(), self.fired.tolist(),
+                    state.orientation.tolist(),
+                    state.reload.tolist(), state.temperature.tolist())):
+            if is_destroyed:
+                world_.remove(id)
+                continue
+            if id in hidden:
+                continue
+            obj = objects[id]
+            obj.update_clock = clock
+            obj.position = position[i]
+            obj.velocity = velocity[i]
+            obj.orientation = orientation
+            if kind == SHIP:
+                weapon = obj.weapon
+                weapon.update_clock = clock
+                weapon.fired = is_fired
+                weapon.reload = reload
+                weapon.temperature = temperature
+                control = self.controls[i]
+                controller = obj.controller
+                controller.update_clock = clock
+                controller.fire = bool(control['fire'])
+                controller.rotate = float(control['rotate'])
+                controller.thrust = float(control['thrust'])
+
+        pellets = self.pellets
+        position = pellets.position.copy()
+        velocity = pellets.velocity.copy()
+        for i, (id, is_expired, orientation, time_to_live) in enumerate(zip(
+                pellets.id.tolist(), self.expired.tolist(),
+                pellets.orientation.tolist(),
+                pellets.time_to_live.tolist())):
+            if is_expired:
+                world_.remove(id)
+                continue
+            obj = objects[id]
+            obj.update_clock = clock
+            obj.position = position[i]
+            obj.velocity = velocity[i]
+            obj.orientation = orientation
+            obj.time_to_live = time_to_live
+
+        pellets = self.new_pellets
+        position = pellets.position.copy()
+        velocity = pellets.velocity.copy()
+        for i, (id, orientation, time_to_live) in enumerate(zip(
+                pellets.id.tolist(),
+                pellets.orientation.tolist(),
+                pellets.time_to_live.tolist())):
+            world_.add(id, world.Pellet(
+                clock=clock, radius=0.0, mass=0.0,
+                position=position[i], velocity=velocity[i],
+                orientation=orientation, time_to_live=time_to_live))
+
+
+class Events(collections.abc.Sequence):
+    '''The events of a single step of a headless `Engine`.
+
+    Behaves like a list of `photonai.schema` object events, but these are
+    only created when first accessed. Consumers that understand `Events` can
+    avoid this entirely - `photonai.world.World` uses `update_world`,
+    `photonai.game.Controllers` uses `hide`, and `photonai.shm` uses
+    `columns`.
+    '''
+    __slots__ = ('_step', '_hidden', '_events')
+
+    def __init__(self, step, hidden=frozenset()):
+        self._step = step
+        self._hidden = hidden
+        self._events = None
+
+    def _get_events(self):
+        if self._events is None:
+            events = self._step.events()
+            if self._hidden:
+                # (N.B. creation & destruction are never hidden)
+                events = [e for e in events
+                          if e['id'] not in self._hidden or
+                          records.kind(e) != 'ship_state']
+            self._events = events
+        return self._events
+
+    def __len__(self):
+        if self._events is None and not self._hidden:
+            # (cheap, e.g. for counting events per step)
+            return self._step.nevents()
+        return len(self._get_events())
+
+    def __getitem__(self, index):
+        return self._get_events()[index]
+
+    def __iter__(self):
+        return iter(self._get_events())
+
+    def __repr__(self):
+        return repr(self._get_events())
+
+    def hide(self, ids):
+        '''Create a view of these events, without updates to some ships.
+
+        ids -- IDs of ships to hide
+
+        returns -- `Events` (or `self`, if nothing would be hidden)
+        '''
+        ids = frozenset(ids) - self._hidden
+        if len(ids) == 0:
+            return self
+        return Events(self._step, self._hidden | ids)
+
+    def update_world(self, world_, clock):
+        '''Apply these events to a `photonai.world.World`.
+        '''
+        self._step.update_world(world_, clock, self._hidden)
+
+    def columns(self):
+        '''Get the object states as arrays, and the other events (see
+        `photonai.shm.Region.write`).
+        '''
+        return self._step.columns(self._hidden)
+
+
+class Engine:
+    '''A vectorized simulator, which computes a single step, based on a
+    world (which should be updated externally).
+
+    Has the same interface & results as `photonai.game.Simulator`, but
+    keeps the world's state as arrays between steps, updated in place
+    (reloading them if the world has been updated by any other events).
+
+    barnes_hut -- see `photonai.game.Simulator`
+
+    headless -- if True, return `Events` from each step, rather than a list
+    of schema events, so they are only created if needed
+
+    swept, integrator, ephemerides -- see `photonai.game.Simulator`
+
+    store, row -- if not None, a `Store` (shared with other engines, which
+    are stepped together - see `Batch`), and the row to keep this world in
+    '''
+    def __init__(self, world, step_duration, object_id_gen, barnes_hut=None,
+                 headless=False, swept=False, integrator='euler',
+                 ephemerides=None, store=None, row=0):
+        if integrator not in game.INTEGRATORS:
+            raise ValueError('Unknown integrator %r' % integrator)
+        self._world = world
+        self._step_duration = step_duration
+        self._object_id_gen = object_id_gen
+        self._barnes_hut = barnes_hut
+        self._headless = headless
+        self._swept = swept
+        self._drift = game.INTEGRATORS[integrator] * step_duration
+        self._ephemerides = ephemerides
+        self._ephemeris = None
+        self._planets = None
+        self._store = store
+        self._row = row
+        self._clock = None
+
+    def _load(self):
+        '''Reload the array state, if the world has been updated by any other
+        events (N.B. pellets must have been created after all other objects,
+        as in `photonai.game.run_game`).
+        '''
+        if self._clock != self._world.clock:
+            state = State.load(self._world, self._step_duration)
+            if self._store is None:
+                # (steps are computed over every slot, so start small)
+                self._store = Store(1, capacity=2 * len(state))
+            self._store.load(self._row, state)
+            self._clock = self._world.clock
+
+    @property
+    def state(self):
+        '''The current `photonai.engine.State` of the world.
+        '''
+        self._load()
+        store, row = self._store, self._row
+        return store.get(row, np.concatenate([store.bodies(row),
+                                              store.pellets(row)]))
+
+    def visibility(self):
+        '''Compute which ships can see each other in the current world.
+
+        returns -- `(ids, visible)`, as `photonai.game.ship_visibility`
+        '''
+        self._load()
+        state = self._store.get(self._row, self._store.bodies(self._row))
+        ships = state.kind == SHIP
+        planets = state.kind == PLANET
+        return (state.id[ships].tolist(),
+                physics.line_of_sight(state.position[ships],
+                                      state.position[planets],
+                                      state.radius[planets]))
+
+    def __call__(self, controller_states):
+        '''Return a list of events corresponding a single step of the
+        simulation (or an `Events` sequence, if running headless).
+        '''
+        self._load()
+        store = self._store
+        rows = slice(self._row, self._row + 1)
+        alive = store.alive[rows]
+        thrust, rotate = np.zeros(alive.shape), np.zeros(alive.shape)
+        fire = np.zeros(alive.shape, dtype=bool)
+        ships, controls = self._begin(controller_states,
+                                      thrust[0], rotate[0], fire[0])
+        space = self._world.space
+        _, destroyed, fired = _advance(
+            store.rows(rows), alive, thrust, rotate, fire,
+            self._step_duration,
+            np.array([space.dimensions], dtype=np.float),
+            np.array([space.gravity], dtype=np.float),
+            theta=self._barnes_hut, drift=self._drift, swept=self._swept,
+            kinematic=self._ephemerides is not None)
+        return self._end(ships, controls, destroyed[0], fired[0])
+
+    def _begin(self, controller_states, thrust, rotate, fire):
+        '''Prepare to step - read the controls of ships & look up the next
+        state of planets in the ephemeris.
+
+        thrust, rotate, fire -- arrays `(N,)`, to write ship controls into
+
+        returns -- `(ships, controls)`, the slots of ships, and a list of
+        their `photonai.schema.Controller.STATE`
+        '''
+        self._load()
+        store, row = self._store, self._row
+        bodies = store.bodies(row)
+        kind = store.state.kind[row, bodies]
+        ships = bodies[kind == SHIP]
+        controls = [controller_states[id]
+                    for id in store.state.id[row, ships].tolist()]
+        thrust[ships] = np.array([c['thrust'] for c in controls],
+                                 dtype=np.float)
+        rotate[ships] = np.array([c['rotate'] for c in controls],
+                                 dtype=np.float)
+        fire[ships] = np.array([bool(c['fire']) for c in controls],
+                               dtype=bool)
+        if self._ephemerides is not None:
+            planets = bodies[kind == PLANET]
+            self._planets = (planets,) + self._planet_state(planets)
+        return ships, controls
+
+    def _planet_state(self, planets):
+        '''Look up the next state of planets in the ephemeris.
+
+        planets -- slots of all planets
+
+        returns -- `(position, velocity)`, arrays (P, 2)
+        '''
+        if self._ephemeris is None:
+            state = self._store.get(self._row, planets)
+            self._ephemeris = (self._ephemerides(
+                state.position,
+                state.velocity,
+                state.mass,
+                self._world.space.gravity,
+                self._step_duration,
+                drift=self._drift,
+                theta=self._barnes_hut), self._world.clock)
+        ephemeris, start = self._ephemeris
+        return ephemeris[self._world.clock + 1 - start]
+
+    def _end(self, ships, controls, destroyed, fired):
+        '''Finish a step (after `_advance`) - fire pellets, remove destroyed
+        objects & create the step's events.
+
+        ships, controls -- from `_begin`
+
+        destroyed, fired -- boolean arrays `(N,)`, from `_advance`
+        '''
+        store, row = self._store, self._row
+        if self._planets is not None:
+            planets, position, velocity = self._planets
+            store.state.position[row, planets] = position
+            store.state.velocity[row, planets] = velocity
+        bodies = store.bodies(row)
+        pellets = store.pellets(row)
+        # (the step's events need a copy, as the store is updated in place)
+        state = store.get(row, bodies)
+        pellet_state = store.get(row, pellets, Pellets)
+        body_destroyed, body_fired = destroyed[bodies], fired[bodies]
+        expired = destroyed[pellets]
+        store.remove(row, np.concatenate([bodies[body_destroyed],
+                                          pellets[expired]]))
+        new_pellets = self._fire_pellets(state, body_fired)
+        store.add(row, new_pellets)
+        step = _Step(state, body_destroyed, body_fired,
+                     dict(zip(np.searchsorted(bodies, ships).tolist(),
+                              controls)),
+                     pellet_state, expired, new_pellets)
+        self._clock = self._world.clock + 1
+        return Events(step) if self._headless else step.events()
+
+    def _fire_pellets(self, state, fired):
+        '''Create the state for pellets fired by ships (c.f.
+        `photonai.game._fire_pellet`).
+
+        returns -- `Pellets`
+        '''
+        src = np.flatnonzero(fired)
+        direction = util.direction(state.orientation[src])
+        position = (state.position[src] +
+                    (1.01 * state.radius[src])[:, np.newaxis] * direction)
+        velocity = (state.velocity[src] +
+                    state.speed[src][:, np.newaxis] * direction)
+        return Pellets(
+            id=np.array([next(self._object_id_gen) for _ in src],
+                        dtype=np.int64),
+            position=position, velocity=velocity,
+            orientation=state.orientation[src],
+            time_to_live=state.pellet_time_to_live[src])
+
+
+class Batch:
+    '''Run K independent games together, stepping the physics of all of them
+    in a single pass over a shared `Store`, with a leading batch dimension
+    (so that per-step overhead is shared between games).
+
+    Each game has its own world, bots, event stream & outcome (the same as
+    `photonai.game.run_game` with an `Engine`) - iterate over the batch to
+    get a list of K steps at a time (`None` for games that have finished),
+    then the outcome of each game is in `outcomes`.
+
+    games -- a list of pairs `(map_spec, controller_bots)`, as
+    `photonai.game.run_game` (e.g. from `photonai.maps` factories, seeded per
+    game)
+
+    stop -- a function(world) which raises `photonai.game.Stop` when a game
+    should finish
+
+    control_interval, control_lag -- see `photonai.game.run_game`
+
+    barnes_hut, headless, swept, integrator, ephemerides -- see `Engine`
+    (with `barnes_hut`, gravity is computed separately per game)
+    '''
+    def __init__(self, games, stop, step_duration, control_interval=1,
+                 control_lag=0, barnes_hut=None, headless=False, swept=False,
+                 integrator='euler', ephemerides=None):
+        if integrator not in game.INTEGRATORS:
+            raise ValueError('Unknown integrator %r' % integrator)
+        self._stop = stop
+        self._step_duration = step_duration
+        self._barnes_hut = barnes_hut
+        self._swept = swept
+        self._drift = game.INTEGRATORS[integrator] * step_duration
+        self._kinematic_planets = ephemerides is not None
+        self._store = Store(len(games))
+        self._games = [
+            game._Game(map_spec, controller_bots, step_duration,
+                       functools.partial(Engine, barnes_hut=barnes_hut,
+                                         headless=headless,
+                                         integrator=integrator,
+                                         ephemerides=ephemerides,
+                                         store=self._store, row=k),
+                       control_interval=control_interval,
+                       control_lag=control_lag)
+            for k, (map_spec, controller_bots) in enumerate(games)]
+        self.outcomes = [None] * len(self._games)
+
+    def __iter__(self):
+        for n in range(2):
+            yield [game_.step(game_.initial_data[n])
+                   for game_ in self._games]
+        active = list(range(len(self._games)))
+        while active:
+            steps = [None] * len(self._games)
+            for k, data in zip(active, self._step(active)):
+                steps[k] = self._games[k].step(data)
+            yield steps
+            for k in active:
+                try:
+                    self._stop(self._games[k].world)
+                except game.Stop as e:
+                    self.outcomes[k] = e
+                    self._games[k].finish()
+            active = [k for k in active if self.outcomes[k] is None]
+
+    def _step(self, active):
+        '''Run a single step of the simulation for the active games (rows of
+        the store), returning a list of event data (c.f. `Engine.__call__`).
+        '''
+        games = [self._games[k] for k in active]
+        engines = [game_.simulator for game_ in games]
+        for engine_ in engines:
+            # (may grow the store)
+            engine_._load()
+        store = self._store
+        alive = np.zeros(store.alive.shape, dtype=bool)
+        alive[active] = store.alive[active]
+        thrust, rotate = np.zeros(alive.shape), np.zeros(alive.shape)
+        fire = np.zeros(alive.shape, dtype=bool)
+        dimensions = np.ones((len(alive), 2))
+        gravity = np.zeros(len(alive))
+        begun = []
+        for k, game_, engine_ in zip(active, games, engines):
+            begun.append(engine_._begin(game_.controllers.control,
+                                        thrust[k], rotate[k], fire[k]))
+            dimensions[k] = engine_._world.space.dimensions
+            gravity[k] = engine_._world.space.gravity
+        _, destroyed, fired = _advance(
+            store.state, alive, thrust, rotate, fire, self._step_duration,
+            dimensions, gravity, theta=self._barnes_hut, drift=self._drift,
+            swept=self._swept, kinematic=self._kinematic_planets)
+        return [engine_._end(ships, controls, destroyed[k], fired[k])
+                for k, engine_, (ships, controls)
+                in zip(active, engines, begun)]
+
+
+class Prediction:
+    '''The result of `predict`, for C candidate control sequences over T
+    steps, of the N objects in the world.
+
+    `ids` -- list of the N object IDs (pellets fired during the prediction
+    are not included, but may destroy ships)
+
+    `position`, `velocity` -- arrays (C, T, N, 2), after each step
+
+    `orientation` -- array (C, T, N), after each step
+
+    `alive` -- boolean array (C, T, N), false once the object has been
+    destroyed (after which its state is frozen)
+
+    `collision_time` -- array (C, N), time from the start of the prediction
+    until the end of the step in which the object collided (`inf` if it does
+    not collide within T steps)
+    '''
+    __slots__ = ('ids', 'position', 'velocity', 'orientation', 'alive',
+                 'collision_time')
+
+    def __init__(self, **fields):
+        for k in self.__slots__:
+            setattr(self, k, fields[k])
+
+
+def predict(world_, controls, n_steps, step_duration=0.01, swept=False,
+            integrator='euler'):
+    '''Simulate a world forward for many candidate control sequences at once
+    (e.g. for lookahead search in a bot), following the same rules as
+    `Engine`.
+
+    world_ -- `photonai.world.World` to start from (N.B. it is not updated,
+    and obscured ships follow their last known state)
+
+    controls -- dict of {ship ID: array of `(fire, rotate, thrust)`},
+    broadcastable to shape `(C, n_steps, 3)` - ships without an entry keep
+    their current controller state
+
+    step_duration, swept, integrator -- see `photonai.game.Simulator` (these
+    should match the game)
+
+    returns -- `Prediction`
+    '''
+    if integrator not in game.INTEGRATORS:
+        raise ValueError('Unknown integrator %r' % integrator)
+    dt = step_duration
+    drift = game.INTEGRATORS[integrator] * dt
+    initial = State.load(world_, dt)
+    n = len(initial)
+    ships = np.flatnonzero(initial.kind == SHIP)
+    ship_ids = initial.id[ships].tolist()
+
+    controls = {id: np.asarray(c, dtype=np.float)
+                for id, c in controls.items()}
+    ncandidates = max([c.shape[0] for c in controls.values() if c.ndim == 3],
+                      default=1)
+    control = np.empty((ncandidates, n_steps, len(ships), 3))
+    for s, id in enumerate(ship_ids):
+        if id in controls:
+            c = controls[id]
+        else:
+            c = world_.objects[id].controller
+            c = np.array([bool(c.fire), c.rotate, c.thrust], dtype=np.float)
+        control[:, :, s] = np.broadcast_to(c, (ncandidates, n_steps, 3))
+    fire = control[..., 0] != 0
+
+    # Pad with a slot for every pellet which might be fired (in ship order,
+    # for each step)
+    size = n + n_steps * len(ships)
+    state = State.zeros((ncandidates, size))
+    for k in State.FIELDS:
+        getattr(state, k)[:, :n] = getattr(initial, k)
+    state.kind[:, n:] = PELLET
+    alive = np.zeros((ncandidates, size), dtype=bool)
+    alive[:, :n] = True
+    gravity = np.full(ncandidates, world_.space.gravity)
+    dimensions = np.broadcast_to(world_.space.dimensions, (ncandidates, 2))
+
+    shape = (ncandidates, n_steps, n)
+    position = np.zeros(shape + (2,))
+    velocity = np.zeros(shape + (2,))
+    orientation = np.zeros(shape)
+    alive_out = np.zeros(shape, dtype=bool)
+    collision_time = np.full((ncandidates, n), np.inf)
+    thrust, rotate = np.zeros(alive.shape), np.zeros(alive.shape)
+    fire_step = np.zeros(alive.shape, dtype=bool)
+
+    for step in range(n_steps):
+        thrust[:, ships] = control[:, step, :, 2]
+        rotate[:, ships] = control[:, step, :, 1]
+        fire_step[:, ships] = fire[:, step]
+        collided, destroyed, fired = _advance(
+            state, alive, thrust, rotate, fire_step, dt, dimensions, gravity,
+            drift=drift, swept=swept)
+        collided = collided[:, :n] & np.isinf(collision_time)
+        collision_time[collided] = (step + 1) * dt
+        alive &= ~destroyed
+
+        # Fire new pellets (c.f. `Engine._fire_pellets`)
+        src_rows, src = np.nonzero(fired[:, ships])
+        src_ships = ships[src]
+        slots = n + step * len(ships) + src
+        direction = util.direction(state.orientation[src_rows, src_ships])
+        state.position[src_rows, slots] = (
+            state.position[src_rows, src_ships] +
+            (1.01 * state.radius[src_rows, src_ships])[:, np.newaxis] *
+            direction)
+        state.velocity[src_rows, slots] = (
+            state.velocity[src_rows, src_ships] +
+            state.speed[src_rows, src_ships][:, np.newaxis] * direction)
+        state.orientation[src_rows, slots] = \
+            state.orientation[src_rows, src_ships]
+        state.time_to_live[src_rows, slots] = \
+            state.pellet_time_to_live[src_rows, src_ships]
+        alive[src_rows, slots] = True
+
+        position[:, step] = state.position[:, :n]
+        velocity[:, step] = state.velocity[:, :n]
+        orientation[:, step] = state.orientation[:, :n]
+        alive_out[:, step] = alive[:, :n]
+
+    return Prediction(ids=initial.id.tolist(), position=position,
+                      velocity=velocity, orientation=orientation,
+                      alive=alive_out, collision_time=collision_time)
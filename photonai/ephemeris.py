@@ -0,0 +1,204 @@
+'''Precomputed planet trajectories ("ephemerides"), for simulating with
+kinematic planets.
+
+On most maps, the motion of planets depends only on the planets themselves
+(ships have a tiny mass, and pellets none). With kinematic planets, a
+simulator ignores the pull of ships on planets, so planet trajectories depend
+only on the initial planet state, and can be computed once (then shared by
+every game with the same initial planets, in memory or on disk), rather than
+integrated every step of every game.
+'''
+
+import collections
+import hashlib
+import os
+import tempfile
+import numpy as np
+from . import physics
+
+
+class Ephemeris:
+    '''The trajectory of a set of planets under their own gravity, computed
+    (in chunks) as required.
+
+    Uses the same integration as `photonai.engine.Engine`, so if there are no
+    other massive objects, planets follow exactly the same trajectory.
+    '''
+    CHUNK = 1000
+
+    def __init__(self, position, velocity, mass, gravity, step_duration,
+                 drift=0.0, theta=None, path=None):
+        '''position, velocity -- arrays (T, P, 2) of the trajectory so far
+        (T >= 1)
+
+        mass -- array (P,) of planet masses
+
+        gravity, step_duration, drift, theta -- parameters of the simulation
+        (see `photonai.game.Simulator`)
+
+        path -- if not None, directory to save each new chunk of the
+        trajectory to (see `load`)
+        '''
+        self._position = np.array(position, dtype=np.float)
+        self._velocity = np.array(velocity, dtype=np.float)
+        self._length = len(self._position)
+        self._mass = mass
+        self._gravity = gravity
+        self._step_duration = step_duration
+        self._drift = drift
+        self._theta = theta
+        self._path = path
+
+    @property
+    def position(self):
+        return self._position[:self._length]
+
+    @property
+    def velocity(self):
+        return self._velocity[:self._length]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, n):
+        '''Get the state of the planets after n steps.
+
+        returns -- `(position, velocity)`, arrays (P, 2)
+        '''
+        while len(self) <= n:
+            start = len(self)
+            self._extend(start + self.CHUNK)
+            if self._path is not None:
+                self._save_chunk(start)
+        return self._position[n], self._velocity[n]
+
+    def _reserve(self, length):
+        # Grow geometrically, so extending is amortized linear
+        if len(self._position) < length:
+            capacity = max(length, 2 * len(self._position))
+            for name in ['_position', '_velocity']:
+                array = getattr(self, name)
+                grown = np.empty((capacity,) + array.shape[1:])
+                grown[:self._length] = array[:self._length]
+                setattr(self, name, grown)
+
+    def _append(self, position, velocity):
+        self._reserve(self._length + len(position))
+        end = self._length + len(position)
+        self._position[self._length:end] = position
+        self._velocity[self._length:end] = velocity
+        self._length = end
+
+    def _extend(self, length):
+        dt = self._step_duration
+        self._reserve(length)
+        position, velocity = self._position, self._velocity
+        for n in range(self._length, length):
+            p, v = position[n - 1], velocity[n - 1]
+            gravity_position = p + self._drift * v if self._drift else p
+            accel = physics.gravity(gravity_position, self._mass,
+                                    self._gravity, theta=self._theta)
+            velocity[n] = v + dt * accel
+            position[n] = p + (dt / 2) * v + (dt / 2) * velocity[n]
+        self._length = length
+
+    @staticmethod
+    def _chunk_path(path, start):
+        return os.path.join(path, '{:09d}.npz'.format(start))
+
+    def _save_chunk(self, start):
+        # Only the new chunk is written (atomically), so that saving costs
+        # the same as computing (chunks are deterministic - they always
+        # start from the initial state - so concurrent writers agree)
+        fd, tmp = tempfile.mkstemp(dir=self._path, suffix='.npz.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, position=self._position[start:self._length],
+                     velocity=self._velocity[start:self._length])
+        os.replace(tmp, self._chunk_path(self._path, start))
+
+    def load(self):
+        '''Append any chunks of the trajectory saved in `path` (e.g. by another
+        process).
+        '''
+        while True:
+            chunk = self._chunk_path(self._path, len(self))
+            if not os.path.exists(chunk):
+                break
+            with np.load(chunk) as data:
+                self._append(data['position'], data['velocity'])
+
+
+class Cache:
+    '''A cache of `Ephemeris` objects, keyed by the initial state of the
+    planets & simulation parameters.
+
+    path -- if not None, directory to save & load ephemerides (e.g. shared
+    between tournament workers), as a folder of chunks per ephemeris
+
+    maxsize -- maximum number of ephemerides to keep in memory
+    '''
+    def __init__(self, path=None, maxsize=64):
+        self._path = path
+        self._maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(position, velocity, mass, gravity, step_duration, drift, theta):
+        digest = hashlib.sha1()
+        for array in [position, velocity, mass]:
+            digest.update(np.ascontiguousarray(array,
+                                               dtype=np.float64).tobytes())
+        digest.update(repr((float(gravity), float(step_duration),
+                            float(drift), theta)).encode())
+        return digest.hexdigest()
+
+    def __call__(self, position, velocity, mass, gravity, step_duration,
+                 drift=0.0, theta=None):
+        '''Get the ephemeris of a set of planets, starting from the given
+        state.
+
+        position, velocity -- arrays (P, 2) of the initial planet state
+
+        mass -- array (P,) of planet masses
+
+        returns -- `Ephemeris`
+        '''
+        key = self._key(position, velocity, mass, gravity, step_duration,
+                        drift, theta)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        path = None
+        if self._path is not None:
+            path = os.path.join(self._path, key)
+            os.makedirs(path, exist_ok=True)
+        ephemeris = Ephemeris(np.array(position, dtype=np.float)[np.newaxis],
+                              np.array(velocity, dtype=np.float)[np.newaxis],
+                              np.array(mass, dtype=np.float),
+                              gravity, step_duration,
+                              drift=drift, theta=theta, path=path)
+        if path is not None:
+            ephemeris.load()
+
+        self._entries[key] = ephemeris
+        while self._maxsize < len(self._entries):
+            self._entries.popitem(last=False)
+        return ephemeris
+
+
+_SHARED = {}
+
+
+def shared_cache(path=None):
+    '''Get a process-wide `Cache` (one per path), so that ephemerides are
+    reused between games.
+    '''
+    if path not in _SHARED:
+        _SHARED[path] = Cache(path)
+    return _SHARED[path]
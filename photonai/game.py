@@ -2,31 +2,113 @@
 '''
 
 
-from . import world, util
+from . import world, util, physics, records, timing, bot
 import numpy as np
 import itertools as it
+import collections.abc
+import concurrent.futures
 import logging
+import time
 
 
-def _is_collision(subject, others):
+def _is_collision(subject, others, dt=None):
     '''Test for collisions.
 
     subject -- a (subclass of a) world.Body instance to test
 
     others -- a list of world.Body instances to test against
 
+    dt -- if not None, test for "swept" collisions at any time during a step
+    of this duration (assuming constant velocity), rather than only at the
+    current positions (so fast objects cannot pass through each other)
+
     returns -- `True` if the subject has collided with any object in the
     list 'others'.
 
     '''
     for other in others:
         if other is not subject:
-            d_sq = ((other.position - subject.position) ** 2).sum()
+            relative = other.position - subject.position
+            if dt is None:
+                d_sq = (relative ** 2).sum()
+            else:
+                d_sq = physics.swept_distance_sq(
+                    relative, dt * (other.velocity - subject.velocity))
             if d_sq < (subject.radius + other.radius) ** 2:
                 return True
     return False
 
 
+class _Grid:
+    '''A uniform grid "broadphase" over the world's space, rebuilt each step
+    to find candidates for `_is_collision`.
+
+    Ships & planets are added to every cell overlapped by their bounding box,
+    pellets (which have zero radius) to a single cell. Positions outside the
+    space (e.g. pellets that have left the world, or planets on the edge) are
+    clamped into the edge cells, so the candidates are always a superset of
+    the objects that can collide.
+
+    N.B. ships wrap their position around the world (so are always inside the
+    grid), but collisions are not tested across the wrapped edge, so neither
+    are grid cells.
+
+    For swept collisions (`dt` is not None), objects are added to every cell
+    overlapped by the bounding box of their motion over the step.
+    '''
+    def __init__(self, world_, cell_size=10.0, dt=None):
+        self._cell_size = cell_size
+        self._dt = dt
+        self._shape = np.maximum(
+            1, np.ceil(world_.space.dimensions / cell_size).astype(int))
+        self._bodies = {}
+        self._pellets = {}
+        for objects in [world_.planets, world_.ships]:
+            for obj in objects.values():
+                for cell in self._cells(obj):
+                    self._bodies.setdefault(cell, []).append(obj)
+        for obj in world_.pellets.values():
+            if dt is None:
+                self._pellets.setdefault(self._cell(obj.position), []) \
+                             .append(obj)
+            else:
+                for cell in self._cells(obj):
+                    self._pellets.setdefault(cell, []).append(obj)
+
+    def _cell(self, position):
+        x, y = np.clip((position // self._cell_size).astype(int),
+                       0, self._shape - 1)
+        return (x, y)
+
+    def _cells(self, body):
+        low, high = body.position, body.position
+        if self._dt is not None:
+            end = body.position + self._dt * body.velocity
+            low, high = np.minimum(low, end), np.maximum(high, end)
+        x0, y0 = self._cell(low - body.radius)
+        x1, y1 = self._cell(high + body.radius)
+        return [(x, y)
+                for x in range(x0, x1 + 1)
+                for y in range(y0, y1 + 1)]
+
+    def candidates(self, subject):
+        '''Find the objects that could collide with `subject`.
+
+        subject -- a world.Ship or world.Pellet
+
+        returns -- a collection of objects, possibly including `subject`
+        itself (pellets are never candidates for other pellets)
+        '''
+        if isinstance(subject, world.Pellet) and self._dt is None:
+            return self._bodies.get(self._cell(subject.position), ())
+        result = set()
+        for cell in self._cells(subject):
+            result.update(self._bodies.get(cell, ()))
+            if not isinstance(subject, world.Pellet):
+                result.update(self._pellets.get(cell, ()))
+        return result
+
+
 class _Destroy(Exception):
     '''Raised when an object should be destroyed.
     '''
@@ -46,7 +128,8 @@ def _sanitize(control, low, high):
         return 0
 
 
-def _move_body(subject, world_, control, dt):
+def _move_body(subject, world_, control, dt, grid=None, gravity=None,
+               swept=False):
     '''Compute the new body state of the subject.
 
     subject -- a world {Ship, Pellet, Planet}
@@ -56,12 +139,22 @@ def _move_body(subject, world_, control, dt):
     control -- Control.STATE to use to update a Ship
 
     dt -- timestep
+
+    grid -- a `_Grid` for world_, to find collision candidates (otherwise
+    test against every object)
+
+    gravity -- acceleration of the subject due to gravity (see
+    `_gravity`), or None if there is no gravity
+
+    swept -- test for collisions over the whole step (see `_is_collision`)
     '''
 
     # 1. Test for collisions - except planets, which cannot collide
-    if (isinstance(subject, (world.Ship, world.Pellet)) and
-            _is_collision(subject, world_.objects.values())):
-        raise _Destroy()
+    if isinstance(subject, (world.Ship, world.Pellet)):
+        others = (world_.objects.values() if grid is None else
+                  grid.candidates(subject))
+        if _is_collision(subject, others, dt=dt if swept else None):
+            raise _Destroy()
 
     # 2. Compute the new position & velocity
     accel = util.Vector.zero()
@@ -70,14 +163,8 @@ def _move_body(subject, world_, control, dt):
         forward = subject.max_thrust * _sanitize(control['thrust'], 0, 1)
         accel += forward * util.direction(subject.orientation)
 
-    # (massless objects experience no gravity)
-    if subject.mass != 0:
-        for other in world_.objects.values():
-            if other is not subject:
-                relative = other.position - subject.position
-                accel += (
-                    world_.space.gravity * other.mass / (relative ** 2).sum()
-                ) * relative
+    if gravity is not None:
+        accel += gravity
 
     new_velocity = subject.velocity + dt * accel
 
@@ -90,9 +177,9 @@ def _move_body(subject, world_, control, dt):
         new_position = new_position % world_.space.dimensions
 
     # Pellets are auto-destroyed when out-of-bounds (for efficiency)
-    if isinstance(subject, world.Pellet) and \
-       np.any(new_position < util.Vector.zero()) and \
-       np.any(world_.space.dimensions <= new_position):
+    if isinstance(subject, world.Pellet) and (
+            np.any(new_position < util.Vector.zero()) or
+            np.any(world_.space.dimensions <= new_position)):
         raise _Destroy
 
     # 3. Compute the new orientation
@@ -107,6 +194,75 @@ def _move_body(subject, world_, control, dt):
                 orientation=new_orientation)
 
 
+def _gravity(world_, theta=None, drift=0.0, kinematic_planets=False):
+    '''Compute the acceleration due to gravity of all objects in the world,
+    in a single vectorized pass.
+
+    Massless objects (pellets) experience no gravity, and exert none.
+
+    world_ -- the world to compute gravity for
+
+    theta -- if not None, use the Barnes-Hut approximation with this
+    accuracy parameter (see `photonai.physics.gravity_barnes_hut`)
+
+    drift -- if nonzero, compute gravity at the positions after drifting at
+    constant velocity for this time (see `INTEGRATORS`)
+
+    kinematic_planets -- if True, don't compute the acceleration of planets
+
+    returns -- a dict of {ID: acceleration} for all massive objects
+    '''
+    # (N.B. in ID order, as planets are created before ships)
+    massive = [(id, obj)
+               for objects in [world_.planets, world_.ships]
+               for id, obj in objects.items()
+               if obj.mass != 0]
+    if not massive:
+        return {}
+    position = np.array([obj.position for _, obj in massive])
+    if drift:
+        position += drift * np.array([obj.velocity for _, obj in massive])
+    targets = None
+    if kinematic_planets:
+        targets = np.array([n for n, (_, obj) in enumerate(massive)
+                            if not isinstance(obj, world.Planet)],
+                           dtype=int)
+    accel = physics.gravity(
+        position,
+        np.array([obj.mass for _, obj in massive]),
+        world_.space.gravity,
+        theta=theta,
+        targets=targets)
+    if targets is not None:
+        massive = [massive[n] for n in targets]
+    return {id: a for (id, _), a in zip(massive, accel)}
+
+
+# Integration schemes, mapping the name to the fraction of the timestep that
+# bodies drift before computing gravity (both then update `v' = v + dt a` &
+# `p' = p + dt (v + v') / 2`)
+INTEGRATORS = dict(
+    # gravity at the start of the step (first order)
+    euler=0.0,
+    # "drift-kick-drift" leapfrog, with gravity at the midpoint of the step
+    # (second order & symplectic, so orbits are stable at larger timesteps)
+    leapfrog=0.5,
+)
+
+
+def energy(world_):
+    '''Compute the total energy of the massive bodies in a world (see
+    `photonai.physics.energy`), a diagnostic for integration error (it is
+    conserved when there are no ships thrusting or colliding).
+    '''
+    objects = list(world_.objects.values())
+    return physics.energy(
+        np.array([obj.position for obj in objects]).reshape(-1, 2),
+        np.array([obj.velocity for obj in objects]).reshape(-1, 2),
+        np.array([obj.mass for obj in objects], dtype=np.float),
+        world_.space.gravity)
+
+
 def _update_weapon(weapon, control_fire, dt):
     '''Compute the update from a weapon - update temperature & reload,
     and return whether the weapon is actually able to fire.
@@ -119,7 +275,7 @@ def _update_weapon(weapon, control_fire, dt):
 
     returns -- Weapon.STATE new state of the weapon
     '''
-    reload = max(0, weapon.reload - dt)
+    reload = max(0.0, weapon.reload - dt)
     # Calculate the decay ratio needed to get the time spent above
     # max_temperature to == weapon.temperature_decay
     mr = weapon.max_temperature / (weapon.max_temperature + 1)
@@ -169,96 +325,246 @@ def _fire_pellet(ship, body_state):
 class Simulator:
     '''A simulator computes a single step, based on a world
     (which should be updated externally).
+
+    barnes_hut -- if not None, approximate gravity using Barnes-Hut with this
+    accuracy parameter, "theta" (see `photonai.physics.gravity_barnes_hut`)
+
+    headless -- not supported (see `photonai.engine.Engine`)
+
+    swept -- if True, test for collisions at any time during each step, so
+    that pellets & fast ships cannot pass through other objects, even with a
+    large step_duration (see `_is_collision`)
+
+    integrator -- name of the integration scheme (see `INTEGRATORS`)
+
+    ephemerides -- if not None, a `photonai.ephemeris.Cache`, to use
+    kinematic planets (which move along a precomputed trajectory, ignoring
+    the gravity of ships)
     '''
-    def __init__(self, world, step_duration, object_id_gen):
+    def __init__(self, world, step_duration, object_id_gen, barnes_hut=None,
+                 headless=False, swept=False, integrator='euler',
+                 ephemerides=None):
+        if headless:
+            raise ValueError('Simulator does not support headless mode'
+                             ' - use photonai.engine.Engine')
+        if integrator not in INTEGRATORS:
+            raise ValueError('Unknown integrator %r' % integrator)
         self._world = world
         self._step_duration = step_duration
         self._object_id_gen = object_id_gen
+        self._barnes_hut = barnes_hut
+        self._swept = swept
+        self._drift = INTEGRATORS[integrator] * step_duration
+        self._ephemerides = ephemerides
+        self._ephemeris = None
+        self._grid = None
+        self._gravity = {}
+        self._planets = {}
+
+    def _planet_states(self):
+        '''Look up the next state of all planets in the ephemeris.
+
+        returns -- dict of {ID: (position, velocity)}
+        '''
+        planets = list(self._world.planets.items())
+        if self._ephemeris is None:
+            self._ephemeris = (self._ephemerides(
+                np.array([obj.position for _, obj in planets]).reshape(-1, 2),
+                np.array([obj.velocity for _, obj in planets]).reshape(-1, 2),
+                np.array([obj.mass for _, obj in planets], dtype=np.float),
+                self._world.space.gravity,
+                self._step_duration,
+                drift=self._drift,
+                theta=self._barnes_hut), self._world.clock)
+        ephemeris, start = self._ephemeris
+        position, velocity = ephemeris[self._world.clock + 1 - start]
+        return {id: (p, v)
+                for (id, _), p, v in zip(planets, position, velocity)}
 
     def _update_object(self, id, control):
         obj = self._world.objects[id]
         try:
-            state = dict(body=_move_body(obj,
-                                         world_=self._world,
-                                         control=control,
-                                         dt=self._step_duration))
+            if id in self._planets:
+                position, velocity = self._planets[id]
+                state = dict(body=dict(
+                    position=util.Vector.to_log(position),
+                    velocity=util.Vector.to_log(velocity),
+                    orientation=obj.orientation))
+            else:
+                state = dict(body=_move_body(obj,
+                                             world_=self._world,
+                                             control=control,
+                                             dt=self._step_duration,
+                                             grid=self._grid,
+                                             gravity=self._gravity.get(id),
+                                             swept=self._swept))
 
             if isinstance(obj, world.Ship):
+                kind = 'ship_state'
                 state['controller'] = control
                 state['weapon'] = _update_weapon(obj.weapon,
                                                  bool(control['fire']),
                                                  dt=self._step_duration)
                 if state['weapon']['fired']:
                     yield dict(id=next(self._object_id_gen),
+                               kind='pellet_create',
                                data=_fire_pellet(obj, state['body']))
 
             elif isinstance(obj, world.Pellet):
+                kind = 'pellet_state'
                 state['time_to_live'] = obj.time_to_live - self._step_duration
                 if state['time_to_live'] <= 0:
                     raise _Destroy()
 
             elif isinstance(obj, world.Planet):
-                pass  # nothing else to update
+                kind = 'planet_state'  # nothing else to update
 
             else:
                 raise ValueError('Unknown object type %s' % type(obj))
 
-            yield dict(id=id, data=state)
+            yield dict(id=id, kind=kind, data=state)
 
         except _Destroy:
-            yield dict(id=id, data=dict())
+            yield dict(id=id, kind='destroy', data=dict())
+
+    def visibility(self):
+        '''Compute the ship visibility matrix for the current world (see
+        `ship_visibility`).
+        '''
+        return ship_visibility(self._world)
 
     def __call__(self, controller_states):
         '''Return a list of events corresponding a single step of the simulation.
         '''
+        self._grid = _Grid(self._world,
+                           dt=self._step_duration if self._swept else None)
+        kinematic_planets = self._ephemerides is not None
+        self._gravity = _gravity(self._world, theta=self._barnes_hut,
+                                 drift=self._drift,
+                                 kinematic_planets=kinematic_planets)
+        if kinematic_planets:
+            self._planets = self._planet_states()
         return [event
                 for id in self._world.objects
                 for event in self._update_object(
                         id, controller_states.get(id))]
 
 
-def _is_obscured(world_, src, dest):
-    '''Only planets count as obscuring vision.
-    '''
-    los = dest.position - src.position
-    los_distance = util.Vector.length(los)
-    los_direction = los / los_distance
-
-    for obj in world_.objects.values():
-        if isinstance(obj, world.Planet):
-            relative = obj.position - src.position
-            d = np.dot(los_direction, relative)
-            if 0 < d and d < los_distance and (
-                    (relative ** 2).sum() < (d ** 2 + obj.radius ** 2)):
-                return True
-    return False
+def ship_visibility(world_):
+    '''Compute which ships can see each other (only planets obscure vision),
+    for all ships at once.
 
+    world_ -- a `photonai.world.World`
 
-def _obscured_ships(world_, from_ship):
-    '''Yield the object IDs of ships that are obscured from this one.
+    returns -- `(ids, visible)`, a list of ship IDs, and a boolean array
+    `visible[i, j]`, true if ship `ids[j]` can be seen from ship `ids[i]`
+    '''
+    ships = list(world_.ships.items())
+    planets = list(world_.planets.values())
+    visible = physics.line_of_sight(
+        np.array([obj.position for _, obj in ships]).reshape(-1, 2),
+        np.array([obj.position for obj in planets]).reshape(-1, 2),
+        np.array([obj.radius for obj in planets]))
+    return [id for id, _ in ships], visible
+
+
+class _EventView(collections.abc.Sequence):
+    '''A read-only view of a list of events, hiding some of them (without
+    copying the list).
     '''
-    for id, obj in world_.objects.items():
-        if isinstance(obj, world.Ship):
-            if obj is not from_ship and _is_obscured(world_, from_ship, obj):
-                yield id
+    __slots__ = ('_events', '_hidden')
 
+    def __init__(self, events, hidden):
+        '''events -- list of events to view
 
-def _remove_ship_updates(step, ids):
-    '''Remove updates pertaining to a certain set of ship IDs.
+        hidden -- sorted list of indices into events, to hide
+        '''
+        self._events = events
+        self._hidden = hidden
+
+    def __len__(self):
+        return len(self._events) - len(self._hidden)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('event index out of range')
+        for hidden in self._hidden:
+            if hidden <= index:
+                index += 1
+            else:
+                break
+        return self._events[index]
+
+    def __iter__(self):
+        start = 0
+        for hidden in self._hidden:
+            yield from it.islice(self._events, start, hidden)
+            start = hidden + 1
+        yield from it.islice(self._events, start, None)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class _IndexedStep:
+    '''A step, with its events indexed by object ID, so that the updates
+    pertaining to a set of ships can be hidden cheaply (see `view`).
     '''
-    ids = set(ids)
-    if len(ids) == 0 and isinstance(step['data'], list):
-        return step
-    else:
-        step = step.copy()
-        # You can always see ship creation and destruction
-        # (done by testing 'max_thrust' & empty-update),
-        # otherwise exclude the obscured ships
-        step['data'] = [d for d in step['data']
-                        if d['id'] not in ids or
-                        'max_thrust' in d['data'] or
-                        len(d['data']) == 0]
-        return step
+    def __init__(self, step, ship_ids):
+        '''step -- a schema.STEP
+
+        ship_ids -- IDs of ships which may be hidden
+        '''
+        self.step = step
+        self._updates = {}
+        if isinstance(step['data'], list):
+            ship_ids = set(ship_ids)
+            for n, event in enumerate(step['data']):
+                # You can always see ship creation and destruction
+                if event['id'] in ship_ids and \
+                   records.kind(event) == 'ship_state':
+                    self._updates.setdefault(event['id'], []).append(n)
+
+    def view(self, hidden_ids):
+        '''Create a view of the step, without updates to some ships.
+
+        hidden_ids -- IDs of ships to exclude
+
+        returns -- a schema.STEP, which shares the events of the original
+        '''
+        data = self.step['data']
+        if hasattr(data, 'hide'):
+            # native events (e.g. `photonai.engine.Events`) can hide updates
+            view = data.hide(hidden_ids)
+        else:
+            hidden = sorted(n for id in hidden_ids
+                            for n in self._updates.get(id, ()))
+            view = _EventView(data, hidden) if hidden else data
+        if view is data:
+            return self.step
+        return dict(clock=self.step['clock'],
+                    duration=self.step['duration'],
+                    data=view)
+
+
+def _submit(bot, request):
+    '''Start a request to a `photonai.bot.Bot` (see `Bot.submit`), or any
+    function of the request.
+
+    returns -- a `concurrent.futures.Future` of the response
+    '''
+    if hasattr(bot, 'submit'):
+        return bot.submit(request)
+    future = concurrent.futures.Future()
+    try:
+        future.set_result(bot(request))
+    except Exception as e:
+        future.set_exception(e)
+    return future
 
 
 class Controllers:
@@ -268,31 +574,76 @@ class Controllers:
         thrust=0.0,
     )
 
-    def __init__(self, world_, id_to_bot):
+    def __init__(self, world_, id_to_bot, visibility=None, metrics=None):
         self._world = world_
         self._id_to_bot = id_to_bot
+        self._visibility = visibility or (lambda: ship_visibility(world_))
+        self._metrics = timing.NULL if metrics is None else metrics
         self.control = {id: Controllers.DEFAULT_STATE
                         for id, bot in id_to_bot.items()}
 
-    def _call_bot(self, id, step):
-        try:
-            return self._id_to_bot[id](step)
-        except Exception as e:
-            logging.error('Bot %d error %r', id, e)
-            del self._id_to_bot[id]
+    def _bot_error(self, id, e):
+        logging.error('Bot %d error %r', id, e)
+        del self._id_to_bot[id]
 
     def __call__(self, step):
-        # Must copy id_to_bot keys (to avoid concurrent modification)
-        for id in list(self._id_to_bot):
-            ship = self._world.objects.get(id)
-            if ship is None:
-                self._call_bot(id, dict(step=step, ship_id=None))
-            else:
-                # obscure vision of other ships
-                ship_step = _remove_ship_updates(
-                    step, _obscured_ships(self._world, ship))
-                control = self._call_bot(id, dict(step=ship_step, ship_id=id))
-                if control is not None:
+        '''Run the bots for a step, updating `control` with their responses.
+        '''
+        self.collect(self.submit(step))
+
+    def submit(self, step):
+        '''Send requests for a step to all bots at once, without waiting for
+        the responses (see `collect`).
+
+        returns -- an opaque pending request, to pass to `collect`
+        '''
+        # Visibility is computed once, for all bots
+        with self._metrics.timer('visibility'):
+            ship_ids, visible = self._visibility()
+            ship_index = {id: n for n, id in enumerate(ship_ids)}
+            indexed_step = _IndexedStep(step, ship_ids)
+        with self._metrics.timer('bots'):
+            start = time.monotonic()
+            futures = {}
+            # Must copy id_to_bot keys (to avoid concurrent modification)
+            for id in list(self._id_to_bot):
+                if id not in ship_index:
+                    request = dict(step=step, ship_id=None)
+                else:
+                    # obscure vision of other ships
+                    ship_step = indexed_step.view(
+                        [other for other, v in zip(
+                            ship_ids, visible[ship_index[id]]) if not v])
+                    request = dict(step=ship_step, ship_id=id)
+                try:
+                    futures[id] = _submit(self._id_to_bot[id], request)
+                except Exception as e:
+                    self._bot_error(id, e)
+        return start, futures, ship_index
+
+    def collect(self, pending):
+        '''Wait for the responses to `submit`, & update `control`.
+
+        The step takes as long as the slowest bot (each bot's `timeout` runs
+        from the same start time, when the requests were submitted).
+        '''
+        start, futures, ship_index = pending
+        with self._metrics.timer('wait'):
+            for id, future in futures.items():
+                timeout = getattr(self._id_to_bot[id], 'timeout', None)
+                if timeout is not None:
+                    timeout = max(0, start + timeout - time.monotonic())
+                try:
+                    control = future.result(timeout)
+                except bot.LateResponse as e:
+                    # the bot keeps its previous control, & may respond in
+                    # time to the next request
+                    logging.warning('Bot %d late %r', id, e)
+                    continue
+                except Exception as e:
+                    self._bot_error(id, e)
+                    continue
+                if id in ship_index and control is not None:
                     self.control[id] = control
 
 
@@ -320,8 +671,7 @@ def stop_when_no_ships():
     '''Stop the game when there are no ships remaining.
     '''
     def cond(world_):
-        if sum(1 for obj in world_.objects.values()
-               if isinstance(obj, world.Ship)) == 0:
+        if len(world_.ships) == 0:
             raise Stop('no ships remaining')
     return cond
 
@@ -331,12 +681,11 @@ def stop_when_one_ship():
     ship.
     '''
     def cond(world_):
-        ships = [obj for obj in world_.objects.values()
-                 if isinstance(obj, world.Ship)]
+        ships = world_.ships
         if len(ships) == 0:
             raise Stop('no ships remaining (draw)')
         elif len(ships) == 1:
-            ship = ships[0]
+            ship, = ships.values()
             winner = dict(name=ship.controller.name,
                           version=ship.controller.version)
             raise Stop('won by %s:v%d' % (winner['name'], winner['version']),
@@ -353,7 +702,147 @@ def stop_when_any(*conditions):
     return cond
 
 
-def run_game(map_spec, controller_bots, stop, step_duration):
+def _aggregate_steps(steps):
+    '''Combine consecutive steps into a single step, which has the same
+    effect on a `photonai.world.World` (keeping only the latest update to
+    each object).
+
+    steps -- list of schema.STEP (with lists of events)
+
+    returns -- a schema.STEP
+    '''
+    if len(steps) == 1:
+        return steps[0]
+    # {id: [create, latest update, destroyed]}, in order of first event
+    objects = collections.OrderedDict()
+    for step in steps:
+        for event in step['data']:
+            kind = records.kind(event)
+            entry = objects.setdefault(event['id'], [None, None, False])
+            if kind == 'destroy':
+                entry[2] = True
+            elif kind.endswith('_create'):
+                entry[0] = event
+            else:
+                entry[1] = event
+    data = []
+    for id, (create, update, destroyed) in objects.items():
+        if destroyed:
+            if create is None:
+                data.append(dict(id=id, kind='destroy', data=dict()))
+        else:
+            data.extend(e for e in (create, update) if e is not None)
+    return dict(clock=steps[-1]['clock'],
+                duration=sum(step['duration'] for step in steps),
+                data=data)
+
+
+class _Game:
+    '''The objects needed for running a single game (see `run_game`).
+
+    control_interval -- number of simulation steps per call to the
+    controllers (which receive a single aggregated step)
+
+    control_lag -- number of simulation steps (0 or 1) before the bots'
+    responses are applied (see `run_game`)
+
+    metrics -- if not None, a `photonai.timing.Metrics` to record the time
+    spent in each phase of the game
+    '''
+    def __init__(self, map_spec, controller_bots, step_duration, simulator,
+                 control_interval=1, control_lag=0, metrics=None):
+        if control_lag not in (0, 1):
+            raise ValueError('Unsupported control_lag %r' % control_lag)
+        if control_interval < 1:
+            raise ValueError('Unsupported control_interval %r' %
+                             control_interval)
+        self.step_duration = step_duration
+        self.control_interval = control_interval
+        self.control_lag = control_lag
+        self.metrics = timing.NULL if metrics is None else metrics
+        self._pending = []
+        self._requests = None
+        self.object_id_gen = it.count()
+        self.world = world.World()
+        self.world.clock = -1  # Advances to zero on first step
+        self.simulator = simulator(self.world, step_duration,
+                                   self.object_id_gen)
+
+        # The initial state
+        planets = [dict(id=next(self.object_id_gen), kind='planet_create',
+                        data=planet)
+                   for planet in map_spec.planets]
+
+        ships = [dict(id=next(self.object_id_gen), kind='ship_create',
+                      data=map_spec.ship(dict(
+                          state=Controllers.DEFAULT_STATE, **controller)))
+                 for controller, _ in controller_bots]
+
+        self.controllers = Controllers(self.world, {
+            ship['id']: bot
+            for ship, (_, bot) in zip(ships, controller_bots)
+        }, visibility=self.simulator.visibility, metrics=self.metrics)
+
+        self.initial_data = [map_spec.space, planets + ships]
+
+    def step(self, data):
+        '''Create a 'step' & update the world & controllers (the initial
+        steps, then every `control_interval` steps).
+        '''
+        step_ = dict(clock=self.world.clock + 1,
+                     duration=self.step_duration,
+                     data=data)
+        with self.metrics.timer('world'):
+            self.world(step_)
+        self._count(step_)
+        # responses to the previous requests were computed while simulating
+        # this step, so are applied from the next step
+        self.finish()
+        if step_['clock'] < len(self.initial_data):
+            self.controllers(step_)
+        else:
+            self._pending.append(step_)
+            if len(self._pending) == self.control_interval:
+                self._control(_aggregate_steps(self._pending))
+                self._pending = []
+        return step_
+
+    def _control(self, step_):
+        if self.control_lag:
+            self._requests = self.controllers.submit(step_)
+        else:
+            self.controllers(step_)
+
+    def finish(self):
+        '''Wait for any outstanding bot requests (with `control_lag`).
+        '''
+        if self._requests is not None:
+            requests, self._requests = self._requests, None
+            self.controllers.collect(requests)
+
+    def _count(self, step_):
+        metrics = self.metrics
+        if metrics is timing.NULL:
+            return
+        metrics.count('objects', len(self.world.objects))
+        metrics.count('pellets', len(self.world.pellets))
+        if not isinstance(step_['data'], dict):
+            # (N.B. headless `photonai.engine.Events` are counted without
+            # creating them)
+            metrics.count('events', len(step_['data']))
+
+    def simulate(self):
+        '''Run the simulator for a single step.
+
+        returns -- the step's event data
+        '''
+        with self.metrics.timer('simulate'):
+            return self.simulator(self.controllers.control)
+
+
+def run_game(map_spec, controller_bots, stop, step_duration,
+             simulator=Simulator, control_interval=1, control_lag=0,
+             metrics=None):
     '''Create an iterable of game updates.
 
     map_spec -- should have properties (space, planets, ship)
@@ -365,42 +854,38 @@ def run_game(map_spec, controller_bots, stop, step_duration):
 
     step_duration -- period of time per step
 
+    simulator -- the simulator class to use (e.g. `Simulator`, or
+    `photonai.engine.Engine`)
+
+    control_interval -- number of simulation steps between calls to the
+    bots (controls are held in between, and bots receive a single step,
+    aggregating all the updates since they were last called)
+
+    control_lag -- a game rule, the number of simulation steps before the
+    bots' responses take effect, 0 or 1 - with 1, the engine simulates step
+    N+1 (using the responses to step N-1) while the bots compute their
+    responses to step N, so that simulation & bots run in parallel. The
+    game is still deterministic, as the engine always waits for the
+    responses before the following step.
+
+    metrics -- if not None, a `photonai.timing.Metrics` to record the time
+    spent in each phase of the game ('simulate', 'world', 'visibility',
+    'bots', 'wait' & 'stop') and counters for each step
+
     returns -- a sequence of log events (according to .schema.STEP)
     by running the game.
 
     '''
-    # Objects needed for running the game
-    object_id_gen = it.count()
-    world_ = world.World()
-    world_.clock = -1  # Advances to zero on first step
-    simulator = Simulator(world_, step_duration, object_id_gen)
-
-    # The initial state
-    planets = [dict(id=next(object_id_gen), data=planet)
-               for planet in map_spec.planets]
-
-    ships = [dict(id=next(object_id_gen),
-                  data=map_spec.ship(dict(state=Controllers.DEFAULT_STATE,
-                                          **controller)))
-             for controller, _ in controller_bots]
-
-    controllers = Controllers(world_, {
-        ship['id']: bot
-        for ship, (_, bot) in zip(ships, controller_bots)
-    })
-
-    # Helper function - create a 'step' & update the simulation state
-    def step(data):
-        step_ = dict(clock=world_.clock + 1,
-                     duration=step_duration,
-                     data=data)
-        world_(step_)
-        controllers(step_)
-        return step_
-
-    # Run the game
-    yield step(map_spec.space)
-    yield step(planets + ships)
-    while True:
-        yield step(simulator(controllers.control))
-        stop(world_)
+    game_ = _Game(map_spec, controller_bots, step_duration, simulator,
+                  control_interval=control_interval, control_lag=control_lag,
+                  metrics=metrics)
+    try:
+        for data in game_.initial_data:
+            yield game_.step(data)
+        while True:
+            yield game_.step(game_.simulate())
+            with game_.metrics.timer('stop'):
+                stop(game_.world)
+    finally:
+        # (so that bots are left ready for another game)
+        game_.finish()
@@ -0,0 +1,247 @@
+'''Vectorized physics kernels, shared by `photonai.game.Simulator` and
+`photonai.engine.Engine`.
+
+Bodies are represented as arrays, `position` of shape `(N, 2)`, `mass` of
+shape `(N,)`.
+'''
+
+import numpy as np
+
+
+def gravity_exact(position, mass, gravity, targets=None):
+    '''Compute the acceleration of every body due to the gravity of all the
+    other bodies (N.B. `a_i = sum_j g m_j (p_j - p_i) / |p_j - p_i|^2`).
+
+    position -- array (N, 2) of positions
+
+    mass -- array (N,) of masses
+
+    gravity -- scalar strength of gravity (`photonai.world.Space.gravity`)
+
+    targets -- if not None, an array (T,) of indices of the only bodies to
+    compute the acceleration of
+
+    returns -- array (N, 2) (or (T, 2)) of accelerations
+    '''
+    if targets is None:
+        relative = position[np.newaxis, :, :] - position[:, np.newaxis, :]
+        d_sq = (relative ** 2).sum(axis=2)
+        # No self-interaction (g m / inf == 0)
+        np.fill_diagonal(d_sq, np.inf)
+    else:
+        relative = (position[np.newaxis, :, :] -
+                    position[targets, np.newaxis, :])
+        d_sq = (relative ** 2).sum(axis=2)
+        d_sq[np.arange(len(targets)), targets] = np.inf
+    scale = gravity * mass / d_sq
+    return (scale[:, :, np.newaxis] * relative).sum(axis=1)
+
+
+def gravity_exact_batch(position, mass, gravity, targets=None):
+    '''Batched `gravity_exact`, for K independent sets of bodies.
+
+    position -- array (K, N, 2) of positions
+
+    mass -- array (K, N) of masses (bodies with zero mass exert no force, so
+    may be used as padding)
+
+    gravity -- array (K,) of strengths of gravity
+
+    targets -- if not None, an array (K, T) of indices of the only bodies to
+    compute the acceleration of
+
+    returns -- array (K, N, 2) (or (K, T, 2)) of accelerations (undefined for
+    massless bodies, which may coincide with others)
+    '''
+    n = position.shape[1]
+    if targets is None:
+        target_position = position
+        is_self = np.eye(n, dtype=bool)
+    else:
+        rows = np.arange(position.shape[0])[:, np.newaxis]
+        target_position = position[rows, targets]
+        is_self = targets[:, :, np.newaxis] == np.arange(n)
+    relative = (position[:, np.newaxis, :, :] -
+                target_position[:, :, np.newaxis, :])
+    d_sq = (relative ** 2).sum(axis=3)
+    # No self-interaction & no force from massless bodies
+    source = (mass != 0)[:, np.newaxis, :] & ~is_self
+    d_sq = np.where(source, d_sq, np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = (gravity[:, np.newaxis, np.newaxis] * mass[:, np.newaxis, :] /
+                 d_sq)
+        return (scale[:, :, :, np.newaxis] * relative).sum(axis=2)
+
+
+def energy(position, velocity, mass, gravity):
+    '''Compute the total energy of a set of bodies (kinetic, plus the
+    potential `g m_i m_j log |p_i - p_j|` of each pair, which matches the
+    force law of `gravity_exact`).
+
+    This is conserved by the motion of bodies under gravity alone, so its
+    drift over a simulation is a diagnostic of integration error.
+
+    returns -- scalar energy
+    '''
+    kinetic = 0.5 * (mass * (velocity ** 2).sum(axis=1)).sum()
+    massive = np.flatnonzero(mass != 0)
+    i, j = np.triu_indices(len(massive), k=1)
+    i, j = massive[i], massive[j]
+    distance = np.sqrt(((position[i] - position[j]) ** 2).sum(axis=1))
+    potential = (gravity * mass[i] * mass[j] * np.log(distance)).sum()
+    return kinetic + potential
+
+
+def _expand(subject, parent, child_parent):
+    '''Expand a list of (subject, parent) pairs into a list of
+    (subject, child) pairs, where `child_parent[child] == parent`.
+    '''
+    order = np.argsort(child_parent, kind='mergesort')
+    nchildren = np.bincount(child_parent, minlength=parent.max() + 1)
+    starts = np.cumsum(nchildren) - nchildren
+
+    repeats = nchildren[parent]
+    total = repeats.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(repeats) - repeats,
+                                           repeats)
+    return (np.repeat(subject, repeats),
+            order[np.repeat(starts[parent], repeats) + offsets])
+
+
+def _accumulate(accel, subject, relative, scale):
+    for d in range(2):
+        accel[:, d] += np.bincount(subject,
+                                   weights=scale * relative[:, d],
+                                   minlength=len(accel))
+
+
+def gravity_barnes_hut(position, mass, gravity, theta, max_depth=16):
+    '''Approximate `gravity_exact` using a Barnes-Hut quadtree.
+
+    A tree cell of width `s` at distance `d` from a body is treated as a
+    single point mass (at its centre of mass) if `s / d < theta`, otherwise it
+    is opened & its children are considered. The traversal is vectorized over
+    all (body, cell) pairs at each level of the tree.
+
+    theta -- accuracy parameter (`0` for an exact result, typically `0.5`)
+
+    max_depth -- maximum depth of the quadtree (bodies which still share a
+    cell at this depth interact directly)
+
+    returns -- array (N, 2) of accelerations
+    '''
+    n = len(mass)
+    accel = np.zeros((n, 2))
+    if n == 0:
+        return accel
+
+    # 1. Build the tree - one uniform grid per level, keeping only occupied
+    # cells (`body_cell[level][i]` is the index of the cell containing body i)
+    origin = position.min(axis=0)
+    size = (position.max(axis=0) - origin).max() or 1.0
+    scaled = (position - origin) / size
+    body_cell, cell_mass, cell_com, cell_count = [], [], [], []
+    for level in range(max_depth + 1):
+        k = 2 ** level
+        ij = np.minimum((scaled * k).astype(int), k - 1)
+        _, cell = np.unique(ij[:, 0] * k + ij[:, 1], return_inverse=True)
+        m = np.bincount(cell, weights=mass)
+        body_cell.append(cell)
+        cell_mass.append(m)
+        cell_com.append(np.stack(
+            [np.bincount(cell, weights=mass * position[:, d]) for d in (0, 1)],
+            axis=1) / m[:, np.newaxis])
+        cell_count.append(np.bincount(cell))
+        if cell_count[-1].max() == 1:
+            break
+
+    # 2. Traverse the tree for every body at once
+    subject = np.arange(n)
+    cell = np.zeros(n, dtype=int)
+    for level in range(len(body_cell)):
+        relative = cell_com[level][cell] - position[subject]
+        d_sq = (relative ** 2).sum(axis=1)
+        inside = body_cell[level][subject] == cell
+        leaf = cell_count[level][cell] == 1
+        accept = ~inside & (leaf |
+                            ((size / 2 ** level) ** 2 < theta ** 2 * d_sq))
+        _accumulate(accel, subject[accept], relative[accept],
+                    gravity * cell_mass[level][cell[accept]] / d_sq[accept])
+
+        # Open all other cells (except a leaf containing only the subject)
+        keep = ~accept & ~(inside & leaf)
+        subject, cell = subject[keep], cell[keep]
+        if len(subject) == 0:
+            break
+        if level + 1 < len(body_cell):
+            child_parent = np.zeros(len(cell_count[level + 1]), dtype=int)
+            child_parent[body_cell[level + 1]] = body_cell[level]
+            subject, cell = _expand(subject, cell, child_parent)
+
+    # 3. Any remaining cells (beyond max_depth) interact body-by-body
+    if len(subject):
+        subject, other = _expand(subject, cell, body_cell[-1])
+        keep = subject != other
+        subject, other = subject[keep], other[keep]
+        relative = position[other] - position[subject]
+        _accumulate(accel, subject, relative,
+                    gravity * mass[other] / (relative ** 2).sum(axis=1))
+    return accel
+
+
+def gravity(position, mass, g, theta=None, targets=None):
+    '''Compute the acceleration of every body (or just `targets`) due to
+    gravity, either exactly (if `theta` is `None`), or using
+    `gravity_barnes_hut`.
+    '''
+    if theta is None:
+        return gravity_exact(position, mass, g, targets=targets)
+    accel = gravity_barnes_hut(position, mass, g, theta)
+    return accel if targets is None else accel[targets]
+
+
+def swept_distance_sq(relative, motion):
+    '''Compute the minimum squared distance between two points, moving
+    linearly over a step ("swept" collision testing).
+
+    relative -- array (..., 2) of relative positions at the start of the step
+
+    motion -- array (..., 2) of the change in relative position over the step
+
+    returns -- array (...) of minimum squared distances
+    '''
+    motion_sq = (motion ** 2).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(-(relative * motion).sum(axis=-1) / motion_sq, 0, 1)
+    t = np.where(motion_sq == 0, 0.0, t)
+    return ((relative + t[..., np.newaxis] * motion) ** 2).sum(axis=-1)
+
+
+def line_of_sight(position, planet_position, planet_radius):
+    '''Compute which bodies can see each other, where only planets obscure
+    vision.
+
+    position -- array (N, 2) of positions of the bodies (e.g. ships)
+
+    planet_position -- array (P, 2) of positions of planets
+
+    planet_radius -- array (P,) of radii of planets
+
+    returns -- boolean array (N, N), where `visible[i, j]` is true if body j
+    can be seen from body i
+    '''
+    los = position[np.newaxis, :, :] - position[:, np.newaxis, :]
+    los_distance = np.sqrt((los ** 2).sum(axis=2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        los_direction = los / los_distance[:, :, np.newaxis]
+
+    # relative[i, p] is the position of planet p relative to body i
+    relative = planet_position[np.newaxis, :, :] - position[:, np.newaxis, :]
+    # d[i, j, p] is the distance along the line i->j closest to planet p
+    d = (los_direction[:, :, np.newaxis, 0] * relative[:, np.newaxis, :, 0] +
+         los_direction[:, :, np.newaxis, 1] * relative[:, np.newaxis, :, 1])
+    obscured = ((0 < d) &
+                (d < los_distance[:, :, np.newaxis]) &
+                ((relative ** 2).sum(axis=2)[:, np.newaxis, :] <
+                 d ** 2 + planet_radius ** 2))
+    return ~obscured.any(axis=2)
@@ -0,0 +1,435 @@
+'''Compact records for the object events of `photonai.schema`.
+
+Each record is a read-only mapping, equal to the `photonai.schema.Object.EVENT`
+dict `{id, kind, data}` it represents, but it stores only flat fields - the
+nested `data` dict is created when it is accessed. Consumers that understand
+records skip the dicts entirely - `photonai.world.World` uses `update_world`,
+and `write_step` (used by `photonai.run.AvroWriter` & `photonai.bot`) encodes
+records directly, while `read_step` decodes them.
+'''
+
+import collections.abc
+import struct
+import numpy as np
+import fastavro
+import fastavro.writer
+from . import schema, world
+
+
+# Adapter for the fastavro internals used to encode & decode records
+# directly (which are not public API, so the fastavro version is pinned in
+# requirements.txt - see `test_records.test_fastavro_adapter`)
+
+write_long = fastavro.writer.write_long
+write_float = fastavro.writer.write_float
+write_data = fastavro.writer.write_data
+read_long = fastavro._reader.read_long
+read_float = fastavro._reader.read_float
+read_data = fastavro._reader.read_data
+
+
+class ContainerWriter:
+    '''Writes an Avro container file, with a custom function to encode each
+    datum (c.f. `fastavro.writer.Writer`).
+    '''
+    def __init__(self, fo, schema_, metadata={}, codec='null'):
+        self._writer = fastavro.writer.Writer(
+            fo, schema_, codec=codec, metadata=dict(metadata))
+
+    def append(self, encode, datum):
+        '''Add a datum to the current block (c.f. `Writer.write`).
+
+        encode -- function `encode(fo, datum)`
+
+        returns -- the number of bytes encoded (before compression)
+        '''
+        writer = self._writer
+        start = writer.io.tell()
+        encode(writer.io, datum)
+        size = writer.io.tell() - start
+        writer.block_count += 1
+        if writer.io.tell() >= writer.sync_interval:
+            writer.dump()
+        return size
+
+    def flush(self):
+        '''Write the current block (if any), and flush the file.
+        '''
+        self._writer.flush()
+        self._writer.block_count = 0  # due to a bug in fastavro (PR #64)
+
+
+def _long(n):
+    '''Avro binary encoding of an int or long (zig-zag varint).
+    '''
+    n = (n << 1) ^ (n >> 63)
+    out = bytearray()
+    while n & ~0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+_BODY = struct.Struct('<5f')
+_SHIP = struct.Struct('<5fBffBff')
+_PELLET_STATE = struct.Struct('<6f')
+_PELLET_CREATE = struct.Struct('<8f')
+
+# {kind: schema of the data}
+SCHEMAS = dict(zip(schema.Object.KINDS,
+                   next(field['type']
+                        for field in schema.Object.EVENT['fields']
+                        if field['name'] == 'data')))
+
+# {kind: encoding of the `Object.EVENT` kind & data union branch}, where the
+# enum symbols & data union are in the same order
+_PREFIX = {kind: _long(1) + _long(n) + _long(n)
+           for n, kind in enumerate(schema.Object.KINDS)}
+
+
+def _body(position, velocity, orientation):
+    return dict(position=dict(x=position[0], y=position[1]),
+                velocity=dict(x=velocity[0], y=velocity[1]),
+                orientation=orientation)
+
+
+def _update_body(obj, clock, position, velocity, orientation):
+    obj.update_clock = clock
+    obj.position = np.array(position, dtype=np.float)
+    obj.velocity = np.array(velocity, dtype=np.float)
+    obj.orientation = float(orientation)
+
+
+class Event(collections.abc.Mapping):
+    '''Base class for compact object event records.
+
+    `KIND` -- the `photonai.schema.Object.KIND` (see `kind`)
+    '''
+    __slots__ = ('id',)
+    KIND = None
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        if key == 'kind':
+            return self.KIND
+        if key == 'data':
+            return self.data()
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(('id', 'kind', 'data'))
+
+    def __len__(self):
+        return 3
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def data(self):
+        '''Create the `data` of the schema event.
+        '''
+        raise NotImplementedError
+
+    def encode(self):
+        '''Encode the event as `Object.EVENT`, in Avro binary format.
+
+        returns -- bytes
+        '''
+        raise NotImplementedError
+
+    def update_world(self, world_, clock):
+        '''Apply the event to a `photonai.world.World` (c.f.
+        `photonai.world.World._handle_event`).
+        '''
+        raise NotImplementedError
+
+
+class _BodyEvent(Event):
+    __slots__ = ('position', 'velocity', 'orientation')
+
+    def __init__(self, id, position, velocity, orientation):
+        '''position, velocity -- pairs `[x, y]`
+        '''
+        self.id = id
+        self.position = position
+        self.velocity = velocity
+        self.orientation = orientation
+
+    def _encode_body(self):
+        return _BODY.pack(self.position[0], self.position[1],
+                          self.velocity[0], self.velocity[1],
+                          self.orientation)
+
+
+class PlanetState(_BodyEvent):
+    __slots__ = ()
+    KIND = 'planet_state'
+
+    def data(self):
+        return dict(body=_body(self.position, self.velocity,
+                               self.orientation))
+
+    def encode(self):
+        return _long(self.id) + _PREFIX[self.KIND] + self._encode_body()
+
+    def update_world(self, world_, clock):
+        _update_body(world_.objects[self.id], clock,
+                     self.position, self.velocity, self.orientation)
+
+
+class ShipState(_BodyEvent):
+    __slots__ = ('fired', 'reload', 'temperature', 'controller')
+    KIND = 'ship_state'
+
+    def __init__(self, id, position, velocity, orientation,
+                 fired, reload, temperature, controller):
+        '''controller -- `photonai.schema.Controller.STATE`
+        '''
+        super().__init__(id, position, velocity, orientation)
+        self.fired = fired
+        self.reload = reload
+        self.temperature = temperature
+        self.controller = controller
+
+    def data(self):
+        return dict(body=_body(self.position, self.velocity,
+                               self.orientation),
+                    controller=self.controller,
+                    weapon=dict(fired=self.fired,
+                                reload=self.reload,
+                                temperature=self.temperature))
+
+    def encode(self):
+        controller = self.controller
+        return _long(self.id) + _PREFIX[self.KIND] + _SHIP.pack(
+            self.position[0], self.position[1],
+            self.velocity[0], self.velocity[1],
+            self.orientation,
+            1 if self.fired else 0, self.reload, self.temperature,
+            1 if controller['fire'] else 0,
+            controller['rotate'], controller['thrust'])
+
+    def update_world(self, world_, clock):
+        obj = world_.objects[self.id]
+        weapon = obj.weapon
+        weapon.update_clock = clock
+        weapon.fired = bool(self.fired)
+        weapon.reload = float(self.reload)
+        weapon.temperature = float(self.temperature)
+        controller = obj.controller
+        controller.update_clock = clock
+        controller.fire = bool(self.controller['fire'])
+        controller.rotate = float(self.controller['rotate'])
+        controller.thrust = float(self.controller['thrust'])
+        _update_body(obj, clock,
+                     self.position, self.velocity, self.orientation)
+
+
+class PelletState(_BodyEvent):
+    __slots__ = ('time_to_live',)
+    KIND = 'pellet_state'
+
+    def __init__(self, id, position, velocity, orientation, time_to_live):
+        super().__init__(id, position, velocity, orientation)
+        self.time_to_live = time_to_live
+
+    def data(self):
+        return dict(body=_body(self.position, self.velocity,
+                               self.orientation),
+                    time_to_live=self.time_to_live)
+
+    def encode(self):
+        return _long(self.id) + _PREFIX[self.KIND] + \
+            _PELLET_STATE.pack(self.position[0], self.position[1],
+                               self.velocity[0], self.velocity[1],
+                               self.orientation, self.time_to_live)
+
+    def update_world(self, world_, clock):
+        obj = world_.objects[self.id]
+        obj.time_to_live = float(self.time_to_live)
+        _update_body(obj, clock,
+                     self.position, self.velocity, self.orientation)
+
+
+class PelletCreate(PelletState):
+    '''A new pellet (which always has zero mass & radius).
+    '''
+    __slots__ = ()
+    KIND = 'pellet_create'
+
+    def data(self):
+        return dict(body=dict(mass=0.0, radius=0.0,
+                              state=_body(self.position, self.velocity,
+                                          self.orientation)),
+                    time_to_live=self.time_to_live)
+
+    def encode(self):
+        return _long(self.id) + _PREFIX[self.KIND] + \
+            _PELLET_CREATE.pack(0.0, 0.0,
+                                self.position[0], self.position[1],
+                                self.velocity[0], self.velocity[1],
+                                self.orientation, self.time_to_live)
+
+    def update_world(self, world_, clock):
+        world_.add(self.id, world.Pellet(
+            clock=clock, radius=0.0, mass=0.0,
+            position=np.array(self.position, dtype=np.float),
+            velocity=np.array(self.velocity, dtype=np.float),
+            orientation=float(self.orientation),
+            time_to_live=float(self.time_to_live)))
+
+
+class Destroy(Event):
+    __slots__ = ()
+    KIND = 'destroy'
+
+    def __init__(self, id):
+        self.id = id
+
+    def data(self):
+        return dict()
+
+    def encode(self):
+        return _long(self.id) + _PREFIX[self.KIND]
+
+    def update_world(self, world_, clock):
+        world_.remove(self.id)
+
+
+def infer_kind(data):
+    '''Infer the kind of an event from its data (for old logs, which have no
+    explicit kind).
+
+    returns -- a `photonai.schema.Object.KIND`
+    '''
+    if len(data) == 0:
+        return 'destroy'
+    if 'max_thrust' in data:
+        return 'ship_create'
+    if 'controller' in data:
+        return 'ship_state'
+    if 'time_to_live' in data:
+        return ('pellet_create' if 'radius' in data['body'] else
+                'pellet_state')
+    if 'name' in data:
+        return 'planet_create'
+    return 'planet_state'
+
+
+def kind(event):
+    '''Classify an object event (a record, or a schema dict, which may be
+    from an old log without an explicit kind).
+
+    returns -- a `photonai.schema.Object.KIND`, e.g. 'ship_state'
+    '''
+    if isinstance(event, Event):
+        return event.KIND
+    return event.get('kind') or infer_kind(event['data'])
+
+
+def write_step(fo, step):
+    '''Write a `photonai.schema.STEP` in Avro binary format (the same as
+    `fastavro.writer.write_data`), encoding records directly.
+    '''
+    data = step['data']
+    if isinstance(data, collections.abc.Mapping):
+        write_data(fo, step, schema.STEP)
+        return
+    fo.write(_long(step['clock']))
+    write_float(fo, step['duration'])
+    fo.write(_long(1))  # array branch of the data union
+    if len(data):
+        fo.write(_long(len(data)))
+        for event in data:
+            if isinstance(event, Event):
+                fo.write(event.encode())
+            elif event.get('kind') is not None:
+                # dispatch on the kind, rather than trying each branch of
+                # the data union
+                fo.write(_long(event['id']) + _PREFIX[event['kind']])
+                write_data(fo, event['data'], SCHEMAS[event['kind']])
+            else:
+                write_data(fo, event, schema.Object.EVENT)
+    fo.write(_long(0))
+
+
+def _read_body(fo, struct_, id):
+    values = struct_.unpack(fo.read(struct_.size))
+    return values, (id, values[0:2], values[2:4], values[4])
+
+
+def _read_planet_state(fo, id):
+    _, body = _read_body(fo, _BODY, id)
+    return PlanetState(*body)
+
+
+def _read_ship_state(fo, id):
+    values, body = _read_body(fo, _SHIP, id)
+    return ShipState(*body, fired=values[5] != 0, reload=values[6],
+                     temperature=values[7],
+                     controller=dict(fire=values[8] != 0,
+                                     rotate=values[9], thrust=values[10]))
+
+
+def _read_pellet_state(fo, id):
+    values, body = _read_body(fo, _PELLET_STATE, id)
+    return PelletState(*body, time_to_live=values[5])
+
+
+def _read_event(fo, id, kind):
+    return dict(id=id, kind=kind,
+                data=read_data(fo, SCHEMAS[kind]))
+
+
+def _read_pellet_create(fo, id):
+    start = fo.tell()
+    radius, mass = struct.unpack('<2f', fo.read(8))
+    if radius != 0 or mass != 0:
+        fo.seek(start)
+        return _read_event(fo, id, 'pellet_create')
+    values, body = _read_body(fo, _PELLET_STATE, id)
+    return PelletCreate(*body, time_to_live=values[5])
+
+
+# {kind: function(fo, id) -> event}
+_READERS = dict(
+    ship_state=_read_ship_state,
+    pellet_create=_read_pellet_create,
+    pellet_state=_read_pellet_state,
+    planet_state=_read_planet_state,
+    destroy=lambda fo, id: Destroy(id),
+)
+
+
+def read_step(fo):
+    '''Read a `photonai.schema.STEP` in Avro binary format (the same as
+    `fastavro._reader.read_data`), decoding events as records where possible
+    (as `write_step`).
+
+    fo -- a seekable file, e.g. `io.BytesIO`
+
+    returns -- a schema.STEP, with records & dicts in its list of events
+    '''
+    clock = read_long(fo)
+    duration = read_float(fo)
+    if read_long(fo) == 0:
+        return dict(clock=clock, duration=duration,
+                    data=read_data(fo, schema.Space.CREATE))
+    data = []
+    count = read_long(fo)
+    while count != 0:
+        if count < 0:
+            count = -count
+            read_long(fo)  # block size
+        for _ in range(count):
+            id = read_long(fo)
+            if read_long(fo) != 0:
+                read_long(fo)  # the kind, which matches the data branch
+            kind = schema.Object.KINDS[read_long(fo)]
+            reader = _READERS.get(kind)
+            data.append(_read_event(fo, id, kind) if reader is None else
+                        reader(fo, id))
+        count = read_long(fo)
+    return dict(clock=clock, duration=duration, data=data)
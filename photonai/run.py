@@ -4,20 +4,32 @@
 import click
 import os
 import sys
-import fastavro.writer
 import json
 import contextlib
+import collections.abc
+import functools
 import numpy as np
 import photonai.maps
 import photonai.bot
 import photonai.schema
-from . import game
+from . import game, engine, ephemeris, records, timing
+
+
+ENGINES = dict(
+    reference=game.Simulator,
+    vectorized=engine.Engine,
+)
 
 
 _project_path = os.path.abspath(os.path.join(__file__, '../..'))
 
 
-def load_bot(path, image, timeout):
+def load_bot(path, image, timeout, in_process=False):
+    '''Load a bot script, to run in Docker (or in this process, for trusted
+    bots - see `photonai.bot.InProcessBot`).
+    '''
+    if in_process:
+        return photonai.bot.InProcessBot.load(path, timeout=timeout)
     return photonai.bot.DockerPythonBot(
         os.path.join(os.environ.get('HOST_ROOT'), path),
         image,
@@ -51,46 +63,122 @@ class NothingWriter:
 class AvroWriter:
     '''Write results to an Avro file, careful to flush after terminating with
     an exception.
+
+    metrics -- if not None, a `photonai.timing.Metrics` to count the 'bytes'
+    encoded per step (before compression)
     '''
-    def __init__(self, f):
+    def __init__(self, f, metrics=None):
         self.f = f
+        self.metrics = timing.NULL if metrics is None else metrics
 
     def __call__(self, data):
-        writer = fastavro.writer.Writer(
-            self.f, photonai.schema.STEP, codec='deflate')
+        writer = records.ContainerWriter(
+            self.f, photonai.schema.STEP, codec='deflate',
+            metadata={photonai.schema.VERSION_KEY:
+                      str(photonai.schema.VERSION)})
         try:
             for datum in data:
-                writer.write(datum)
+                self.metrics.count(
+                    'bytes', writer.append(records.write_step, datum))
         finally:
             writer.flush()
 
 
+def _to_json(obj):
+    '''Convert lazy events for `json.dumps` (`photonai.records` & sequences
+    of events, when headless).
+    '''
+    if isinstance(obj, collections.abc.Mapping):
+        return dict(obj)
+    return list(obj)
+
+
 class JsonWriter:
     '''Write results to a json file.
+
+    metrics -- see `AvroWriter`
     '''
-    def __init__(self, f):
+    def __init__(self, f, metrics=None):
         self.f = f
+        self.metrics = timing.NULL if metrics is None else metrics
 
     def __call__(self, data):
         for datum in data:
-            self.f.write(json.dumps(datum) + '\n')
+            line = json.dumps(datum, default=_to_json) + '\n'
+            self.metrics.count('bytes', len(line))
+            self.f.write(line)
+
+
+def _timed(steps, metrics):
+    '''Record the time the consumer (e.g. writer) spends on each step.
+    '''
+    for step in steps:
+        with metrics.timer('write'):
+            yield step
 
 
-def run_game(bots, map, writer, seed, time_limit, step_duration):
+def run_game(bots, map, writer, seed, time_limit, step_duration,
+             control_interval=1, control_lag=0, engine='vectorized',
+             barnes_hut=None,
+             headless=False, swept=False, integrator='euler',
+             kinematic_planets=False, ephemeris_cache=None, metrics=None):
     '''Run a game (randomly but repeatedly set up based on `seed`).
 
     bots -- a list of bots as per photonai.game.run_game
+
+    control_interval -- number of steps between bot updates (see
+    `photonai.game.run_game`)
+
+    control_lag -- number of steps before bot updates take effect (0 or 1,
+    see `photonai.game.run_game`)
+
+    engine -- name of the simulator to use (see `ENGINES`)
+
+    barnes_hut -- accuracy parameter for approximate gravity (or None for
+    exact gravity)
+
+    headless -- only create log events if they are consumed (by the writer,
+    or by bots) - requires the vectorized engine
+
+    swept -- test for collisions over the whole of each step (so that a
+    larger step_duration does not let pellets pass through ships)
+
+    integrator -- name of the integration scheme (see
+    `photonai.game.INTEGRATORS`)
+
+    kinematic_planets -- move planets along precomputed trajectories, shared
+    between games in this process (see `photonai.ephemeris`)
+
+    ephemeris_cache -- if not None, directory to save & load precomputed
+    planet trajectories
+
+    metrics -- if not None, a `photonai.timing.Metrics` to record the time
+    spent in each phase of the game (including the 'write' phase, consuming
+    each step)
     '''
     random = np.random.RandomState(seed)
     map = getattr(photonai.maps, map).Map(random.randint(2 ** 32))
     bots = bots.copy()
     random.shuffle(bots)
+    ephemerides = (ephemeris.shared_cache(ephemeris_cache)
+                   if kinematic_planets else None)
 
     steps = game.run_game(
         map_spec=map,
         controller_bots=bots,
         stop=_stop_condition(len(bots), time_limit),
-        step_duration=step_duration)
+        step_duration=step_duration,
+        control_interval=control_interval,
+        control_lag=control_lag,
+        simulator=functools.partial(ENGINES[engine],
+                                    barnes_hut=barnes_hut,
+                                    headless=headless,
+                                    swept=swept,
+                                    integrator=integrator,
+                                    ephemerides=ephemerides),
+        metrics=metrics)
+    if metrics is not None:
+        steps = _timed(steps, metrics)
     try:
         writer(steps)
     except game.Stop as stop:
@@ -103,12 +191,23 @@ DEFAULT_CONFIG = dict(
     out=None,
     maps=['singleton'],
     step_duration=0.01,
+    control_interval=1,
+    control_lag=0,
+    engine='vectorized',
+    barnes_hut=None,
+    headless=False,
+    swept=False,
+    integrator='euler',
+    kinematic_planets=False,
+    ephemeris_cache=None,
+    profile=False,
     seed=None,
     force=False,
     repeat_bots=1,
     time_limit=60.0,
     timeout=0.1,
     image='douglasorr/photonai',
+    in_process=False,
 )
 
 
@@ -124,6 +223,29 @@ DEFAULT_CONFIG = dict(
               help='names of photonai.maps to select from')
 @click.option('-t', '--step-duration', type=click.FLOAT,
               help='simulation timestep')
+@click.option('-k', '--control-interval', type=click.IntRange(min=1),
+              help='number of simulation steps per bot update')
+@click.option('--control-lag', type=click.IntRange(0, 1),
+              help='number of simulation steps before bot updates take'
+              ' effect (1 simulates while bots run)')
+@click.option('-e', '--engine', type=click.Choice(sorted(ENGINES)),
+              help='simulation engine implementation')
+@click.option('--barnes-hut', type=click.FLOAT,
+              help='approximate gravity, with this accuracy parameter'
+              ' (e.g. 0.5)')
+@click.option('--headless', is_flag=True, default=None,
+              help='only create log events when needed (e.g. no output)')
+@click.option('--swept', is_flag=True, default=None,
+              help='swept collisions (safe for a larger step duration)')
+@click.option('--integrator', type=click.Choice(sorted(game.INTEGRATORS)),
+              help='integration scheme ("leapfrog" is more accurate for'
+              ' orbits, at a larger step duration)')
+@click.option('--kinematic-planets', is_flag=True, default=None,
+              help='planets follow precomputed trajectories (ignoring ships)')
+@click.option('--ephemeris-cache', type=click.Path(file_okay=False),
+              help='directory to cache planet trajectories')
+@click.option('--profile', is_flag=True, default=None,
+              help='print the time spent in each phase of the game')
 @click.option('-s', '--seed', type=click.INT,
               help='random seed to use for map generation')
 @click.option('-f', '--force', is_flag=True,
@@ -134,6 +256,8 @@ DEFAULT_CONFIG = dict(
               help='hard limit on the simulation time for a draw')
 @click.option('-i', '--image', type=click.STRING,
               help='image to use for running bots')
+@click.option('--in-process', is_flag=True, default=None,
+              help='run (trusted) bots in this process, rather than Docker')
 def cli(config, **args):
     '''Run a single competitive game with some bots, and save the log.
     '''
@@ -147,29 +271,44 @@ def cli(config, **args):
             'Output file "%s" already exists - delete to proceed' %
             config['out'])
 
+    if config['ephemeris_cache'] is not None and \
+       not config['kinematic_planets']:
+        raise click.UsageError(
+            '--ephemeris-cache requires --kinematic-planets')
+
+    metrics = timing.Metrics() if config['profile'] else None
+
     with contextlib.ExitStack() as stack:
         if config['out'] is None:
             writer = NothingWriter()
         elif config['out'].endswith('avro'):
-            writer = AvroWriter(stack.enter_context(open(config['out'], 'wb')))
+            writer = AvroWriter(stack.enter_context(open(config['out'], 'wb')),
+                                metrics=metrics)
         else:
-            writer = JsonWriter(stack.enter_context(open(config['out'], 'w')))
+            writer = JsonWriter(stack.enter_context(open(config['out'], 'w')),
+                                metrics=metrics)
 
         bots = [(dict(name=path, version=0),
-                 stack.enter_context(load_bot(path,
-                                              image=config['image'],
-                                              timeout=config['timeout'])))
+                 stack.enter_context(load_bot(
+                     path, image=config['image'], timeout=config['timeout'],
+                     in_process=config['in_process'])))
                 for path in config['bots']
                 for _ in range(config['repeat_bots'])]
 
         map = np.random.RandomState(config['seed']).choice(config['maps'])
 
         result = run_game(bots=bots, writer=writer, map=map,
+                          metrics=metrics,
                           **photonai.config.select(
                               config,
-                              'seed', 'time_limit', 'step_duration'))
+                              'seed', 'time_limit', 'step_duration',
+                              'control_interval', 'control_lag', 'engine',
+                              'barnes_hut', 'headless', 'swept', 'integrator',
+                              'kinematic_planets', 'ephemeris_cache'))
 
         sys.stderr.write('%s\n' % result)
+        if metrics is not None:
+            sys.stderr.write('%s\n' % metrics.report())
         click.echo(json.dumps(result.winner and result.winner['name']))
 
 
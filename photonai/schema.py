@@ -4,6 +4,22 @@
 # N.B. When updating this file, make sure you also update the example
 # data in .tests.test_schema & objects in .world
 
+# Version 1 had no explicit `Object.EVENT` kind (readers must infer it from
+# the data), version 2 adds the kind
+VERSION = 2
+VERSION_KEY = 'photonai.version'
+
+
+def version(metadata):
+    '''Get the schema version of a log.
+
+    metadata -- Avro file header metadata
+
+    returns -- int
+    '''
+    return int(metadata.get(VERSION_KEY, 1))
+
+
 VECTOR = dict(
     type='record',
     name='Vector',
@@ -176,6 +192,16 @@ class Object:
         name='Destroy',
         namespace='photonai.object',
         fields=[])
+    # In the same order as the EVENT data union
+    KINDS = ['ship_create', 'ship_state',
+             'pellet_create', 'pellet_state',
+             'planet_create', 'planet_state',
+             'destroy']
+    KIND = dict(
+        type='enum',
+        name='Kind',
+        namespace='photonai.object',
+        symbols=KINDS)
     EVENT = dict(
         type='record',
         name='Event',
@@ -183,6 +209,8 @@ class Object:
         doc='Records the update of an individual game object',
         fields=[
             dict(name='id', type='int'),
+            dict(name='kind', type=['null', KIND], default=None,
+                 doc='Type of the data (null in old logs)'),
             dict(name='data', type=[
                 # due to slightly broken duck-subtyping, it is safest
                 # to put richest events first
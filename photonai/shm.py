@@ -0,0 +1,242 @@
+'''Shared-memory transport of object states, for bots running on the same host
+(see `photonai.bot.SharedMemoryBot`).
+
+The region is a memory-mapped file, holding a header & two buffers of object
+state rows (double-buffered, alternating per request). Only the state events
+of each step are published here - creation & destruction events (which are
+rare, and carry static data) are still sent through the pipe.
+
+States are copied as whole columns from the arrays of a headless
+`photonai.engine.Engine` (other steps are sent through the pipe), and the bot
+receives `Events`, which applies column views of the region to its world,
+without decoding records.
+'''
+
+import collections.abc
+import mmap
+import os
+import struct
+import tempfile
+import numpy as np
+from . import records
+
+
+# The kinds of state event, indexed by the 'kind' field (the same as the
+# kinds of object in `photonai.engine`)
+KINDS = ('planet_state', 'ship_state', 'pellet_state')
+
+# N.B. floats are single precision, so bots see exactly the same values as
+# if the step were encoded in Avro
+DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('kind', 'u1'),
+    ('position', '<f4', (2,)),
+    ('velocity', '<f4', (2,)),
+    ('orientation', '<f4'),
+    ('time_to_live', '<f4'),
+    ('fired', 'u1'),
+    ('reload', '<f4'),
+    ('temperature', '<f4'),
+    ('fire', 'u1'),
+    ('rotate', '<f4'),
+    ('thrust', '<f4'),
+])
+
+_HEADER = struct.Struct('<Q')
+_HEADER_SIZE = 64
+
+
+def _folder():
+    # /dev/shm is memory-backed on Linux (and can be shared with containers)
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class Region:
+    '''A memory-mapped file of two buffers of object states.
+
+    path -- of the file
+
+    capacity -- maximum number of states in each buffer
+    '''
+    def __init__(self, path, f, capacity):
+        self.path = path
+        self.capacity = capacity
+        self._f = f
+        self._mmap = mmap.mmap(f.fileno(), 0)
+        self._buffers = np.ndarray((2, capacity), dtype=DTYPE,
+                                   buffer=self._mmap, offset=_HEADER_SIZE)
+
+    @classmethod
+    def create(cls, capacity=4096, folder=None):
+        '''Create a new region (the creator should `close(unlink=True)`).
+        '''
+        fd, path = tempfile.mkstemp(prefix='photonai-', suffix='.shm',
+                                    dir=folder or _folder())
+        f = os.fdopen(fd, 'r+b')
+        f.write(_HEADER.pack(capacity).ljust(_HEADER_SIZE, b'\0'))
+        f.truncate(_HEADER_SIZE + 2 * capacity * DTYPE.itemsize)
+        f.flush()
+        return cls(path, f, capacity)
+
+    @classmethod
+    def open(cls, path):
+        '''Open an existing region (created by another process).
+        '''
+        f = open(path, 'r+b')
+        capacity, = _HEADER.unpack(f.read(_HEADER.size))
+        return cls(path, f, capacity)
+
+    def close(self, unlink=False):
+        self._buffers = None
+        self._mmap.close()
+        self._f.close()
+        if unlink:
+            os.unlink(self.path)
+
+    def write(self, buffer, events):
+        '''Publish the state events of a step.
+
+        buffer -- index of the buffer to write (0 or 1)
+
+        events -- the step's events - only a `photonai.engine.Events` (or
+        other events with `columns`) can be published
+
+        returns -- `(n, others)`, the number of states written, and a list
+        of the other events (or `(None, events)` if the states cannot be
+        published, or there are too many to fit in the buffer)
+        '''
+        if not hasattr(events, 'columns'):
+            return None, events
+        blocks, others = events.columns()
+        n = sum(len(block['id']) for block in blocks)
+        if self.capacity < n:
+            return None, events
+        rows = self._buffers[buffer]
+        start = 0
+        for block in blocks:
+            end = start + len(block['id'])
+            for name in DTYPE.names:
+                rows[name][start:end] = block.get(name, 0)
+            start = end
+        return n, others
+
+    def read(self, buffer, n, others):
+        '''Read states written by `write`.
+
+        others -- list of the step's other events (from the pipe)
+
+        returns -- `Events`
+        '''
+        return Events(self._buffers[buffer, :n], others)
+
+
+class Events(collections.abc.Sequence):
+    '''The events of a step, with object states in shared memory.
+
+    Behaves like a list of events (creation events, then states, then
+    destruction events), but state records are only created when first
+    accessed - `photonai.world.World` uses `update_world`, which reads the
+    columns directly.
+
+    `states` -- array (`DTYPE`) of object states - a view of the region, so
+    only valid until the bot responds to the request
+    '''
+    __slots__ = ('states', '_others', '_events')
+
+    def __init__(self, states, others):
+        self.states = states
+        self._others = others
+        self._events = None
+
+    def _split(self):
+        # creation events come first & destruction last, so states are
+        # always applied to objects which exist in the world
+        created = [e for e in self._others if records.kind(e) != 'destroy']
+        destroyed = [e for e in self._others if records.kind(e) == 'destroy']
+        return created, destroyed
+
+    def _get_events(self):
+        if self._events is None:
+            created, destroyed = self._split()
+            self._events = created + _state_records(self.states) + destroyed
+        return self._events
+
+    def __len__(self):
+        return len(self._others) + len(self.states)
+
+    def __getitem__(self, index):
+        return self._get_events()[index]
+
+    def __iter__(self):
+        return iter(self._get_events())
+
+    def __repr__(self):
+        return repr(self._get_events())
+
+    def update_world(self, world_, clock):
+        '''Apply these events to a `photonai.world.World`.
+        '''
+        created, destroyed = self._split()
+        world_(dict(clock=clock, duration=0.0, data=created))
+        states = self.states
+        objects = world_.objects
+        # Copy, so the world does not refer to shared memory
+        position = states['position'].astype(np.float)
+        velocity = states['velocity'].astype(np.float)
+        for i, (id, kind, orientation, time_to_live, fired, reload,
+                temperature, fire, rotate, thrust) in enumerate(zip(
+                    states['id'].tolist(), states['kind'].tolist(),
+                    states['orientation'].tolist(),
+                    states['time_to_live'].tolist(),
+                    states['fired'].tolist(), states['reload'].tolist(),
+                    states['temperature'].tolist(),
+                    states['fire'].tolist(), states['rotate'].tolist(),
+                    states['thrust'].tolist())):
+            obj = objects[id]
+            obj.update_clock = clock
+            obj.position = position[i]
+            obj.velocity = velocity[i]
+            obj.orientation = orientation
+            kind = KINDS[kind]
+            if kind == 'ship_state':
+                weapon = obj.weapon
+                weapon.update_clock = clock
+                weapon.fired = fired != 0
+                weapon.reload = reload
+                weapon.temperature = temperature
+                controller = obj.controller
+                controller.update_clock = clock
+                controller.fire = fire != 0
+                controller.rotate = rotate
+                controller.thrust = thrust
+            elif kind == 'pellet_state':
+                obj.time_to_live = time_to_live
+        world_(dict(clock=clock, duration=0.0, data=destroyed))
+
+
+def _state_records(rows):
+    '''Create `photonai.records` state events from rows of `DTYPE`.
+    '''
+    events = []
+    for (id, kind, position, velocity, orientation, time_to_live, fired,
+         reload, temperature, fire, rotate, thrust) in zip(
+             rows['id'].tolist(), rows['kind'].tolist(),
+             rows['position'].tolist(), rows['velocity'].tolist(),
+             rows['orientation'].tolist(), rows['time_to_live'].tolist(),
+             rows['fired'].tolist(), rows['reload'].tolist(),
+             rows['temperature'].tolist(), rows['fire'].tolist(),
+             rows['rotate'].tolist(), rows['thrust'].tolist()):
+        kind = KINDS[kind]
+        if kind == 'ship_state':
+            events.append(records.ShipState(
+                id, position, velocity, orientation,
+                fired=fired != 0, reload=reload, temperature=temperature,
+                controller=dict(fire=fire != 0, rotate=rotate,
+                                thrust=thrust)))
+        elif kind == 'pellet_state':
+            events.append(records.PelletState(
+                id, position, velocity, orientation, time_to_live))
+        else:
+            events.append(records.PlanetState(
+                id, position, velocity, orientation))
+    return events
@@ -1 +1 @@
-from . import spiral, nothing  # noqa
+from . import spiral, nothing, pause  # noqa
@@ -0,0 +1,22 @@
+import photonai.bot
+import sys
+import time
+
+
+class Bot(photonai.bot.SimpleBot):
+    '''Pauses (e.g. as if garbage collecting) when it first sees its ship,
+    for the number of seconds given on the command line, and otherwise
+    responds with the clock.
+    '''
+    def __init__(self, pause=0.0):
+        super().__init__()
+        self._pause = pause
+
+    def get_control(self, world, ship):
+        time.sleep(self._pause)
+        self._pause = 0.0
+        return self.Control(rotate=float(world.clock))
+
+
+if __name__ == '__main__':
+    Bot(float(sys.argv[1])).run_loop()
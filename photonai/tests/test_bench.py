@@ -0,0 +1,56 @@
+from .. import bench, bot, run
+import json
+import subprocess
+import sys
+import click.testing
+from nose.tools import eq_
+
+
+def test_scenarios():
+    for name, spec in bench.SCENARIOS.items():
+        map_spec = bench._map(spec, seed=100)
+        assert map_spec.space['dimensions']['x'] >= 150
+        if 'nplanets' in spec:
+            eq_(len(map_spec.planets), spec['nplanets'])
+
+
+def test_run_scenario():
+    result = bench.run_scenario('pellets', 20, trace_memory=True)
+    eq_(result['name'], 'pellets')
+    eq_(result['nsteps'], 20)
+    assert 0 < result['steps_per_sec']
+    latency = result['latency_ms']
+    assert latency['p50'] <= latency['p90'] <= latency['p99'] <= \
+        latency['max']
+    assert 0 < result['counters']['pellets']
+    assert 0 < result['peak_traced_mb']
+    eq_(set(result['phases_s']),
+        {'simulate', 'world', 'visibility', 'bots', 'wait', 'stop'})
+
+
+def test_cli():
+    result = click.testing.CliRunner().invoke(
+        bench.cli, ['-s', 'endtime', '-s', 'idle-32', '-n', '5'])
+    eq_(result.exit_code, 0, result.output)
+    # (N.B. output also includes a summary on stderr)
+    output, _ = json.JSONDecoder().raw_decode(
+        result.output[result.output.index('{'):])
+    eq_([s['name'] for s in output['scenarios']], ['endtime', 'idle-32'])
+    eq_(output['config']['steps'], 5)
+
+
+def test_run_bot_latency():
+    for protocol in bot.PROTOCOLS:
+        result = bench.run_bot_latency('ships-2', 20, protocol)
+        eq_(result['protocol'], protocol)
+        eq_(result['nsteps'], 20)
+        assert 0 < result['latency_ms']['p50']
+
+
+def test_import_without_tests():
+    # e.g. in a bot container, `import photonai` should not load the tests
+    loaded = subprocess.check_output(
+        ['env', 'PYTHONPATH=%s' % run._project_path, sys.executable, '-c',
+         'import sys, photonai;'
+         ' print(any(m.startswith("photonai.tests") for m in sys.modules))'])
+    eq_(loaded.strip(), b'False')
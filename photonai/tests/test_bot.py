@@ -1,18 +1,27 @@
-from .. import bot
+from .. import bot, engine, records, world
 from . import bots, test_schema
+from .test_engine import run_steps, attributes
+from .test_records import to_schema
+import concurrent.futures
+import functools
+import io
 import os
 import sys
+import tempfile
+import threading
+import time
 from nose.tools import eq_
 from nose_parameterized import parameterized
 
 
-def subprocess_bot(bot_module):
+def subprocess_bot(bot_module, protocols=bot.PROTOCOLS):
     project_path = os.path.abspath(os.path.join(__file__, '../../..'))
     return bot.SubprocessBot(
         ['env', 'PYTHONPATH=%s' % project_path,
          'python3', bot_module.__file__],
         stderr=sys.stderr,
-        timeout=0.1)
+        timeout=0.1,
+        protocols=protocols)
 
 
 # c.f. bots/nothing.py
@@ -27,6 +36,8 @@ SPIRAL_CONTROL = dict(fire=True, rotate=-1.0, thrust=1.0)
     (lambda: subprocess_bot(bots.nothing), ZERO_CONTROL),
     (lambda: bots.spiral.Bot(), SPIRAL_CONTROL),
     (lambda: subprocess_bot(bots.spiral), SPIRAL_CONTROL),
+    (lambda: subprocess_bot(bots.spiral, protocols=[bot.AVRO_CONTAINER]),
+     SPIRAL_CONTROL),
 ])
 def test_stateless_bot(create, expected_control):
     bot = create()
@@ -49,3 +60,275 @@ def test_stateless_bot(create, expected_control):
         'still zero control to the ship')
 
     bot.close()
+
+
+def play(bot, ship_id=246):
+    '''Play a short game (c.f. `test_stateless_bot`).
+    '''
+    bot(dict(step=dict(clock=0, duration=0.01, data=test_schema.Space.CREATE),
+             ship_id=None))
+    return bot(dict(
+        step=dict(clock=1, duration=0.01,
+                  data=[dict(id=ship_id, data=test_schema.Ship.CREATE)]),
+        ship_id=ship_id))
+
+
+def stuck_bot():
+    # starts, but never responds
+    project_path = os.path.abspath(os.path.join(__file__, '../../..'))
+    return bot.SubprocessBot(
+        ['env', 'PYTHONPATH=%s' % project_path, 'python3', '-c',
+         'import sys, photonai.bot as b, photonai.records as r;'
+         ' r.ContainerWriter(sys.stdout.buffer, b.Bot.RESPONSE).flush();'
+         ' sys.stdin.buffer.read()'],
+        stderr=sys.stderr,
+        timeout=0.1)
+
+
+def test_protocol():
+    for protocols, expected in [(bot.PROTOCOLS, bot.FRAMED),
+                                ([bot.AVRO_CONTAINER], bot.AVRO_CONTAINER),
+                                # no shared memory region to open
+                                ([bot.SHARED_MEMORY], bot.AVRO_CONTAINER)]:
+        with subprocess_bot(bots.spiral, protocols=protocols) as b:
+            eq_(b.protocol, expected)
+            eq_(play(b), SPIRAL_CONTROL)
+
+
+def test_shared_memory_bot():
+    project_path = os.path.abspath(os.path.join(__file__, '../../..'))
+    with bot.SharedMemoryBot(['env', 'PYTHONPATH=%s' % project_path,
+                              'python3', bots.spiral.__file__],
+                             stderr=sys.stderr, timeout=0.1) as b:
+        path = b._region.path
+        eq_(b.protocol, bot.SHARED_MEMORY)
+        eq_(play(b), SPIRAL_CONTROL)
+        eq_(b(dict(step=dict(clock=2, duration=0.01,
+                             data=[dict(id=246, data=test_schema.Ship.STATE)]),
+                   ship_id=246)), SPIRAL_CONTROL)
+    assert not os.path.exists(path)
+
+
+def test_shared_memory_requests():
+    region = bot.shm.Region.create(capacity=256)
+
+    def doorbells(steps):
+        # c.f. `bot.SharedMemoryBot.execute`, then through a pipe
+        for n, step in enumerate(steps):
+            if isinstance(step['data'], dict):
+                doorbell = (None, dict(step=step, ship_id=None))
+            else:
+                nstates, events = region.write(n % 2, step['data'])
+                doorbell = (nstates, dict(step=dict(step, data=events),
+                                          ship_id=None))
+            with io.BytesIO() as f:
+                bot._write_doorbell(f, doorbell)
+                f.seek(0)
+                yield n, bot._doorbell_reader(bot._read_request)(f)
+
+    try:
+        steps = run_steps('endtime', functools.partial(engine.Engine,
+                                                       headless=True),
+                          50, nships=7)
+        # (only headless engine events are published in shared memory)
+        for stream, published in [(steps, True),
+                                  ([to_schema(step) for step in steps],
+                                   False)]:
+            expected_world, actual_world, records_world = \
+                world.World(), world.World(), world.World()
+            for step, (_, request) in zip(stream, bot._shared_memory_requests(
+                    doorbells(stream), region)):
+                with io.BytesIO() as f:
+                    bot._write_request(f, dict(step=step, ship_id=None))
+                    f.seek(0)
+                    expected_world(bot._read_request(f)['step'])
+                data = request['step']['data']
+                if not isinstance(data, dict):
+                    eq_(isinstance(data, bot.shm.Events),
+                        published and isinstance(step['data'], engine.Events))
+                    eq_(len(data), len(list(data)))
+                    data = list(data)
+                records_world(dict(request['step'], data=data))
+                actual_world(request['step'])
+            for w in [actual_world, records_world]:
+                eq_({id: attributes(obj)
+                     for id, obj in expected_world.objects.items()},
+                    {id: attributes(obj) for id, obj in w.objects.items()})
+
+        # hidden ships are not published
+        events = steps[-1]['data']
+        ship = next(e['id'] for e in events
+                    if records.kind(e) == 'ship_state')
+        nstates, _ = region.write(0, events)
+        eq_(region.write(0, events.hide([ship]))[0], nstates - 1)
+        assert ship not in region.read(0, nstates - 1, []).states['id']
+
+    finally:
+        region.close(unlink=True)
+
+    # too many states for the region
+    region = bot.shm.Region.create(capacity=4)
+    try:
+        eq_(region.write(0, events), (None, events))
+    finally:
+        region.close(unlink=True)
+
+
+class SlowBot(bot.Bot):
+    def __call__(self, request):
+        time.sleep(0.05)
+        return None
+
+
+def test_in_process_bot():
+    with bot.InProcessBot.load(bots.spiral.__file__, timeout=0.1) as b:
+        assert isinstance(b.bot, bot.SimpleBot)
+        eq_(play(b), SPIRAL_CONTROL)
+        b.new_game()
+        eq_(play(b, ship_id=135), SPIRAL_CONTROL)
+        assert b.healthy()
+
+    b = bot.InProcessBot(SlowBot(), timeout=0.01)
+    try:
+        b(bot.Bot.NEW_GAME)
+        assert False, 'expected a late response'
+    except bot.LateResponse:
+        pass
+    # (like a subprocess bot, it gets another chance)
+    assert b.healthy()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.py') as f:
+        f.write('import photonai.bot\n')
+        f.flush()
+        try:
+            bot.InProcessBot.load(f.name, timeout=0.1)
+            assert False, 'expected no Bot class'
+        except ValueError:
+            pass
+
+
+def pause_bot(pause, protocols=bot.PROTOCOLS, max_backlog=3):
+    project_path = os.path.abspath(os.path.join(__file__, '../../..'))
+    return bot.SubprocessBot(
+        ['env', 'PYTHONPATH=%s' % project_path,
+         'python3', bots.pause.__file__, str(pause)],
+        stderr=sys.stderr,
+        timeout=0.1,
+        protocols=protocols,
+        max_backlog=max_backlog)
+
+
+def ship_state(clock):
+    return dict(step=dict(clock=clock, duration=0.01,
+                          data=[dict(id=246, data=test_schema.Ship.STATE)]),
+                ship_id=246)
+
+
+def test_late_response():
+    threads = threading.active_count()
+    with pause_bot(0.3) as b:
+        eq_(b.protocol, bot.FRAMED)
+        try:
+            play(b)
+            assert False, 'expected a late response'
+        except bot.LateResponse:
+            pass
+        assert b.healthy()
+        # the late response is discarded, & the bot catches up
+        time.sleep(0.3)
+        eq_(b(ship_state(2))['rotate'], 2.0)
+        eq_(b(ship_state(3))['rotate'], 3.0)
+        assert b.healthy()
+        eq_(threading.active_count(), threads)
+
+    # without sequence numbers, the bot cannot recover
+    with pause_bot(0.3, protocols=[bot.AVRO_CONTAINER]) as b:
+        try:
+            play(b)
+            assert False, 'expected a timeout'
+        except concurrent.futures.TimeoutError as e:
+            assert not isinstance(e, bot.LateResponse)
+        assert not b.healthy()
+
+
+def test_stuck_bot():
+    threads = threading.active_count()
+    with pause_bot(60, max_backlog=2) as b:
+        b(bot.Bot.NEW_GAME)
+        for request in [dict(step=dict(clock=1, duration=0.01, data=[
+                            dict(id=246, data=test_schema.Ship.CREATE)]),
+                             ship_id=246),
+                        ship_state(2)]:
+            try:
+                b(request)
+                assert False, 'expected a late response'
+            except bot.LateResponse:
+                pass
+        assert not b.healthy()
+        try:
+            b(ship_state(3))
+            assert False, 'expected a stuck bot'
+        except RuntimeError:
+            pass
+        # no threads are left waiting for the bot
+        eq_(threading.active_count(), threads)
+
+
+def test_new_game():
+    b = bots.spiral.Bot()
+    eq_(play(b), SPIRAL_CONTROL)
+    b.new_game()
+    eq_(play(b, ship_id=135), SPIRAL_CONTROL)
+    # ship 246 was from the previous game
+    eq_(list(b._world.objects), [135])
+
+    with subprocess_bot(bots.spiral) as b:
+        eq_(play(b), SPIRAL_CONTROL)
+        b.new_game()
+        eq_(play(b, ship_id=135), SPIRAL_CONTROL)
+        assert b.healthy()
+    assert not b.healthy()
+
+
+def test_bot_pool():
+    created = []
+
+    def create(module):
+        def create():
+            created.append(subprocess_bot(module))
+            return created[-1]
+        return create
+
+    with bot.BotPool(capacity=2) as pool:
+        # reuse a bot for the same key
+        for _ in range(2):
+            with pool.get('spiral', create(bots.spiral)) as b:
+                eq_(play(b), SPIRAL_CONTROL)
+        eq_(len(created), 1)
+        eq_(len(pool), 1)
+
+        # least-recently-used bots are closed
+        with pool.get('nothing', create(bots.nothing)) as b:
+            eq_(play(b), ZERO_CONTROL)
+        with pool.get('nothing2', create(bots.nothing)):
+            pass
+        eq_(len(created), 3)
+        eq_(len(pool), 2)
+        assert not created[0].healthy()
+        with pool.get('spiral', create(bots.spiral)) as b:
+            assert b is created[3]
+
+        # misbehaving bots are evicted
+        with pool.get('stuck', stuck_bot) as b:
+            try:
+                play(b)
+                assert False, 'expected a timeout'
+            except Exception:
+                pass
+        assert not b.healthy()
+        eq_(len(pool), 2)
+        with pool.get('stuck', create(bots.nothing)) as b2:
+            assert b2 is not b
+
+    # closing the pool closes idle bots
+    assert not any(b.healthy() for b in created)
@@ -0,0 +1,493 @@
+from .. import engine, game, maps, world, ephemeris
+from . import bots
+import itertools as it
+import functools
+import numpy as np
+from nose_parameterized import parameterized
+from nose.tools import eq_
+
+
+all_maps = [
+    ('empty',),
+    ('singleton',),
+    ('binary',),
+    ('orbital',),
+    ('endtime',),
+]
+
+
+def spiral_bots(nships):
+    return [(dict(name='spiral%d' % n, version=0), bots.spiral.Bot())
+            for n in range(nships)]
+
+
+def run_steps(map_name, simulator, nsteps, nships=3, step_duration=0.01):
+    return list(it.islice(
+        game.run_game(map_spec=getattr(maps, map_name).Map(100),
+                      controller_bots=spiral_bots(nships),
+                      stop=game.stop_after(1e9),
+                      step_duration=step_duration,
+                      simulator=simulator),
+        nsteps))
+
+
+@parameterized(all_maps)
+def test_same_as_simulator(map_name):
+    expected = run_steps(map_name, game.Simulator, 200)
+    actual = run_steps(map_name, engine.Engine, 200)
+    eq_(len(expected), len(actual))
+    for expected_step, actual_step in zip(expected, actual):
+        eq_(expected_step, actual_step)
+
+
+def test_same_as_simulator_barnes_hut():
+    expected = run_steps('endtime', functools.partial(
+        game.Simulator, barnes_hut=0.5), 100)
+    actual = run_steps('endtime', functools.partial(
+        engine.Engine, barnes_hut=0.5), 100)
+    eq_(expected, actual)
+
+
+@parameterized([
+    ('endtime', 0.01),
+    ('orbital', 0.05),
+])
+def test_same_as_simulator_swept(map_name, step_duration):
+    expected = run_steps(map_name, functools.partial(
+        game.Simulator, swept=True), 100, nships=7,
+        step_duration=step_duration)
+    actual = run_steps(map_name, functools.partial(
+        engine.Engine, swept=True), 100, nships=7,
+        step_duration=step_duration)
+    eq_(expected, actual)
+
+
+def test_same_as_simulator_leapfrog():
+    expected = run_steps('binary', functools.partial(
+        game.Simulator, integrator='leapfrog'), 100)
+    actual = run_steps('binary', functools.partial(
+        engine.Engine, integrator='leapfrog'), 100)
+    eq_(expected, actual)
+
+
+@parameterized([
+    ('orbital',),
+    ('endtime',),
+])
+def test_kinematic_planets(map_name):
+    cache = ephemeris.Cache()
+    kinematic = functools.partial(engine.Engine, ephemerides=cache)
+    # Without ships, the same as simulating the planets
+    eq_(run_steps(map_name, engine.Engine, 100, nships=0),
+        run_steps(map_name, kinematic, 100, nships=0))
+    eq_(len(cache), 1)
+
+    expected = run_steps(map_name, functools.partial(
+        game.Simulator, ephemerides=cache), 100, nships=7)
+    actual = run_steps(map_name, kinematic, 100, nships=7)
+    eq_(expected, actual)
+    eq_(len(cache), 1)
+
+
+def energy_drift(map_name, integrator, step_duration, duration=5.0):
+    '''Relative range of total energy, for a map without ships.
+    '''
+    world_ = world.World()
+    energy = []
+    for step in it.islice(game.run_game(
+            getattr(maps, map_name).Map(100), [],
+            stop=game.stop_after(1e9),
+            step_duration=step_duration,
+            simulator=functools.partial(engine.Engine,
+                                        integrator=integrator)),
+            2 + int(duration / step_duration)):
+        world_(step)
+        if 1 <= world_.clock:
+            energy.append(game.energy(world_))
+    return (max(energy) - min(energy)) / abs(energy[0])
+
+
+@parameterized([
+    ('orbital',),
+    ('binary',),
+])
+def test_energy_drift(map_name):
+    euler = energy_drift(map_name, 'euler', 0.01)
+    leapfrog = energy_drift(map_name, 'leapfrog', 0.05)
+    assert leapfrog < euler / 1000, \
+        'leapfrog at a 5x timestep should conserve energy better' \
+        ' (%.3g, vs. %.3g)' % (leapfrog, euler)
+    assert energy_drift(map_name, 'euler', 0.05) > euler, \
+        'euler drift should increase with timestep'
+
+
+def test_state_load():
+    steps = run_steps('orbital', engine.Engine, 20)
+    world_ = world.World()
+    for step in steps:
+        world_(step)
+
+    state = engine.State.load(world_, 0.01)
+    eq_(len(state), len(world_.objects))
+    eq_(state.id.tolist(), list(world_.objects))
+    for i, obj in enumerate(world_.objects.values()):
+        np.testing.assert_equal(state.position[i], obj.position)
+        eq_(state.kind[i] == engine.SHIP, isinstance(obj, world.Ship))
+
+
+def test_visibility():
+    world_ = world.World()
+    for step in run_steps('endtime', engine.Engine, 50, nships=7):
+        world_(step)
+    expected_ids, expected_visible = game.ship_visibility(world_)
+    ids, visible = engine.Engine(world_, 0.01, None).visibility()
+    eq_(expected_ids, ids)
+    np.testing.assert_equal(expected_visible, visible)
+    assert not visible.all(), 'some ships should be obscured'
+
+
+def attributes(item):
+    '''All attributes of a `photonai.world.Item`, for comparison.
+    '''
+    if isinstance(item, np.ndarray):
+        return item.tolist()
+    if not isinstance(item, world.Item):
+        return item
+    return (type(item), {k: attributes(getattr(item, k))
+                         for cls in type(item).__mro__
+                         for k in getattr(cls, '__slots__', ())})
+
+
+def test_headless():
+    expected = run_steps('endtime', engine.Engine, 100, nships=7)
+    actual = run_steps('endtime', functools.partial(
+        engine.Engine, headless=True), 100, nships=7)
+    assert any(isinstance(step['data'], engine.Events) for step in actual)
+    # counted without creating events
+    eq_([len(step['data']) for step in expected],
+        [len(step['data']) for step in actual])
+    eq_(expected, [dict(step, data=list(step['data']))
+                   if isinstance(step['data'], engine.Events) else step
+                   for step in actual])
+
+    # A world updated directly from Events is the same as from a list
+    expected_world, actual_world = world.World(), world.World()
+    for expected_step, actual_step in zip(expected, actual):
+        expected_world(expected_step)
+        actual_world(actual_step)
+    eq_(expected_world.clock, actual_world.clock)
+    eq_({id: attributes(obj) for id, obj in expected_world.objects.items()},
+        {id: attributes(obj) for id, obj in actual_world.objects.items()})
+
+
+def test_headless_hide():
+    step = next(step for step in run_steps(
+        'endtime', functools.partial(engine.Engine, headless=True), 50,
+        nships=7) if isinstance(step['data'], engine.Events))
+    events = step['data']
+    ship_id = next(e['id'] for e in events if 'controller' in e['data'])
+
+    assert events.hide([]) is events
+    view = events.hide([ship_id])
+    eq_(list(view), [e for e in events if e['id'] != ship_id])
+    eq_(len(view), len(events) - 1)
+    assert view.hide([ship_id]) is view
+
+
+@parameterized([
+    (None, 'euler', False),
+    (0.5, 'euler', False),
+    (None, 'leapfrog', True),
+])
+def test_batch(barnes_hut, integrator, kinematic_planets):
+    # Games finish at different times (including a 1-ship game, which stops
+    # after the first step)
+    games = [('endtime', 0, 7), ('endtime', 1, 3), ('endtime', 2, 1),
+             ('orbital', 3, 2)]
+    stop = game.stop_when_any(game.stop_when_one_ship(), game.stop_after(1.0))
+
+    ephemerides = ephemeris.Cache() if kinematic_planets else None
+    batch = engine.Batch(
+        [(getattr(maps, map_name).Map(seed), spiral_bots(nships))
+         for map_name, seed, nships in games],
+        stop, 0.01, barnes_hut=barnes_hut, integrator=integrator,
+        ephemerides=ephemerides)
+    actual = [[] for _ in games]
+    for steps in batch:
+        eq_(len(steps), len(games))
+        for stream, step in zip(actual, steps):
+            if step is not None:
+                stream.append(step)
+    eq_(len(actual[2]), 3)
+
+    # Each game is the same as if run alone
+    simulator = functools.partial(engine.Engine, barnes_hut=barnes_hut,
+                                  integrator=integrator,
+                                  ephemerides=ephemerides)
+    for (map_name, seed, nships), stream, outcome in zip(
+            games, actual, batch.outcomes):
+        expected = []
+        try:
+            for step in game.run_game(getattr(maps, map_name).Map(seed),
+                                      spiral_bots(nships), stop, 0.01,
+                                      simulator=simulator):
+                expected.append(step)
+        except game.Stop as e:
+            eq_(str(e), str(outcome))
+        eq_(expected, stream)
+
+
+class ShootingRange(maps.common.Map):
+    '''A shooter, facing along the y axis, and a target ship.
+    '''
+    def __init__(self, target, shooter=(50.0, 10.0)):
+        super().__init__(seed=0)
+        self._positions = iter([shooter, target])
+
+    @property
+    def space(self):
+        return dict(dimensions=dict(x=150, y=100), gravity=0.0)
+
+    @property
+    def planets(self):
+        return []
+
+    def ship(self, controller):
+        return self._create_ship(controller=controller,
+                                 position=np.array(next(self._positions)),
+                                 velocity=np.zeros(2),
+                                 orientation=0.0)
+
+
+class ShootOnce:
+    def __init__(self):
+        self._fired = False
+
+    def __call__(self, request):
+        if request['ship_id'] is not None:
+            fire, self._fired = not self._fired, True
+            return dict(fire=fire, rotate=0.0, thrust=0.0)
+
+
+def hit_rate(simulator, step_duration):
+    hits = []
+    for distance in [20.3, 45.7]:
+        for offset in np.linspace(-2.6, 2.6, 14):
+            try:
+                for _ in game.run_game(
+                        ShootingRange(target=(50.0 + offset,
+                                              10.0 + distance)),
+                        [(dict(name='shooter', version=0), ShootOnce()),
+                         (dict(name='target', version=0), lambda r: None)],
+                        stop=game.stop_when_any(game.stop_when_one_ship(),
+                                                game.stop_after(0.6)),
+                        step_duration=step_duration,
+                        simulator=simulator):
+                    pass
+            except game.Stop as e:
+                hits.append(e.winner is not None)
+    return np.mean(hits)
+
+
+@parameterized([
+    (game.Simulator,),
+    (engine.Engine,),
+])
+def test_swept_hit_rate(simulator):
+    # Pellets move 1 unit per step at 0.01, or 5 units at 0.05, so a ship
+    # (radius 2) can be missed entirely at the coarse step
+    fine = hit_rate(simulator, 0.01)
+    assert 0 < fine < 1, 'test should include hits & misses'
+    assert hit_rate(simulator, 0.05) < fine, 'pellets should pass through'
+
+    swept = functools.partial(simulator, swept=True)
+    eq_(fine, hit_rate(swept, 0.01))
+    eq_(fine, hit_rate(swept, 0.02))
+    eq_(fine, hit_rate(swept, 0.05))
+
+
+@parameterized([
+    (game.Simulator,),
+    (engine.Engine,),
+])
+def test_pellet_out_of_bounds(simulator):
+    # Fired towards the top edge, so should leave the space after ~10 steps,
+    # long before its time to live (100 steps)
+    world_ = world.World()
+    lifetime = 0
+    for step in it.islice(game.run_game(
+            ShootingRange(target=(20.0, 50.0), shooter=(50.0, 90.0)),
+            [(dict(name='shooter', version=0), ShootOnce()),
+             (dict(name='target', version=0), lambda r: None)],
+            stop=game.stop_after(1e9), step_duration=0.01,
+            simulator=simulator), 100):
+        world_(step)
+        lifetime += any(isinstance(obj, world.Pellet)
+                        for obj in world_.objects.values())
+    assert 5 < lifetime < 15, 'pellet lifetime %d' % lifetime
+
+
+def pellets(ids, time_to_live=None):
+    n = len(ids)
+    return engine.Pellets(
+        id=np.array(ids, dtype=np.int64),
+        position=np.zeros((n, 2)),
+        velocity=np.zeros((n, 2)),
+        orientation=np.zeros(n),
+        time_to_live=np.array(ids if time_to_live is None else time_to_live,
+                              dtype=np.float))
+
+
+def test_store():
+    store = engine.Store(2, capacity=4)
+    # (a planet, then pellets)
+    state = pellets([1, 10]).to_state()
+    state.kind[0] = engine.PLANET
+    store.load(1, state)
+    store.add(1, pellets([11, 12]))
+    eq_(store.bodies(1).tolist(), [0])
+    eq_(store.get(1, store.pellets(1)).id.tolist(), [10, 11, 12])
+    eq_(len(store.pellets(0)), 0)
+
+    # Expire from the middle, then the start - free slots are reused, so
+    # are no longer in ID order
+    store.remove(1, store.pellets(1)[[1]])
+    store.remove(1, store.pellets(1)[[0]])
+    store.add(1, pellets([13, 14]))
+    eq_(store.capacity, 4)
+    eq_(store.get(1, store.pellets(1), engine.Pellets).id.tolist(),
+        [12, 13, 14])
+    assert store.pellets(1).tolist() != [1, 2, 3]
+
+    # Grows when full (for every world), preserving order
+    store.add(1, pellets([15, 16]))
+    eq_(store.capacity, 8)
+    eq_(store.get(1, store.pellets(1)).id.tolist(), [12, 13, 14, 15, 16])
+    eq_(store.get(1, store.pellets(1)).time_to_live.tolist(),
+        [12, 13, 14, 15, 16])
+    eq_(store.get(1, store.bodies(1)).kind.tolist(), [engine.PLANET])
+    store.add(0, pellets(range(8)))
+    eq_(store.capacity, 8)
+
+    # Bodies are removed, but their slots are not reused
+    store.remove(1, store.bodies(1))
+    store.remove(1, store.pellets(1))
+    eq_(len(store.bodies(1)), 0)
+    eq_(len(store.pellets(1)), 0)
+    store.add(1, pellets(range(20, 27)))
+    eq_(store.capacity, 8)
+    eq_(sorted(store.pellets(1).tolist()), list(range(1, 8)))
+
+
+def test_store_capacity():
+    # Constant fire (3 pellets per step), each living for 5 steps, so slots
+    # should be recycled without growing
+    store = engine.Store(1, capacity=16)
+    random = np.random.RandomState(42)
+    for n in range(1000):
+        slots = store.pellets(0)
+        store.state.time_to_live[0, slots] -= 1
+        # (some pellets also collide early)
+        expired = ((store.state.time_to_live[0, slots] <= 0) |
+                   (random.rand(len(slots)) < .1))
+        store.remove(0, slots[expired])
+        store.add(0, pellets(range(3 * n, 3 * n + 3), np.full(3, 5.0)))
+        assert len(store.pellets(0)) <= 15
+    eq_(store.capacity, 16)
+    ids = store.get(0, store.pellets(0)).id
+    np.testing.assert_equal(np.sort(ids), ids)
+
+
+def test_predict():
+    nsteps = 100
+    steps = run_steps('endtime', engine.Engine, 30 + nsteps, nships=5)
+    world_ = world.World()
+    for step in steps[:30]:
+        world_(step)
+    ships = [id for id, obj in world_.objects.items()
+             if isinstance(obj, world.Ship)]
+    # Candidate 0 matches the spiral bots, candidate 1 does nothing
+    controls = {id: [[[1.0, -1.0, 1.0]], [[0.0, 0.0, 0.0]]] for id in ships}
+    prediction = engine.predict(world_, controls, nsteps)
+    n = len(world_.objects)
+    eq_(prediction.ids, list(world_.objects))
+    eq_(prediction.position.shape, (2, nsteps, n, 2))
+    eq_(prediction.alive.shape, (2, nsteps, n))
+    assert not np.array_equal(prediction.position[0], prediction.position[1])
+
+    # The same as actually running the game
+    for k, step in enumerate(steps[30:]):
+        world_(step)
+        for i, id in enumerate(prediction.ids):
+            eq_(id in world_.objects, prediction.alive[0, k, i])
+            if id in world_.objects:
+                obj = world_.objects[id]
+                np.testing.assert_equal(obj.position,
+                                        prediction.position[0, k, i])
+                np.testing.assert_equal(obj.velocity,
+                                        prediction.velocity[0, k, i])
+                eq_(obj.orientation, prediction.orientation[0, k, i])
+
+    # Collisions are when objects are destroyed (pellets may also expire)
+    collided = np.isfinite(prediction.collision_time)
+    assert collided[0].any(), 'test should include collisions'
+    lifetime = (prediction.alive.sum(axis=1) + 1) * 0.01
+    np.testing.assert_allclose(prediction.collision_time[collided],
+                               lifetime[collided])
+
+
+def test_aggregate_steps():
+    steps = run_steps('endtime', engine.Engine, 60, nships=7)
+    for start, end in [(2, 3), (2, 12), (12, 60)]:
+        expected, actual = world.World(), world.World()
+        for step in steps[:start]:
+            expected(step)
+            actual(step)
+        for step in steps[start:end]:
+            expected(step)
+        aggregate = game._aggregate_steps(steps[start:end])
+        actual(aggregate)
+        eq_(aggregate['clock'], steps[end - 1]['clock'])
+        eq_(expected.clock, actual.clock)
+        np.testing.assert_allclose(expected.time, actual.time)
+        eq_({id: attributes(obj) for id, obj in expected.objects.items()},
+            {id: attributes(obj) for id, obj in actual.objects.items()})
+
+
+class Recorder:
+    '''A bot which records the world it sees, and always fires.
+    '''
+    def __init__(self):
+        self.world = world.World()
+        self.clocks = []
+
+    def __call__(self, request):
+        self.world(request['step'])
+        self.clocks.append(self.world.clock)
+        return dict(fire=True, rotate=0.5, thrust=1.0)
+
+
+@parameterized([
+    (1,),
+    (4,),
+])
+def test_control_interval(control_interval):
+    recorder = Recorder()
+    game_world = world.World()
+    for step in it.islice(game.run_game(
+            maps.orbital.Map(100),
+            [(dict(name='recorder', version=0), recorder)],
+            stop=game.stop_after(1e9),
+            step_duration=0.01,
+            simulator=engine.Engine,
+            control_interval=control_interval), 42):
+        game_world(step)
+        if recorder.clocks[-1] == game_world.clock:
+            # the bot's world is consistent with the game
+            np.testing.assert_allclose(game_world.time, recorder.world.time)
+            eq_({id: attributes(obj)
+                 for id, obj in game_world.objects.items()},
+                {id: attributes(obj)
+                 for id, obj in recorder.world.objects.items()})
+    eq_(recorder.clocks, [0, 1] + list(range(1 + control_interval, 42,
+                                             control_interval)))
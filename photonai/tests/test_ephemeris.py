@@ -0,0 +1,69 @@
+from .. import ephemeris, physics
+import os
+import tempfile
+import numpy as np
+from nose.tools import eq_
+
+
+def planets():
+    return (np.array([[50.0, 50.0], [85.0, 50.0]]),
+            np.array([[0.0, 0.0], [0.0, 14.0]]),
+            np.array([2000.0, 10.0]))
+
+
+def test_ephemeris():
+    position, velocity, mass = planets()
+    ephemeris_ = ephemeris.Ephemeris(position[np.newaxis],
+                                     velocity[np.newaxis],
+                                     mass, 0.1, 0.01)
+    np.testing.assert_equal(ephemeris_[0], (position, velocity))
+    for n in range(1, 5):
+        accel = physics.gravity(position, mass, 0.1)
+        new_velocity = velocity + 0.01 * accel
+        position = position + 0.005 * velocity + 0.005 * new_velocity
+        velocity = new_velocity
+        np.testing.assert_equal(ephemeris_[n], (position, velocity))
+
+    # Extended in chunks
+    ephemeris_[3000]
+    assert 3000 < len(ephemeris_)
+    # The moon stays in orbit
+    np.testing.assert_allclose(
+        np.sqrt(((ephemeris_.position[:, 1] -
+                  ephemeris_.position[:, 0]) ** 2).sum(axis=1)),
+        35.0, rtol=0.05)
+
+
+def test_cache():
+    position, velocity, mass = planets()
+    cache = ephemeris.Cache(maxsize=2)
+    a = cache(position, velocity, mass, 0.1, 0.01)
+    assert cache(position.copy(), velocity, mass, 0.1, 0.01) is a
+    assert cache(position, velocity, mass, 0.1, 0.02) is not a
+    assert cache(position, velocity, mass, 0.1, 0.01, drift=0.005) is not a
+    eq_(len(cache), 2)
+    assert cache(position, velocity, mass, 0.1, 0.01) is not a, \
+        'evicted (least recently used)'
+
+
+def test_cache_path():
+    position, velocity, mass = planets()
+    with tempfile.TemporaryDirectory() as path:
+        expected = ephemeris.Cache(path)(position, velocity, mass, 0.1, 0.01)
+        expected[10]
+        eq_(len(os.listdir(path)), 1)
+
+        actual = ephemeris.Cache(path)(position, velocity, mass, 0.1, 0.01)
+        eq_(len(expected), len(actual))
+        np.testing.assert_equal(expected.position, actual.position)
+        n = len(expected) + 10
+        np.testing.assert_equal(expected[n], actual[n])
+
+        # Each chunk is saved once, to its own file
+        folder, = [os.path.join(path, f) for f in os.listdir(path)]
+        eq_(len(os.listdir(folder)), 2)
+        expected[3 * ephemeris.Ephemeris.CHUNK]
+        eq_(len(os.listdir(folder)), 3)
+        actual = ephemeris.Cache(path)(position, velocity, mass, 0.1, 0.01)
+        eq_(len(expected), len(actual))
+        np.testing.assert_equal(expected.velocity, actual.velocity)
@@ -0,0 +1,283 @@
+from .. import game, world, bot, engine, maps, records
+from . import test_schema
+import concurrent.futures
+import copy
+import io
+import itertools as it
+import fastavro
+import numpy as np
+import time
+from nose_parameterized import parameterized
+from nose.tools import eq_, assert_raises
+
+
+def random_world(seed, nships=20, nplanets=5, npellets=200):
+    '''Create a world with randomly placed objects (including some outside
+    the space).
+    '''
+    random = np.random.RandomState(seed)
+    dimensions = np.array([150.0, 100.0])
+
+    def create(template, body, radius, speed=0.0):
+        data = copy.deepcopy(template)
+        position = random.rand(2) * 1.2 * dimensions - 0.1 * dimensions
+        velocity = random.randn(2) * speed
+        data[body]['radius'] = radius
+        data[body]['state']['position'] = dict(x=position[0], y=position[1])
+        data[body]['state']['velocity'] = dict(x=velocity[0], y=velocity[1])
+        return data
+
+    events = (
+        [create(test_schema.Ship.CREATE, 'body', 2.0, speed=10.0)
+         for _ in range(nships)] +
+        [create(test_schema.Planet.CREATE, 'body', 20 * random.rand())
+         for _ in range(nplanets)] +
+        [create(test_schema.Pellet.CREATE, 'body', 0.0, speed=100.0)
+         for _ in range(npellets)])
+
+    world_ = world.World()
+    world_(dict(clock=0, duration=0.01,
+                data=dict(dimensions=dict(x=dimensions[0], y=dimensions[1]),
+                          gravity=0.1)))
+    world_(dict(clock=1, duration=0.01,
+                data=[dict(id=id, data=data)
+                      for id, data in enumerate(events)]))
+    return world_
+
+
+@parameterized([
+    (None, 10),
+    (0.05, 2),
+])
+def test_grid_collisions(dt, nseeds):
+    ncollisions = 0
+    for seed in range(nseeds):
+        world_ = random_world(seed)
+        grid = game._Grid(world_, dt=dt)
+        for obj in world_.objects.values():
+            if isinstance(obj, (world.Ship, world.Pellet)):
+                expected = game._is_collision(obj, world_.objects.values(),
+                                              dt=dt)
+                eq_(expected, game._is_collision(obj, grid.candidates(obj),
+                                                 dt=dt))
+                ncollisions += expected
+    assert 0 < ncollisions, 'test should include some collisions'
+
+
+def test_swept_collision():
+    pellet = world.Pellet(clock=0, radius=0.0, mass=0.0,
+                          position=np.array([0.0, 1.0]),
+                          velocity=np.array([100.0, 0.0]),
+                          orientation=0.0, time_to_live=1.0)
+    ship = world.Body(clock=0, radius=2.0, mass=1.0,
+                      position=np.array([3.0, 0.0]),
+                      velocity=np.array([0.0, 0.0]),
+                      orientation=0.0)
+    # passes through the ship, between steps
+    assert not game._is_collision(pellet, [ship])
+    assert game._is_collision(pellet, [ship], dt=0.05)
+    # too short a step to reach the ship
+    assert not game._is_collision(pellet, [ship], dt=0.005)
+
+
+def is_obscured(world_, src, dest):
+    '''Simple (non-vectorized) line-of-sight test.
+    '''
+    los = dest.position - src.position
+    los_distance = np.sqrt((los ** 2).sum())
+    for obj in world_.objects.values():
+        if isinstance(obj, world.Planet):
+            relative = obj.position - src.position
+            d = np.dot(los / los_distance, relative)
+            if 0 < d < los_distance and (
+                    (relative ** 2).sum() < d ** 2 + obj.radius ** 2):
+                return True
+    return False
+
+
+def test_ship_visibility():
+    nobscured = 0
+    for seed in range(10):
+        world_ = random_world(seed, nplanets=10, npellets=0)
+        ids, visible = game.ship_visibility(world_)
+        eq_(ids, [id for id, obj in world_.objects.items()
+                  if isinstance(obj, world.Ship)])
+        for i, src in enumerate(ids):
+            for j, dest in enumerate(ids):
+                expected = (src == dest or not is_obscured(
+                    world_, world_.objects[src], world_.objects[dest]))
+                eq_(expected, visible[i, j])
+                nobscured += not expected
+    assert 0 < nobscured, 'test should include some obscured ships'
+
+
+def test_indexed_step():
+    events = [dict(id=1, data=test_schema.Ship.CREATE),
+              dict(id=1, data=test_schema.Ship.STATE),
+              dict(id=2, data=test_schema.Ship.STATE),
+              dict(id=3, data=test_schema.Pellet.STATE),
+              dict(id=2, data=test_schema.Object.DESTROY),
+              dict(id=1, data=test_schema.Ship.STATE)]
+    step = dict(clock=5, duration=0.01, data=events)
+    indexed = game._IndexedStep(step, [1, 2])
+
+    assert indexed.view([]) is step
+    assert indexed.view([3]) is step, 'only ships are hidden'
+
+    view = indexed.view([1])
+    expected = [events[0], events[2], events[3], events[4]]
+    eq_(view['clock'], 5)
+    eq_(list(view['data']), expected)
+    eq_(len(view['data']), 4)
+    eq_([view['data'][n] for n in range(-4, 4)], expected + expected)
+    eq_(view['data'][1:3], expected[1:3])
+
+    # A view is serialized in the same way as the equivalent list
+    def encode(step):
+        with io.BytesIO() as f:
+            fastavro.schemaless_writer(f, bot.Bot.REQUEST,
+                                       dict(step=step, ship_id=2))
+            return f.getvalue()
+
+    eq_(encode(dict(view, data=expected)), encode(view))
+
+
+class SleepyBot(bot.Bot):
+    '''Responds after a delay, on a background thread.
+    '''
+    def __init__(self, delay, timeout):
+        self.delay = delay
+        self.timeout = timeout
+        self.requests = []
+        self._pool = concurrent.futures.ThreadPoolExecutor(1)
+
+    def __call__(self, request):
+        self.requests.append(request)
+        time.sleep(self.delay)
+        return dict(fire=True, rotate=0.0, thrust=self.delay)
+
+    def submit(self, request):
+        return self._pool.submit(self, request)
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def test_controllers_concurrent():
+    bots = {1: SleepyBot(0.2, timeout=0.5),
+            2: SleepyBot(0.2, timeout=0.5),
+            3: SleepyBot(0.2, timeout=0.5),
+            4: SleepyBot(0.8, timeout=0.5)}
+    controllers = game.Controllers(
+        world.World(), bots.copy(),
+        visibility=lambda: ([1, 2, 4], np.ones((3, 3), dtype=bool)))
+
+    start = time.monotonic()
+    controllers(dict(clock=5, duration=0.01, data=[]))
+    # the bots run concurrently, so the step takes less than the sum of
+    # their delays
+    assert time.monotonic() - start < 0.7
+
+    eq_([bots[id].requests[0]['ship_id'] for id in range(1, 5)],
+        [1, 2, None, 4])
+    eq_(controllers.control[1]['thrust'], 0.2)
+    eq_(controllers.control[2]['thrust'], 0.2)
+    eq_(controllers.control[3], game.Controllers.DEFAULT_STATE)
+    # the slow bot missed the deadline
+    eq_(controllers.control[4], game.Controllers.DEFAULT_STATE)
+    eq_(set(controllers._id_to_bot), {1, 2, 3})
+    for b in bots.values():
+        b.close()
+
+
+class LateBot(bot.Bot):
+    '''Responds late to its first request.
+    '''
+    def __init__(self):
+        self.nrequests = 0
+
+    def __call__(self, request):
+        self.nrequests += 1
+        if self.nrequests == 1:
+            raise bot.LateResponse()
+        return dict(fire=False, rotate=0.0, thrust=1.0)
+
+
+def test_controllers_late():
+    late = LateBot()
+    controllers = game.Controllers(
+        world.World(), {1: late},
+        visibility=lambda: ([1], np.ones((1, 1), dtype=bool)))
+    controllers(dict(clock=5, duration=0.01, data=[]))
+    eq_(controllers.control[1], game.Controllers.DEFAULT_STATE)
+    # the bot gets another chance
+    controllers(dict(clock=6, duration=0.01, data=[]))
+    eq_(controllers.control[1]['thrust'], 1.0)
+    eq_(late.nrequests, 2)
+
+
+def clock_bot(request):
+    # rotates according to the clock of the request
+    if request['ship_id'] is not None:
+        return dict(fire=False, rotate=(request['step']['clock'] % 7) / 7,
+                    thrust=0.0)
+
+
+@parameterized([
+    (game.Simulator, 0),
+    (game.Simulator, 1),
+    (engine.Engine, 0),
+    (engine.Engine, 1),
+])
+def test_control_lag(simulator, control_lag):
+    rotate = {}
+    for step in it.islice(game.run_game(
+            maps.singleton.Map(100),
+            [(dict(name='clock', version=0), clock_bot)],
+            stop=game.stop_after(1e9), step_duration=0.01,
+            simulator=simulator, control_lag=control_lag), 30):
+        if isinstance(step['data'], list):
+            for event in step['data']:
+                if records.kind(event) == 'ship_state':
+                    rotate[step['clock']] = \
+                        event['data']['controller']['rotate']
+    # each step is simulated with the response to step (clock - 1 - lag)
+    eq_(sorted(rotate), list(range(2, 30)))
+    for clock in range(3, 30):
+        eq_(rotate[clock], ((clock - 1 - control_lag) % 7) / 7)
+
+
+def test_control_interval_invalid():
+    with assert_raises(ValueError):
+        next(game.run_game(
+            maps.singleton.Map(100),
+            [(dict(name='clock', version=0), clock_bot)],
+            stop=game.stop_after(1e9), step_duration=0.01,
+            control_interval=0))
+
+
+class SlowEngine(engine.Engine):
+    def __call__(self, control):
+        time.sleep(0.05)
+        return super().__call__(control)
+
+
+def test_control_lag_parallel():
+    elapsed = []
+    for control_lag in [0, 1]:
+        sleepy = SleepyBot(0.05, timeout=0.5)
+        steps = game.run_game(
+            maps.singleton.Map(100), [(dict(name='sleepy', version=0),
+                                       sleepy)],
+            stop=game.stop_after(1e9), step_duration=0.01,
+            simulator=SlowEngine, control_lag=control_lag)
+        start = time.monotonic()
+        for _ in range(10):
+            next(steps)
+        elapsed.append(time.monotonic() - start)
+        steps.close()
+        # outstanding requests are collected when the game finishes
+        eq_(len(sleepy.requests), 10)
+        sleepy.close()
+    # the bot runs while the engine simulates the next step
+    assert elapsed[1] < 0.75 * elapsed[0], elapsed
@@ -0,0 +1,119 @@
+from .. import physics
+import numpy as np
+from nose_parameterized import parameterized
+from nose.tools import eq_
+
+
+def random_bodies(seed, n):
+    random = np.random.RandomState(seed)
+    return (random.rand(n, 2) * [150, 100],
+            random.rand(n) * 100 + 1)
+
+
+def test_gravity_exact():
+    position, mass = random_bodies(100, 10)
+    accel = physics.gravity_exact(position, mass, 0.1)
+    eq_(accel.shape, (10, 2))
+    for i in range(10):
+        expected = np.zeros(2)
+        for j in range(10):
+            if i != j:
+                relative = position[j] - position[i]
+                expected += 0.1 * mass[j] / (relative ** 2).sum() * relative
+        np.testing.assert_allclose(accel[i], expected)
+
+
+@parameterized([
+    (0.0, 1e-12, 1e-12),
+    (0.3, 1e-3, 5e-2),
+    (0.5, 1e-2, 1e-1),
+    (1.0, 5e-2, 5e-1),
+])
+def test_gravity_barnes_hut(theta, max_median_error, max_error):
+    position, mass = random_bodies(200, 300)
+    exact = physics.gravity_exact(position, mass, 0.1)
+    approx = physics.gravity_barnes_hut(position, mass, 0.1, theta)
+
+    error = (np.sqrt(((approx - exact) ** 2).sum(axis=1)) /
+             np.sqrt((exact ** 2).sum(axis=1)))
+    assert np.median(error) < max_median_error, \
+        'median relative error %.3g (theta=%g)' % (np.median(error), theta)
+    assert error.max() < max_error, \
+        'max relative error %.3g (theta=%g)' % (error.max(), theta)
+
+
+def test_gravity_barnes_hut_edge_cases():
+    for n in [0, 1, 2]:
+        position, mass = random_bodies(300, n)
+        np.testing.assert_allclose(
+            physics.gravity_barnes_hut(position, mass, 0.1, 0.5),
+            physics.gravity_exact(position, mass, 0.1))
+
+    # Bodies which cannot be separated by the tree
+    position = np.array([[10.0, 20.0], [10.0, 20.0 + 1e-9], [50.0, 50.0]])
+    mass = np.array([1.0, 2.0, 3.0])
+    np.testing.assert_allclose(
+        physics.gravity_barnes_hut(position, mass, 0.1, 0.5, max_depth=4),
+        physics.gravity_exact(position, mass, 0.1))
+
+
+def test_gravity_exact_batch():
+    bodies = [random_bodies(seed, n) for seed, n in [(400, 5), (401, 8)]]
+    position = np.zeros((2, 8, 2))
+    mass = np.zeros((2, 8))
+    position[0, :5], mass[0, :5] = bodies[0]
+    position[1], mass[1] = bodies[1]
+    accel = physics.gravity_exact_batch(position, mass, np.array([0.1, 0.2]))
+    eq_(accel.shape, (2, 8, 2))
+    np.testing.assert_allclose(accel[0, :5],
+                               physics.gravity_exact(*bodies[0], 0.1))
+    np.testing.assert_allclose(accel[1],
+                               physics.gravity_exact(*bodies[1], 0.2))
+
+    targets = np.array([[1, 3], [0, 7]])
+    np.testing.assert_equal(
+        physics.gravity_exact_batch(position, mass, np.array([0.1, 0.2]),
+                                    targets=targets),
+        accel[np.arange(2)[:, np.newaxis], targets])
+
+
+def test_swept_distance_sq():
+    random = np.random.RandomState(500)
+    relative = random.randn(100, 2) * 3
+    motion = random.randn(100, 2) * 5
+    motion[:10] = 0
+    t = np.linspace(0, 1, 10001)
+    expected = ((relative[:, np.newaxis, :] +
+                 t[np.newaxis, :, np.newaxis] * motion[:, np.newaxis, :])
+                ** 2).sum(axis=2).min(axis=1)
+    actual = physics.swept_distance_sq(relative, motion)
+    eq_(actual.shape, (100,))
+    assert np.all(actual <= expected + 1e-12)
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-6)
+
+
+def test_energy():
+    position, mass = random_bodies(600, 6)
+    mass[0] = 0
+    velocity = np.random.RandomState(601).randn(6, 2)
+    energy = physics.energy(position, velocity, mass, 0.1)
+    np.testing.assert_allclose(
+        energy,
+        0.5 * (mass * (velocity ** 2).sum(axis=1)).sum() +
+        sum(0.1 * mass[i] * mass[j] *
+            np.log(np.sqrt(((position[i] - position[j]) ** 2).sum()))
+            for i in range(6) for j in range(i + 1, 6)))
+
+    # The force is the gradient of the potential
+    accel = physics.gravity_exact(position, mass, 0.1)
+    eps = 1e-6
+    for i in range(1, 6):
+        for d in range(2):
+            delta = np.zeros_like(position)
+            delta[i, d] = eps
+            force = -(physics.energy(position + delta, 0 * velocity, mass,
+                                     0.1) -
+                      physics.energy(position - delta, 0 * velocity, mass,
+                                     0.1)) / (2 * eps)
+            np.testing.assert_allclose(force, mass[i] * accel[i, d],
+                                       rtol=1e-4)
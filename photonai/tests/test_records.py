@@ -0,0 +1,204 @@
+from .. import records, engine, game, world, schema, bot, run
+from . import test_schema
+from .test_engine import run_steps, attributes
+import io
+import itertools as it
+import json
+import numpy as np
+import fastavro
+import fastavro.writer
+from nose.tools import eq_
+
+
+def to_schema(step, kind=True):
+    '''Convert a step's compact records into plain schema dicts.
+
+    kind -- include the event kind (otherwise, as in an old log)
+    '''
+    if isinstance(step['data'], dict):
+        return step
+    return dict(step, data=[dict(id=e['id'], kind=e['kind'], data=e['data'])
+                            if kind else dict(id=e['id'], data=e['data'])
+                            for e in step['data']])
+
+
+def old_schema():
+    '''The `schema.STEP` of an old log, with no event kind.
+    '''
+    event = dict(schema.Object.EVENT,
+                 fields=[f for f in schema.Object.EVENT['fields']
+                         if f['name'] != 'kind'])
+    return dict(schema.STEP, fields=[
+        dict(f, type=[schema.Space.CREATE,
+                      dict(type='array', items=event)])
+        if f['name'] == 'data' else f
+        for f in schema.STEP['fields']])
+
+
+def test_records():
+    steps = run_steps('endtime', engine.Engine, 50, nships=7)
+    types = set()
+    for step in steps[2:]:
+        for event in step['data']:
+            assert isinstance(event, records.Event)
+            types.add(type(event))
+            eq_(json.loads(json.dumps(dict(event))),
+                dict(id=event['id'], kind=event.KIND, data=event['data']))
+            assert fastavro.writer.validate(event, schema.Object.EVENT)
+    eq_(types, {records.PlanetState, records.ShipState, records.PelletState,
+                records.PelletCreate, records.Destroy})
+
+
+def test_kind():
+    for event in test_schema.Object.EVENTS:
+        eq_(records.kind(event), event['kind'])
+        # old events, without a kind
+        eq_(records.kind(dict(id=event['id'], data=event['data'])),
+            event['kind'])
+        eq_(records.infer_kind(event['data']), event['kind'])
+
+    eq_(records.kind(records.Destroy(1)), 'destroy')
+    pellet = records.PelletState(1, [0.0, 1.0], [2.0, 3.0], 0.5, 1.0)
+    eq_(records.kind(pellet), 'pellet_state')
+    eq_(records.kind(records.PelletCreate(1, [0.0, 1.0], [2.0, 3.0],
+                                          0.5, 1.0)), 'pellet_create')
+    eq_(records.kind(pellet), records.kind(dict(pellet)))
+
+
+def test_update_world():
+    steps = run_steps('endtime', engine.Engine, 100, nships=7)
+    expected_world, old_world, actual_world = \
+        world.World(), world.World(), world.World()
+    for step in steps:
+        expected_world(to_schema(step))
+        old_world(to_schema(step, kind=False))
+        actual_world(step)
+    expected = {id: attributes(obj)
+                for id, obj in expected_world.objects.items()}
+    eq_(expected, {id: attributes(obj)
+                   for id, obj in old_world.objects.items()})
+    eq_(expected, {id: attributes(obj)
+                   for id, obj in actual_world.objects.items()})
+
+
+def test_write_step():
+    for step in run_steps('endtime', engine.Engine, 50, nships=7):
+        with io.BytesIO() as expected, io.BytesIO() as actual:
+            fastavro.writer.write_data(expected, to_schema(step),
+                                       schema.STEP)
+            records.write_step(actual, step)
+            eq_(expected.getvalue(), actual.getvalue())
+
+            # dicts with a kind are written directly (c.f. old events)
+            with io.BytesIO() as direct:
+                records.write_step(direct, to_schema(step))
+                eq_(expected.getvalue(), direct.getvalue())
+
+
+def test_read_step():
+    for simulator in [game.Simulator, engine.Engine]:
+        steps = run_steps('endtime', simulator, 50, nships=7)
+        expected_world, actual_world = world.World(), world.World()
+        types = set()
+        for step in steps:
+            with io.BytesIO() as f:
+                records.write_step(f, step)
+                f.seek(0)
+                expected = fastavro._reader.read_data(f, schema.STEP)
+                f.seek(0)
+                actual = records.read_step(f)
+                eq_(f.read(), b'')
+            if isinstance(actual['data'], list):
+                types.update(type(e) for e in actual['data'])
+            eq_(expected, to_schema(actual))
+            expected_world(expected)
+            actual_world(actual)
+        eq_(types, {dict, records.PlanetState, records.ShipState,
+                    records.PelletState, records.PelletCreate,
+                    records.Destroy})
+        eq_({id: attributes(obj)
+             for id, obj in expected_world.objects.items()},
+            {id: attributes(obj)
+             for id, obj in actual_world.objects.items()})
+
+
+def test_write_request():
+    steps = run_steps('endtime', engine.Engine, 20, nships=3)
+    for step, ship_id in [(steps[0], None), (steps[-1], None),
+                          (steps[-1], 2)]:
+        request = dict(step=step, ship_id=ship_id)
+        with io.BytesIO() as expected, io.BytesIO() as actual:
+            fastavro.writer.write_data(
+                expected, dict(request, step=to_schema(step)),
+                bot.Bot.REQUEST)
+            bot._write_request(actual, request)
+            eq_(expected.getvalue(), actual.getvalue())
+
+
+def test_avro_writer():
+    steps = run_steps('endtime', engine.Engine, 50, nships=7)
+    with io.BytesIO() as expected, io.BytesIO() as actual:
+        fastavro.writer.writer(expected, schema.STEP,
+                               [to_schema(step) for step in steps])
+        expected.seek(0)
+        run.AvroWriter(actual)(steps)
+        actual.seek(0)
+        reader = fastavro.reader(actual)
+        eq_(schema.version(reader.metadata), schema.VERSION)
+        # (N.B. read exactly len(steps), to avoid StopIteration at EOF)
+        eq_(list(it.islice(fastavro.reader(expected), len(steps))),
+            list(it.islice(reader, len(steps))))
+
+
+def test_read_old_log():
+    steps = run_steps('endtime', engine.Engine, 50, nships=7)
+    with io.BytesIO() as f:
+        fastavro.writer.writer(f, old_schema(),
+                               [to_schema(step, kind=False)
+                                for step in steps])
+        f.seek(0)
+        reader = fastavro.reader(f)
+        eq_(schema.version(reader.metadata), 1)
+        old_steps = list(it.islice(reader, len(steps)))
+
+    expected_world, actual_world = world.World(), world.World()
+    for step, old_step in zip(steps, old_steps):
+        expected_world(step)
+        actual_world(old_step)
+    eq_(expected_world.objects.keys(), actual_world.objects.keys())
+    for id, obj in expected_world.objects.items():
+        np.testing.assert_allclose(obj.position,
+                                   actual_world.objects[id].position,
+                                   rtol=1e-5)
+
+
+def test_fastavro_adapter():
+    # fails if the fastavro internals in `records` change (see
+    # requirements.txt)
+    with io.BytesIO() as f:
+        records.write_long(f, -1234567)
+        records.write_float(f, 0.5)
+        space = dict(dimensions=dict(x=100.0, y=50.0), gravity=0.5)
+        records.write_data(f, space, schema.Space.CREATE)
+        f.seek(0)
+        eq_(records.read_long(f), -1234567)
+        eq_(records.read_float(f), 0.5)
+        eq_(records.read_data(f, schema.Space.CREATE), space)
+        eq_(f.read(), b'')
+
+    steps = run_steps('endtime', engine.Engine, 20, nships=3)
+    with io.BytesIO() as f:
+        writer = records.ContainerWriter(f, schema.STEP, metadata=dict(a='b'),
+                                         codec='deflate')
+        expected = []
+        for step in steps:
+            with io.BytesIO() as g:
+                records.write_step(g, step)
+                eq_(writer.append(records.write_step, step), g.tell())
+                g.seek(0)
+                expected.append(records.read_data(g, schema.STEP))
+        writer.flush()
+        f.seek(0)
+        reader = fastavro.reader(f)
+        eq_(reader.metadata['a'], 'b')
+        eq_(list(it.islice(reader, len(steps))), expected)
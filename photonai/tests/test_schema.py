@@ -79,11 +79,13 @@ class Object:
     DESTROY = dict()
 
     EVENTS = [dict(id=2468,
+                   kind=kind,
                    data=data)
-              for data in [Ship.CREATE, Ship.STATE,
-                           Pellet.CREATE, Pellet.STATE,
-                           Planet.CREATE, Planet.STATE,
-                           DESTROY]]
+              for kind, data in zip(schema.Object.KINDS,
+                                    [Ship.CREATE, Ship.STATE,
+                                     Pellet.CREATE, Pellet.STATE,
+                                     Planet.CREATE, Planet.STATE,
+                                     DESTROY])]
 
 
 def almost_equal(x, y):
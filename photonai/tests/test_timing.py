@@ -0,0 +1,55 @@
+from .. import timing, run
+import io
+from nose.tools import eq_
+
+
+def test_metrics():
+    metrics = timing.Metrics()
+    for n in range(10):
+        with metrics.timer('a'):
+            pass
+        metrics.count('x', n)
+    with metrics.timer('b'):
+        pass
+    eq_(list(metrics.times), ['a', 'b'])
+    eq_(len(metrics.times['a']), 10)
+    assert all(0 <= t for t in metrics.times['a'])
+    eq_(metrics.counts['x'], list(range(10)))
+
+    report = metrics.report().split('\n')
+    eq_(report[0].split()[0], 'phase')
+    eq_([line.split()[0] for line in report[1:3]], ['a', 'b'])
+    eq_(report[-1].split(), ['x', '4.5', '4.5', '8.1', '9.0'])
+
+    # NULL accepts everything, records nothing
+    with timing.NULL.timer('a'):
+        timing.NULL.count('x', 1)
+
+
+def test_run_game_metrics():
+    metrics = timing.Metrics()
+    with io.BytesIO() as f:
+        run.run_game(bots=[], map='singleton',
+                     writer=run.AvroWriter(f, metrics=metrics),
+                     seed=100, time_limit=0.5, step_duration=0.01,
+                     metrics=metrics)
+    nsteps = 50
+    eq_(set(metrics.times),
+        {'simulate', 'world', 'visibility', 'bots', 'wait', 'stop', 'write'})
+    eq_(len(metrics.times['world']), nsteps)
+    eq_(len(metrics.times['simulate']), nsteps - 2)
+    eq_(len(metrics.counts['bytes']), nsteps)
+    eq_(len(metrics.counts['objects']), nsteps)
+    assert 0 < min(metrics.counts['events'][2:])
+
+
+def test_run_game_metrics_headless():
+    counts = []
+    for headless in [False, True]:
+        metrics = timing.Metrics()
+        run.run_game(bots=[], map='singleton', writer=run.NothingWriter(),
+                     seed=100, time_limit=0.5, step_duration=0.01,
+                     headless=headless, metrics=metrics)
+        counts.append(metrics.counts['events'])
+    eq_(len(counts[0]), 49)
+    eq_(counts[0], counts[1])
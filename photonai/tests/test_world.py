@@ -1,7 +1,9 @@
-from .. import world
-from . import test_schema
+from .. import world, game, engine
+from . import test_schema, test_engine
 import numpy as np
 import copy
+import functools
+import unittest.mock
 from nose_parameterized import parameterized
 from nose.tools import eq_
 
@@ -65,3 +67,55 @@ def test_world():
 
     eq_(w.objects[100].orientation, planet_update['body']['orientation'])
     eq_(w.objects[200].orientation, init_orientation)
+
+
+def test_world_kind():
+    events = test_schema.Object.EVENTS
+    steps = [dict(clock=0, duration=0.1, data=test_schema.Space.CREATE)] + [
+        dict(clock=clock, duration=0.1,
+             data=[dict(events[n], id=id) for id, n in id_events])
+        for clock, id_events in [(1, [(1, 0), (2, 2), (3, 4)]),
+                                 (2, [(1, 1), (2, 3), (3, 5)]),
+                                 (3, [(2, 6)])]]
+
+    expected, actual = world.World(), world.World()
+    for step in steps:
+        # Events with an explicit kind are dispatched without validation
+        with unittest.mock.patch.object(world, 'validate',
+                                        side_effect=AssertionError):
+            actual(step)
+        if isinstance(step['data'], list):
+            step = dict(step, data=[dict(id=e['id'], data=e['data'])
+                                    for e in step['data']])
+        expected(step)
+    eq_(actual.objects.keys(), {1, 3})
+    eq_(str(actual), str(expected))
+
+
+def check_types(world_):
+    for name, cls in [('ships', world.Ship),
+                      ('planets', world.Planet),
+                      ('pellets', world.Pellet)]:
+        eq_(list(getattr(world_, name).items()),
+            [(id, obj) for id, obj in world_.objects.items()
+             if isinstance(obj, cls)])
+
+
+@parameterized([
+    (game.Simulator,),
+    (engine.Engine,),
+    (functools.partial(engine.Engine, headless=True),),
+])
+def test_world_types(simulator):
+    world_ = world.World()
+    npellets = []
+    for step in test_engine.run_steps('endtime', simulator, 100, nships=7):
+        world_(step)
+        check_types(world_)
+        npellets.append(len(world_.pellets))
+    # pellets are both created & destroyed
+    assert 0 < max(npellets)
+    assert any(b < a for a, b in zip(npellets, npellets[1:]))
+
+    world_.remove(next(iter(world_.ships)))
+    check_types(world_)
@@ -0,0 +1,93 @@
+'''Lightweight instrumentation of the game loop - per-step timings of each
+phase, and counters - cheap enough to leave on.
+'''
+
+import collections
+import time
+import numpy as np
+
+
+class _Timer:
+    __slots__ = ('_samples', '_start')
+
+    def __init__(self, samples):
+        self._samples = samples
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._samples.append(time.perf_counter() - self._start)
+
+
+class Metrics:
+    '''Collects samples of the time taken by each phase of a game (e.g.
+    'simulate', 'bots'), and of counters (e.g. 'events' per step).
+
+    `times` -- dict of {phase: list of durations in seconds}
+
+    `counts` -- dict of {counter: list of values}
+    '''
+    def __init__(self):
+        self.times = collections.OrderedDict()
+        self.counts = collections.OrderedDict()
+
+    def timer(self, phase):
+        '''Create a context manager, which records the time spent in a phase.
+        '''
+        return _Timer(self.times.setdefault(phase, []))
+
+    def count(self, counter, value):
+        '''Record a sample of a counter.
+        '''
+        self.counts.setdefault(counter, []).append(value)
+
+    def report(self):
+        '''Format a breakdown of time per phase & counter percentiles.
+
+        returns -- str, a table
+        '''
+        total = sum(sum(samples) for samples in self.times.values())
+        lines = ['%-12s %8s %7s %8s %8s %8s %8s' % (
+            'phase', 'total/s', 'share', 'mean/ms', 'p50/ms', 'p90/ms',
+            'p99/ms')]
+        for phase, samples in self.times.items():
+            samples = np.array(samples)
+            p50, p90, p99 = 1000 * np.percentile(samples, [50, 90, 99])
+            lines.append('%-12s %8.3f %6.1f%% %8.3f %8.3f %8.3f %8.3f' % (
+                phase, samples.sum(), 100 * samples.sum() / (total or 1),
+                1000 * samples.mean(), p50, p90, p99))
+        lines.append('')
+        lines.append('%-12s %8s %8s %8s %8s' % (
+            'counter', 'mean', 'p50', 'p90', 'max'))
+        for counter, samples in self.counts.items():
+            samples = np.array(samples)
+            p50, p90 = np.percentile(samples, [50, 90])
+            lines.append('%-12s %8.1f %8.1f %8.1f %8.1f' % (
+                counter, samples.mean(), p50, p90, samples.max()))
+        return '\n'.join(lines)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _NullMetrics:
+    '''Discards all measurements (see `Metrics`).
+    '''
+    _TIMER = _NullTimer()
+
+    def timer(self, phase):
+        return self._TIMER
+
+    def count(self, counter, value):
+        pass
+
+
+NULL = _NullMetrics()
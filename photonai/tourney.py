@@ -3,6 +3,7 @@
 
 import click
 import random
+import hashlib
 import tempfile
 import shutil
 import os
@@ -11,6 +12,7 @@ import logging
 import time
 import pymssql
 
+import photonai.bot
 import photonai.config
 import photonai.db
 import photonai.run
@@ -28,29 +30,59 @@ DEFAULT_CONFIG = dict(
     ],
     time_limit=60,
     step_duration=0.01,
+    control_interval=1,
+    control_lag=0,
+    engine='vectorized',
+    swept=False,
+    integrator='euler',
+    kinematic_planets=False,
+    ephemeris_cache=None,
     timeout=0.1,
     image='douglasorr/photonai',
+    bot_pool=8,
 )
 
 
-def load_bot(bot, config, stack):
-    '''Load a bot spec with a 'script' key, and add a 'path' key.
+def load_bot(bot, config, stack, pool, script_folder):
+    '''Load a bot spec with 'id' & 'script' keys, reusing a bot from the pool
+    if it has already been started with the same script.
+
+    script_folder -- where to save scripts (named by their hash, so they
+    outlive each game, as a pooled bot may still be loading its script)
     '''
-    f = stack.enter_context(tempfile.NamedTemporaryFile())
-    f.write(bot['script'].encode('utf8'))
-    f.flush()
-    return stack.enter_context(
-        photonai.run.load_bot(f.name,
-                              image=config['image'],
-                              timeout=config['timeout']))
+    script = bot['script'].encode('utf8')
+    script_hash = hashlib.sha1(script).hexdigest()
+
+    def create():
+        path = os.path.join(script_folder, '%s.py' % script_hash)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(script)
+        return photonai.run.load_bot(path,
+                                     image=config['image'],
+                                     timeout=config['timeout'])
+
+    return stack.enter_context(pool.get((bot['id'], script_hash), create))
 
 
 class NotEnoughBotsError(Exception):
     pass
 
 
-def run(config):
+def run(config, pool=None, script_folder=None):
+    '''Run a single tournament game.
+
+    pool -- a `photonai.bot.BotPool` to reuse bots between games (by default,
+    bots are closed after the game)
+
+    script_folder -- where to save bot scripts (by default, a temporary
+    folder for this game)
+    '''
     with contextlib.ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(photonai.bot.BotPool(capacity=0))
+        if script_folder is None:
+            script_folder = stack.enter_context(tempfile.TemporaryDirectory())
         db = stack.enter_context(photonai.db.Session(**config['db']))
 
         # Randomly sample a game to play
@@ -58,7 +90,7 @@ def run(config):
         if len(bots) < 2:
             raise NotEnoughBotsError
         bot_a, bot_b = bots
-        bots = [(bot, load_bot(bot, config, stack))
+        bots = [(bot, load_bot(bot, config, stack, pool, script_folder))
                 for bot in bots]
 
         map = random.choice(config['maps'])
@@ -77,7 +109,14 @@ def run(config):
             seed=seed,
             map=map,
             time_limit=config['time_limit'],
-            step_duration=config['step_duration'])
+            step_duration=config['step_duration'],
+            control_interval=config['control_interval'],
+            control_lag=config['control_lag'],
+            engine=config['engine'],
+            swept=config['swept'],
+            integrator=config['integrator'],
+            kinematic_planets=config['kinematic_planets'],
+            ephemeris_cache=config['ephemeris_cache'])
 
         logging.debug('Winner %s', result.winner)
 
@@ -123,18 +162,20 @@ def cli(config):
        not os.path.exists(config['replay_folder']):
         os.makedirs(config['replay_folder'])
 
-    while True:
-        try:
-            run(config)
-        except NotEnoughBotsError:
-            logging.debug('Not enough bots to run a game')
-            time.sleep(10)
-        except pymssql.OperationalError as e:
-            if 1 <= len(e.args) and e.args[0] == 40613:
-                logging.debug('Database currently unavailable %s', e)
+    with photonai.bot.BotPool(capacity=config['bot_pool']) as pool, \
+            tempfile.TemporaryDirectory() as script_folder:
+        while True:
+            try:
+                run(config, pool, script_folder)
+            except NotEnoughBotsError:
+                logging.debug('Not enough bots to run a game')
                 time.sleep(10)
-            else:
-                raise
+            except pymssql.OperationalError as e:
+                if 1 <= len(e.args) and e.args[0] == 40613:
+                    logging.debug('Database currently unavailable %s', e)
+                    time.sleep(10)
+                else:
+                    raise
 
 
 if __name__ == '__main__':
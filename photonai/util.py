@@ -48,6 +48,9 @@ class Vector:
 def direction(orientation):
     '''Create a unit direction vector from an orientation "bearing",
     where orientation=0 is defined as +Y (UP), increases clockwise.
+
+    If `orientation` is an array of shape `S`, returns an array of unit
+    vectors, of shape `S + (2,)`.
     '''
-    return np.array([np.sin(orientation), np.cos(orientation)],
-                    dtype=np.float)
+    return np.stack([np.sin(orientation), np.cos(orientation)],
+                    axis=-1).astype(np.float)
@@ -274,35 +274,65 @@ class World:
     `photonai.world.Planet`, `photonai.world.Pellet`} currently surviving
     top-level game objects.
 
+    `ships`, `planets`, `pellets` -- dicts of ID to the objects of each type
+    (subsets of `objects`, in the same order, so `len(world.ships)` is the
+    number of ships remaining).
+
+    N.B. objects should only be created & destroyed via `add` & `remove`,
+    which keep these in sync.
     '''
-    __slots__ = ('clock', 'time', 'space', 'objects')
+    __slots__ = ('clock', 'time', 'space', 'objects',
+                 'ships', 'planets', 'pellets')
 
-    def _handle_event(self, clock, event):
-        id_ = event['id']
-        data = event['data']
+    _TYPES = {Ship: 'ships', Planet: 'planets', Pellet: 'pellets'}
 
+    _CREATE = dict(ship_create=Ship.create,
+                   pellet_create=Pellet.create,
+                   planet_create=Planet.create)
+
+    @staticmethod
+    def _infer_kind(event):
+        '''Infer the kind of an event without an explicit kind (from an old
+        log), by validating the data.
+        '''
+        data = event['data']
         # Validate in order richest-to-emptiest events (safest due to the
         # Avro libraries' duck-typing)
-        if validate(data, schema.Ship.CREATE):
-            assert id_ not in self.objects
-            self.objects[id_] = Ship.create(clock, data)
-        elif validate(data, schema.Pellet.CREATE):
-            assert id_ not in self.objects
-            self.objects[id_] = Pellet.create(clock, data)
-        elif validate(data, schema.Planet.CREATE):
-            assert id_ not in self.objects
-            self.objects[id_] = Planet.create(clock, data)
-
-        elif validate(data, [schema.Planet.STATE,
-                             schema.Ship.STATE,
-                             schema.Pellet.STATE]):
-            self.objects[id_].update(clock, data)
+        for kind, data_schema in [('ship_create', schema.Ship.CREATE),
+                                  ('pellet_create', schema.Pellet.CREATE),
+                                  ('planet_create', schema.Planet.CREATE),
+                                  ('ship_state', schema.Ship.STATE),
+                                  ('pellet_state', schema.Pellet.STATE),
+                                  ('planet_state', schema.Planet.STATE),
+                                  ('destroy', schema.Object.DESTROY)]:
+            if validate(data, data_schema):
+                return kind
+        raise ValueError('Unrecognized event %s' % event)
+
+    def add(self, id_, obj):
+        '''Add a new object to the world.
+        '''
+        assert id_ not in self.objects
+        self.objects[id_] = obj
+        getattr(self, self._TYPES[type(obj)])[id_] = obj
+
+    def remove(self, id_):
+        '''Remove an object from the world.
+        '''
+        obj = self.objects.pop(id_)
+        del getattr(self, self._TYPES[type(obj)])[id_]
 
-        elif validate(data, schema.Object.DESTROY):
-            del self.objects[id_]
+    def _handle_event(self, clock, event):
+        id_ = event['id']
+        data = event['data']
+        kind = event.get('kind') or self._infer_kind(event)
 
+        if kind == 'destroy':
+            self.remove(id_)
+        elif kind in self._CREATE:
+            self.add(id_, self._CREATE[kind](clock, data))
         else:
-            raise ValueError('Unrecognized event %s' % event)
+            self.objects[id_].update(clock, data)
 
     def __str__(self):
         return 'World {\n  space: %s\n  clock: %s\n%s\n}' % (
@@ -311,14 +341,26 @@ class World:
             '\n'.join('  - %s' % v for v in self.objects.values()))
 
     def __call__(self, step):
-        if validate(step['data'], schema.Space.CREATE):
-            # the first event in a stream should hit this branch
+        if hasattr(step['data'], 'update_world'):
+            # native events (e.g. `photonai.engine.Events`) skip the schema
+            step['data'].update_world(self, step['clock'])
+        elif isinstance(step['data'], dict):
+            # the first event in a stream should hit this branch (the only
+            # record in the data union)
             self.space = Space.create(step['clock'], step['data'])
             self.objects = dict()
+            self.ships = dict()
+            self.planets = dict()
+            self.pellets = dict()
             self.time = 0
         else:  # must be a list of events
             for event in step['data']:
-                self._handle_event(step['clock'], event)
+                if hasattr(event, 'update_world'):
+                    # compact records (see `photonai.records`) skip the
+                    # schema
+                    event.update_world(self, step['clock'])
+                else:
+                    self._handle_event(step['clock'], event)
 
         self.clock = step['clock']
         self.time += step['duration']
@@ -9,7 +9,7 @@ setuptools.setup(
     install_requires=[
         # A minimal subset of requirements.txt
         'click',
-        'fastavro',
+        'fastavro==0.14.11',
         'flask',
         'numpy',
         'pymssql',